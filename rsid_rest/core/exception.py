@@ -12,12 +12,26 @@
 from loguru import logger
 from pydantic import ValidationError
 
+from rsid_rest.rsid_lib.device_arbiter import DeviceBusyError
+
 
 async def unhandled_exception_handler(_: Request, exc: HTTPException) -> UJSONResponse:
     return UJSONResponse(
         {"errors": [exc.detail]},
         status_code=exc.status_code,
-        headers={"X-Request-ID": correlation_id.get() or ""},
+        headers={**(exc.headers or {}), "X-Request-ID": correlation_id.get() or ""},
+    )
+
+
+async def device_busy_error_handler(_: Request, exc: DeviceBusyError) -> UJSONResponse:
+    logger.warning(exc)
+    return UJSONResponse(
+        {"errors": [str(exc)]},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={
+            "Retry-After": str(exc.retry_after),
+            "X-Request-ID": correlation_id.get() or "",
+        },
     )
 
 
@@ -0,0 +1,41 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+
+def conditional_response(
+    request: Request, response: Response, etag: str, last_modified: datetime.datetime
+) -> Response | None:
+    """
+    Set `ETag` / `Last-Modified` on `response`. Return a `304 Not Modified` response if the client's
+    `If-None-Match` / `If-Modified-Since` shows its copy is still current, `None` otherwise.
+    """
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        fresh = "*" in tags or etag in tags
+    else:
+        fresh = False
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                fresh = last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                fresh = False
+
+    if not fresh:
+        return None
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={
+            "ETag": response.headers["ETag"],
+            "Last-Modified": response.headers["Last-Modified"],
+        },
+    )
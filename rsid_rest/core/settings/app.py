@@ -17,6 +17,8 @@
 from rsid_rest.core.settings.base import (
     ApplicationDBTypes,
     BaseAppSettings,
+    HostDBBackendTypes,
+    HostDBQuantizationTypes,
     HostModeAuthTypes, StreamEncodingStypes,
 )
 
@@ -40,19 +42,82 @@ class AppSettings(BaseAppSettings, validate_assignment=True):
     auto_detect: bool = True
     com_port: str | None = None
     preview_camera_number: int = -1  # -1 = auto-detect
+    """ Seconds between background rescans for hotplugged cameras when `auto_detect` is on. 0 disables rescans """
+    device_discovery_interval: float = 5.0
+
+    # Device session: keep the FaceAuthenticator connected between requests
+    device_session_persistent: bool = True
+    """ Seconds of inactivity after which the device session is re-opened """
+    device_session_idle_timeout: float = 300.0
+    """ Seconds between health checks of an idle device session """
+    device_session_health_check_interval: float = 30.0
+
+    # Device operation scheduler: max queued operations per priority class (auth > enroll > query > firmware)
+    device_queue_max_depth_auth: int = 16
+    device_queue_max_depth_enroll: int = 4
+    device_queue_max_depth_query: int = 16
+    device_queue_max_depth_firmware: int = 2
+
+    # Device read caches, in seconds. 0 disables caching
+    device_info_cache_ttl: Annotated[float, Field(ge=0)] = 300.0
+    device_config_cache_ttl: Annotated[float, Field(ge=0)] = 30.0
+
+    # Device DB mode: enrolled user ids are kept in memory and reloaded from the device every X seconds. 0 = never
+    device_users_reconcile_interval: Annotated[float, Field(ge=0)] = 300.0
+
+    # Authentication coalescing: concurrent /auth/ requests share a single device capture
+    auth_coalescing: bool = False
+    """ Results of a completed capture are also shared with requests arriving within this window """
+    auth_coalescing_window_ms: Annotated[int, Field(ge=0)] = 0
+
+    # Startup warm-up
+    """ Seconds between retries of the warm-up steps that failed, until the app is ready. 0 disables retries """
+    warm_up_retry_interval: Annotated[float, Field(ge=0)] = 5.0
 
     # DB mode
     db_mode: ApplicationDBTypes = ApplicationDBTypes.device
 
     # DB Host mode configuration
+    """ `qdrant`: Qdrant collection in `db_file` or on `qdrant_url`. `memmap`: gallery files in `db_gallery_dir` """
+    host_db_backend: HostDBBackendTypes = HostDBBackendTypes.qdrant
     db_file: Path | None = "vectors.db"
+    db_gallery_dir: Path = "gallery"
+    """ Qdrant server URL, e.g. `http://localhost:6333`. If not set, Qdrant runs embedded on `db_file` """
+    qdrant_url: str | None = None
+    qdrant_api_key: str | None = None
+    """ Quantized copy of the collection vectors for search: `scalar` (int8) or `binary`. Results are rescored """
+    qdrant_quantization: HostDBQuantizationTypes = HostDBQuantizationTypes.none
+    """ Candidates fetched with the quantized vectors per requested result, before rescoring """
+    qdrant_quantization_oversampling: Annotated[float, Field(ge=1)] = 2.0
+    """ Galleries with fewer points are searched exactly (brute force) instead of through the HNSW index """
+    qdrant_exact_search_threshold: Annotated[int, Field(ge=0)] = 10000
+    """ HNSW `ef` by gallery size: the entry with the largest point count not above the gallery size applies """
+    qdrant_hnsw_ef_curve: dict[int, Annotated[int, Field(ge=1)]] = {0: 128, 100000: 256, 1000000: 512}
+    """ Keep all descriptors in memory for exact cosine top-k search instead of the Qdrant HNSW search """
+    host_mode_gallery_index: bool = False
     host_mode_auth_type: HostModeAuthTypes = HostModeAuthTypes.hybrid
+    """ If set, clearing all users in host mode requires this token as the `confirm` query parameter """
+    host_mode_clear_all_token: str | None = None
+    """ User ids read from the host DB at once when streaming the whole user list """
+    host_mode_users_page_size: Annotated[int, Field(ge=1)] = 1000
+    """ Number of DB faceprints kept prebuilt for the device matcher (LRU). 0 disables the cache """
+    host_mode_faceprints_cache_size: Annotated[int, Field(ge=0)] = 4096
+    """ Adaptive faceprints updates are written in the background. Max users pending, 0 = write before responding """
+    host_mode_update_queue_size: Annotated[int, Field(ge=0)] = 1024
+    """ Seconds between writes of the pending updates """
+    host_mode_update_flush_interval: Annotated[float, Field(gt=0)] = 1.0
+    """ Max updates written in one DB batch. A full batch is written right away """
+    host_mode_update_batch_size: Annotated[int, Field(ge=1)] = 64
 
     # Hybrid mode settings
     """" Maximum number of faceprints to be sent to device after vector db search """
     host_mode_hybrid_max_results: int | None = 10
     """" Vector DB threshold for searching. """
     host_mode_hybrid_score_threshold: float | None = 0.2
+    """ Stop at the first candidate (in vector score order) the matcher accepts with at least this score. None = all """
+    host_mode_hybrid_accept_score: float | None = None
+    """ Larger k searched, in order, while no candidate matches on the device. 0 = whole gallery, e.g. `[50, 0]` """
+    host_mode_hybrid_widening: list[Annotated[int, Field(ge=0)]] = []
 
     # Preview and streaming configuration
     preview_jpeg_quality: Annotated[int, Field(ge=1, le=100)] = 80  # 1 - 100
@@ -19,9 +19,21 @@ class ApplicationDBTypes(Enum):
     host: str = "host"
 
 
+class HostDBBackendTypes(Enum):
+    qdrant: str = "qdrant"
+    memmap: str = "memmap"
+
+
+class HostDBQuantizationTypes(Enum):
+    none: str = "none"
+    scalar: str = "scalar"
+    binary: str = "binary"
+
+
 class HostModeAuthTypes(Enum):
     hybrid: str = "hybrid"
     device: str = "device"
+    vectorized: str = "vectorized"
 
 
 class StreamEncodingStypes(Enum):
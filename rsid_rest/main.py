@@ -2,24 +2,29 @@
 # Copyright (C) 2018-2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
 from asgi_correlation_id import CorrelationIdMiddleware
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+
 # from fastapi.middleware.gzip import GZipMiddleware # TODO
 from fastapi.responses import FileResponse
 
 from rsid_rest.core.config import get_app_settings
-from rsid_rest.core.exception import http422_error_handler, unhandled_exception_handler
+from rsid_rest.core.exception import device_busy_error_handler, http422_error_handler, unhandled_exception_handler
 from rsid_rest.frontend import demo
 from rsid_rest.routers.v1.auth import router as auth_router
 from rsid_rest.routers.v1.device import router as device_router
 from rsid_rest.routers.v1.preview import router as preview_router
 from rsid_rest.routers.v1.users import router as users_router
 from rsid_rest.routers.v1.utility import router as utility_router
+from rsid_rest.rsid_lib.device_arbiter import DeviceBusyError
+from rsid_rest.rsid_lib.models import ReadinessResponse
+from rsid_rest.rsid_lib.rsid_api_wrapper import get_readiness, shutdown_rsid_api, startup_rsid_api
 
 
 @asynccontextmanager
@@ -27,7 +32,15 @@ async def lifespan(
     # pylint: disable=unused-argument
     application: FastAPI,
 ):
+    # Warm up (device discovery and sessions, host DB and gallery, preview encoder) while already accepting
+    # requests. `/ready` reports 503 until it's done.
+    warm_up = asyncio.create_task(startup_rsid_api())
     yield
+    warm_up.cancel()
+    with suppress(asyncio.CancelledError):
+        await warm_up
+    # Release the device sessions and the host DB client
+    await shutdown_rsid_api()
 
 
 def get_application() -> FastAPI:
@@ -56,6 +69,7 @@ def get_application() -> FastAPI:
 
     application.add_exception_handler(HTTPException, unhandled_exception_handler)
     application.add_exception_handler(RequestValidationError, http422_error_handler)
+    application.add_exception_handler(DeviceBusyError, device_busy_error_handler)
 
     application.include_router(router=users_router, prefix=settings.api_v1_prefix)
     application.include_router(router=device_router, prefix=settings.api_v1_prefix)
@@ -76,6 +90,19 @@ def get_application() -> FastAPI:
 #     return Response(content=data, media_type="application/json")
 
 
+@app.get(
+    "/ready",
+    name="app:ready",
+    summary="Readiness probe.",
+    description="`200` once the startup warm-up is done, `503` before that or if a warm-up step failed. "
+                "Lists each warm-up step with its timing.\n\n",
+)
+async def ready(response: Response) -> ReadinessResponse:
+    readiness = get_readiness()
+    response.status_code = status.HTTP_200_OK if readiness.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return readiness
+
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     favicon_path = Path(__file__).resolve().parents[0] / "favicon.ico"
@@ -9,11 +9,12 @@
 
 from rsid_rest.core.config import get_app_settings
 from rsid_rest.core.settings.base import ApplicationDBTypes
+from rsid_rest.rsid_lib.device_arbiter import DeviceBusyError
 from rsid_rest.rsid_lib.gen.models import AuthenticateStatusEnum
 from rsid_rest.rsid_lib.models import (
     AuthenticationResponse,
 )
-from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_device_id, get_rsid_api
 
 router = APIRouter(
     prefix="/auth",
@@ -43,23 +44,30 @@
                 }
             },
         },
+        "503": {
+            "description": "Service Unavailable - too many queued device operations of this kind. "
+                           "Retry after the number of seconds given in the `Retry-After` header.",
+        },
     },
 )
 async def auth(
     response: Response,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> AuthenticationResponse:
     try:
         result: AuthenticationResponse
         if get_app_settings().db_mode == ApplicationDBTypes.device:
-            result = await api_wrapper.auth()
+            result = await api_wrapper.auth(device_id=device_id)
         else:
-            result = await api_wrapper.auth_host()
+            result = await api_wrapper.auth_host(device_id=device_id)
         response.status_code = status.HTTP_200_OK
         if result.status != AuthenticateStatusEnum.Success:
             result.user_id = None  # Ensure we pass null instead of empty string
             response.status_code = status.HTTP_406_NOT_ACCEPTABLE
         return result
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -4,9 +4,11 @@
 
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from loguru import logger
 
+from rsid_rest.core.http_cache import conditional_response
+from rsid_rest.rsid_lib.device_arbiter import DeviceBusyError
 from rsid_rest.rsid_lib.gen.models import StatusEnum
 from rsid_rest.rsid_lib.models import (
     DeviceConfig as DeviceConfigModel,
@@ -14,8 +16,9 @@
 from rsid_rest.rsid_lib.models import (
     DeviceConfigResponse,
     DeviceInfoResponse,
+    DevicesResponse,
 )
-from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_device_id, get_rsid_api
 
 router = APIRouter(
     prefix="/device",
@@ -23,12 +26,29 @@
 )
 
 
+@router.get(
+    "/devices/",
+    name="v1:device:get-devices",
+    summary="List connected devices.",
+    description="Lists every discovered device with its id and utilization. "
+                "Pass the `device_id` to other endpoints to run an operation on a specific device.\n\n",
+)
+def query_devices(
+    response: Response, api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+) -> DevicesResponse:
+    devices = api_wrapper.query_devices()
+    response.status_code = status.HTTP_200_OK
+    return DevicesResponse(devices=devices)
+
+
 @router.get(
     "/device-config/",
     name="v1:device:get-device-config",
     summary="Retrieve device configuration.",
     description="Retrieves device configuration. "
-                "This method allows you to read the current settings of the device.\n\n",
+                "This method allows you to read the current settings of the device.\n\n"
+                "Responses carry `ETag` / `Last-Modified`. Send them back as `If-None-Match` / `If-Modified-Since` "
+                "to get a `304 Not Modified` while the configuration is unchanged.\n\n",
     responses={
         "422": {
             "description": "Unprocessable Entity - exception during reading device configuration. "
@@ -42,13 +62,21 @@
     },
 )
 def query_device_config(
-    response: Response, api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+    request: Request,
+    response: Response,
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> DeviceConfigResponse:
     try:
-        device_config = api_wrapper.query_device_config()
+        entry = api_wrapper.query_device_config_cached(device_id=device_id)
+        not_modified = conditional_response(request, response, entry.etag, entry.last_modified)
+        if not_modified is not None:
+            return not_modified
         response.status_code = status.HTTP_200_OK
 
-        return DeviceConfigResponse(config=device_config, status=StatusEnum.Ok)
+        return DeviceConfigResponse(config=entry.value, status=StatusEnum.Ok)
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -58,7 +86,9 @@ def query_device_config(
     "/device-info/",
     name="v1:device:get-device-info",
     summary="Retrieve device info.",
-    description="Retrieves device info. " "This method allows you to read the current in of the device.\n\n",
+    description="Retrieves device info. " "This method allows you to read the current in of the device.\n\n"
+                "Responses carry `ETag` / `Last-Modified`. Send them back as `If-None-Match` / `If-Modified-Since` "
+                "to get a `304 Not Modified` while the info is unchanged.\n\n",
     responses={
         "422": {
             "description": "Unprocessable Entity - exception during reading device configuration. "
@@ -72,12 +102,20 @@ def query_device_config(
     },
 )
 def query_device_info(
-    response: Response, api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+    request: Request,
+    response: Response,
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> DeviceInfoResponse:
     try:
-        device_info = api_wrapper.query_device_info()
+        entry = api_wrapper.query_device_info_cached(device_id=device_id)
+        not_modified = conditional_response(request, response, entry.etag, entry.last_modified)
+        if not_modified is not None:
+            return not_modified
         response.status_code = status.HTTP_200_OK
-        return device_info
+        return entry.value
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -105,12 +143,15 @@ def update_device_config(
     response: Response,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
     config: Annotated[DeviceConfigModel, "DeviceConfig"],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> DeviceConfigResponse:
     try:
-        device_config: DeviceConfigModel = api_wrapper.update_device_config(config)
+        device_config: DeviceConfigModel = api_wrapper.update_device_config(config, device_id=device_id)
         response.status_code = status.HTTP_200_OK
 
         return DeviceConfigResponse(config=device_config, status=StatusEnum.Ok)
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -9,7 +9,7 @@
 from loguru import logger
 from starlette.responses import StreamingResponse
 
-from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_device_id, get_rsid_api
 
 router = APIRouter(
     prefix="/preview",
@@ -39,6 +39,7 @@
 def stream(
     request: Request,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> StreamingResponse:
     try:
         ticket: uuid.UUID = uuid.uuid4()
@@ -47,7 +48,7 @@ def stream(
         # https://github.com/tiangolo/fastapi/discussions/10104#discussioncomment-6785703
 
         response = StreamingResponse(
-            api_wrapper.stream(ticket),
+            api_wrapper.stream(ticket, device_id=device_id),
             status_code=status.HTTP_206_PARTIAL_CONTENT,
             media_type="multipart/x-mixed-replace;boundary=frame",
         )
@@ -2,6 +2,7 @@
 # Copyright (C) 2018-2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import secrets
 import tempfile
 from pathlib import Path
 from typing import Annotated
@@ -14,21 +15,28 @@
     File,
     HTTPException,
     Query,
+    Request,
     Response,
     UploadFile,
     status,
 )
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
+from starlette.responses import StreamingResponse
 
 from rsid_rest.core.config import get_app_settings
+from rsid_rest.core.http_cache import conditional_response
 from rsid_rest.core.settings.base import ApplicationDBTypes
+from rsid_rest.rsid_lib.device_arbiter import DeviceBusyError
 from rsid_rest.rsid_lib.gen.models import EnrollStatusEnum, StatusEnum
 from rsid_rest.rsid_lib.models import (
+    BulkDeleteRequest,
+    BulkDeleteResponse,
     CommonOperationResponse,
     EnrollResponse,
     UsersQueryResponse,
 )
-from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_device_id, get_rsid_api
 
 router = APIRouter(
     prefix="/users",
@@ -66,25 +74,32 @@
                 }
             },
         },
+        "503": {
+            "description": "Service Unavailable - too many queued device operations of this kind. "
+                           "Retry after the number of seconds given in the `Retry-After` header.",
+        },
     },
 )
 async def enroll(
     response: Response,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
     user_id: Annotated[str, Query(max_length=100, min_length=1)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> EnrollResponse:
     try:
         result: EnrollResponse
         if get_app_settings().db_mode == ApplicationDBTypes.device:
-            result = await api_wrapper.enroll(user_id=user_id)
+            result = await api_wrapper.enroll(user_id=user_id, device_id=device_id)
         else:
-            result = await api_wrapper.enroll_host(user_id=user_id)
+            result = await api_wrapper.enroll_host(user_id=user_id, device_id=device_id)
         response.status_code = status.HTTP_201_CREATED
 
         if result.status != EnrollStatusEnum.Success:
             response.status_code = status.HTTP_406_NOT_ACCEPTABLE
 
         return result
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -120,6 +135,7 @@ async def enroll_image(
     response: Response,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
     user_id: Annotated[str, Query(max_length=100, min_length=1)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
     background_tasks: BackgroundTasks,
     file: Annotated[
         UploadFile,
@@ -156,9 +172,11 @@ async def delete_temp_uploads(uploaded_file: Path | None) -> None:
     try:
         result: EnrollResponse
         if get_app_settings().db_mode == ApplicationDBTypes.device:
-            result = await api_wrapper.enroll_image(user_id=user_id, file_path=temp_path)
+            result = await api_wrapper.enroll_image(user_id=user_id, file_path=temp_path, device_id=device_id)
         else:
-            result = await api_wrapper.enroll_host_image(user_id=user_id, file_path=temp_path)
+            result = await api_wrapper.enroll_host_image(
+                user_id=user_id, file_path=temp_path, device_id=device_id
+            )
         response.status_code = status.HTTP_201_CREATED
 
         if result.status != EnrollStatusEnum.Success:
@@ -168,6 +186,8 @@ async def delete_temp_uploads(uploaded_file: Path | None) -> None:
         background_tasks.add_task(delete_temp_uploads, uploaded_file=temp_path)
 
         return result
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -177,6 +197,11 @@ async def delete_temp_uploads(uploaded_file: Path | None) -> None:
     "/",
     name="v1:users:users",
     summary="Get all users",
+    description="In device mode responses carry `ETag` / `Last-Modified`. Send them back as `If-None-Match` / "
+                "`If-Modified-Since` to get a `304 Not Modified` while the user list is unchanged.\n\n"
+                "With `limit`, users are returned one page at a time: pass the returned `next_cursor` as `cursor` to "
+                "get the next page, `next_cursor` is null on the last page. Without `limit`, host mode streams the "
+                "whole list.\n\n",
     responses={
         "422": {
             "description": "Unprocessable Entity",
@@ -189,34 +214,148 @@ async def delete_temp_uploads(uploaded_file: Path | None) -> None:
     },
 )
 async def query_users(
+    request: Request,
     response: Response,
-    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
+    limit: Annotated[int | None, Query(ge=1, le=10000, description="Max users per page")] = None,
+    cursor: Annotated[str | None, Query(description="`next_cursor` of the previous page")] = None,
+    prefix: Annotated[str | None, Query(max_length=100, description="Only users whose id starts with it")] = None,
 ) -> UsersQueryResponse:
     try:
         users: list[str]
+        next_cursor: str | None = None
         if get_app_settings().db_mode == ApplicationDBTypes.device:
-            users = await api_wrapper.query_users()
+            entry = await api_wrapper.query_users_cached(device_id=device_id)
+            not_modified = conditional_response(request, response, entry.etag, entry.last_modified)
+            if not_modified is not None:
+                return not_modified
+            users = entry.value
+            if limit is not None or cursor is not None or prefix:
+                users, next_cursor = api_wrapper.users_page(users, limit, cursor=cursor, prefix=prefix)
+        elif limit is not None:
+            users, next_cursor = await api_wrapper.query_host_users_page(limit, cursor=cursor, prefix=prefix)
         else:
-            users = await api_wrapper.query_host_users()
+            body = await api_wrapper.stream_host_users(cursor=cursor, prefix=prefix)
+            return StreamingResponse(body, media_type="application/json")
+        response.status_code = status.HTTP_200_OK
+        return UsersQueryResponse(users=users, next_cursor=next_cursor)
+    except DeviceBusyError:
+        raise
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
+
+
+@router.post(
+    "/reconcile/",
+    name="v1:users:reconcile",
+    summary="Reload the user index from the device",
+    description="Device DB mode only. Re-reads the enrolled user ids from the device into the in-memory user index "
+                "that answers user listings and removals.\n\n",
+    responses={
+        "422": {
+            "description": "Unprocessable Entity",
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/HTTPValidationError"},
+                }
+            },
+        }
+    },
+)
+async def reconcile_users(
+    response: Response,
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
+) -> UsersQueryResponse:
+    try:
+        if get_app_settings().db_mode != ApplicationDBTypes.device:
+            raise RuntimeError("Only available in device mode.")
+        users = await api_wrapper.reconcile_users(device_id=device_id)
         response.status_code = status.HTTP_200_OK
         return UsersQueryResponse(users=users)
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
 
 
-@router.delete("/clear-all/", name="v1:users:remove_all_users")
-def remove_all_users(
+@router.delete(
+    "/clear-all/",
+    name="v1:users:remove_all_users",
+    description="Removes all users. In host mode the collection is dropped and recreated, which takes the same "
+                "time regardless of the number of users. If `host_mode_clear_all_token` is set, host mode requires "
+                "it as the `confirm` query parameter.\n\n",
+    responses={
+        "403": {
+            "description": "Forbidden - `confirm` doesn't match the configured `host_mode_clear_all_token`.",
+        },
+    },
+)
+async def remove_all_users(
     response: Response,
-    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
+    confirm: Annotated[str | None, Query(description="Confirmation token for host mode")] = None,
 ) -> CommonOperationResponse:
+    settings = get_app_settings()
+    if settings.db_mode == ApplicationDBTypes.host and settings.host_mode_clear_all_token:
+        if confirm is None or not secrets.compare_digest(confirm, settings.host_mode_clear_all_token):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid confirmation token")
     try:
-        if get_app_settings().db_mode == ApplicationDBTypes.device:
-            api_wrapper.remove_all_users()
+        if settings.db_mode == ApplicationDBTypes.device:
+            await run_in_threadpool(api_wrapper.remove_all_users, device_id=device_id)
         else:
-            raise RuntimeError("Not implemented.")
+            await api_wrapper.remove_all_host_users()
         response.status_code = status.HTTP_200_OK
         return CommonOperationResponse(message="Ok", status=StatusEnum.Ok)
+    except DeviceBusyError:
+        raise
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
+
+
+@router.post(
+    "/bulk-delete/",
+    name="v1:users:bulk-delete",
+    summary="Remove several users at once",
+    description="Removes all `user_ids` in a single device session (device mode) or a single batched delete "
+                "(host mode). Returns a result per user id, plus elapsed time and throughput. `status` is "
+                f"`{StatusEnum.Error}` if any of the users could not be removed.\n\n",
+    responses={
+        "422": {
+            "description": "Unprocessable Entity",
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/HTTPValidationError"},
+                }
+            },
+        },
+        "503": {
+            "description": "Service Unavailable - too many queued device operations of this kind. "
+                           "Retry after the number of seconds given in the `Retry-After` header.",
+        },
+    },
+)
+async def remove_users(
+    response: Response,
+    body: BulkDeleteRequest,
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
+) -> BulkDeleteResponse:
+    try:
+        result: BulkDeleteResponse
+        if get_app_settings().db_mode == ApplicationDBTypes.device:
+            result = await api_wrapper.remove_users(user_ids=body.user_ids, device_id=device_id)
+        else:
+            result = await api_wrapper.remove_host_users(user_ids=body.user_ids)
+        response.status_code = status.HTTP_200_OK
+        return result
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -227,15 +366,18 @@ async def remove_user(
     response: Response,
     user_id: str,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> CommonOperationResponse:
     try:
         if get_app_settings().db_mode == ApplicationDBTypes.device:
-            await api_wrapper.remove_user(user_id=user_id)
+            await api_wrapper.remove_user(user_id=user_id, device_id=device_id)
         else:
             await api_wrapper.remove_host_user(user_id=user_id)
 
         response.status_code = status.HTTP_200_OK
         return CommonOperationResponse(message="Ok", status=StatusEnum.Ok)
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -10,8 +10,9 @@
 from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Response, UploadFile, status
 from loguru import logger
 
-from rsid_rest.rsid_lib.models import FWUpdateStatusReportResponse, UpdateCheckerResponse
-from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+from rsid_rest.rsid_lib.device_arbiter import DeviceBusyError
+from rsid_rest.rsid_lib.models import FWUpdateStatusReportResponse, StatsResponse, UpdateCheckerResponse
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_device_id, get_rsid_api
 
 router = APIRouter(
     prefix="/utility",
@@ -39,17 +40,37 @@
 )
 def query_update_status(
     response: Response,
-    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
 ) -> UpdateCheckerResponse:
     try:
-        update_status = api_wrapper.query_update_status()
+        update_status = api_wrapper.query_update_status(device_id=device_id)
         response.status_code = status.HTTP_200_OK
         return update_status
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
 
 
+@router.get(
+    "/stats/",
+    name="v1:utility:get-stats",
+    summary="Retrieve runtime statistics of devices and request handling.",
+    description="Retrieve runtime statistics such as per-device utilization, session connect/reuse counters "
+                "and scheduler queues. "
+                "\n\n",
+)
+def query_stats(
+    response: Response,
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)]
+) -> StatsResponse:
+    stats = api_wrapper.query_stats()
+    response.status_code = status.HTTP_200_OK
+    return stats
+
+
 async def delete_temp_uploads(uploaded_file: Path | None) -> None:
     if uploaded_file is not None and uploaded_file.exists():
         try:
@@ -80,6 +101,7 @@ async def delete_temp_uploads(uploaded_file: Path | None) -> None:
 async def query_fw_update_status(
     response: Response,
     api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[str | None, Depends(get_device_id)],
     background_tasks: BackgroundTasks,
     file: Annotated[
         UploadFile,
@@ -104,9 +126,11 @@ async def query_fw_update_status(
         await file.close()
 
     try:
-        result = await api_wrapper.query_fw_update_status(file_path=temp_path)
+        result = await api_wrapper.query_fw_update_status(file_path=temp_path, device_id=device_id)
         background_tasks.add_task(delete_temp_uploads, uploaded_file=temp_path)
         return result
+    except DeviceBusyError:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY) from e
@@ -0,0 +1,54 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Hashable
+
+from .models import AuthCoalescingStats, AuthenticationResponse
+
+
+class AuthCoalescer:
+    """
+    Lets authentication requests against the same camera share one device capture.
+
+    Requests arriving while a capture is in flight wait for it instead of queueing their own. Requests arriving
+    up to `window` seconds after a capture completed get its result as well. Every caller receives its own copy
+    of the `AuthenticationResponse`, so routers can adjust it freely.
+
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, window: float):
+        self._window = window
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._completed: dict[Hashable, tuple[float, AuthenticationResponse]] = {}
+        self.stats = AuthCoalescingStats()
+
+    async def run(
+        self, key: Hashable, capture: Callable[[], Awaitable[AuthenticationResponse]]
+    ) -> AuthenticationResponse:
+        completed = self._completed.get(key)
+        if completed is not None and time.monotonic() - completed[0] <= self._window:
+            self.stats.window_hits += 1
+            return completed[1].model_copy(deep=True)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats.captures += 1
+            task = asyncio.ensure_future(capture())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self.stats.joined += 1
+
+        # Shield the shared capture, a disconnecting client must not cancel it for everybody else.
+        result = await asyncio.shield(task)
+        return result.model_copy(deep=True)
+
+    def _on_done(self, key: Hashable, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            self._completed.pop(key, None)
+            return
+        self._completed[key] = (time.monotonic(), task.result())
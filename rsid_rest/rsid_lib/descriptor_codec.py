@@ -0,0 +1,70 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import json
+from typing import Any
+
+import numpy as np
+
+from . import rsid_py
+
+DESCRIPTOR_DTYPE = np.dtype("<i2")
+DESCRIPTOR_FIELDS = (
+    "adaptive_descriptor_nomask",
+    "adaptive_descriptor_withmask",
+    "enroll_descriptor",
+)
+# Deprecated, the SDK doesn't fill it anymore. Not stored when all zeros.
+DEPRECATED_DESCRIPTOR_FIELD = "adaptive_descriptor_withmask"
+
+
+def pack_descriptor(descriptor: list[int]) -> str:
+    """Packed little-endian int16 values, base64 encoded to fit in a JSON payload."""
+    return base64.b64encode(
+        np.asarray(descriptor, dtype=DESCRIPTOR_DTYPE).tobytes()
+    ).decode("ascii")
+
+
+def unpack_descriptor(descriptor: str | list[int]) -> list[int]:
+    # Payloads written before the packed format hold plain lists
+    if isinstance(descriptor, list):
+        return descriptor
+    return np.frombuffer(base64.b64decode(descriptor), dtype=DESCRIPTOR_DTYPE).tolist()
+
+
+def encode_descriptors(faceprints: rsid_py.Faceprints) -> dict[str, str]:
+    encoded = {}
+    for field in DESCRIPTOR_FIELDS:
+        descriptor = getattr(faceprints, field) or []
+        if field == DEPRECATED_DESCRIPTOR_FIELD and not any(descriptor):
+            continue
+        encoded[field] = pack_descriptor(descriptor)
+    return encoded
+
+
+def decode_payload(payload: dict[str, Any]) -> dict[str, Any]:
+    """Payload with the descriptors as lists, as expected by the matcher and the gallery index."""
+    decoded = dict(payload)
+    for field in DESCRIPTOR_FIELDS:
+        if field in decoded:
+            decoded[field] = unpack_descriptor(decoded[field])
+    return decoded
+
+
+def pack_payload(payload: dict[str, Any]) -> dict[str, Any]:
+    """Legacy payload with list descriptors converted to the packed format, for migrating stored galleries."""
+    packed = dict(payload)
+    for field in DESCRIPTOR_FIELDS:
+        descriptor = packed.get(field)
+        if not isinstance(descriptor, list):
+            continue
+        if field == DEPRECATED_DESCRIPTOR_FIELD and not any(descriptor):
+            del packed[field]
+        else:
+            packed[field] = pack_descriptor(descriptor)
+    return packed
+
+
+def payload_size(payload: dict[str, Any]) -> int:
+    return len(json.dumps(payload, separators=(",", ":")).encode())
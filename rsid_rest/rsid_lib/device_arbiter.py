@@ -0,0 +1,215 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import math
+import queue
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, TypeVar
+
+from loguru import logger
+
+from .models import DeviceQueueStats
+
+T = TypeVar("T")
+
+
+class DevicePriority(IntEnum):
+    """Priority classes of device operations. Lower value is served first."""
+
+    auth = 0
+    enroll = 1
+    query = 2
+    firmware = 3
+
+
+class DeviceBusyError(RuntimeError):
+    def __init__(self, priority: DevicePriority, retry_after: int):
+        super().__init__(
+            f"Device queue for '{priority.name}' operations is full. Retry after {retry_after}s."
+        )
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    sequence: int
+    fn: Callable[[], Any] | None = field(compare=False)
+    future: concurrent.futures.Future | None = field(compare=False)
+    enqueued_at: float = field(compare=False, default=0.0)
+
+
+# Sorts after every priority class so that pending operations are served before the worker stops.
+_STOP_PRIORITY = len(DevicePriority)
+
+
+class DeviceArbiter:
+    """
+    Serializes all device operations on a single owner thread.
+
+    Async callers `await run(...)` and yield to the event loop while they wait for their turn, so a long enroll
+    doesn't block unrelated endpoints, the preview stream or the frontend. Sync callers (endpoints that FastAPI
+    already runs in its threadpool) use `call(...)`.
+
+    Waiting operations are served by `DevicePriority` (auth first, firmware reports last) and in arrival order
+    within a class. Each class has a bounded queue; submitting to a full class raises `DeviceBusyError`.
+    """
+
+    def __init__(
+        self,
+        max_depth: dict[DevicePriority, int] | None = None,
+        name: str = "rsid-device",
+    ):
+        self._name = name
+        self._queue: queue.PriorityQueue[_Job] = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._max_depth = max_depth or {}
+        self._stats: dict[DevicePriority, DeviceQueueStats] = {
+            priority: DeviceQueueStats(max_depth=self._max_depth.get(priority))
+            for priority in DevicePriority
+        }
+
+    async def run(
+        self, priority: DevicePriority, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        if self._on_owner_thread():
+            return fn(*args, **kwargs)
+        return await asyncio.wrap_future(self.submit(priority, fn, *args, **kwargs))
+
+    def call(
+        self, priority: DevicePriority, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        if self._on_owner_thread():
+            return fn(*args, **kwargs)
+        return self.submit(priority, fn, *args, **kwargs).result()
+
+    def submit(
+        self, priority: DevicePriority, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> concurrent.futures.Future:
+        self._ensure_started()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            stats = self._stats[priority]
+            max_depth = self._max_depth.get(priority)
+            if max_depth is not None and stats.depth >= max_depth:
+                stats.rejected += 1
+                raise DeviceBusyError(
+                    priority, retry_after=max(1, math.ceil(stats.avg_wait_ms / 1000))
+                )
+            stats.depth += 1
+            stats.submitted += 1
+            self._queue.put(
+                _Job(
+                    priority=priority,
+                    sequence=next(self._sequence),
+                    fn=functools.partial(fn, *args, **kwargs),
+                    future=future,
+                    enqueued_at=time.monotonic(),
+                )
+            )
+        return future
+
+    def depth(self) -> int:
+        with self._lock:
+            return sum(stats.depth for stats in self._stats.values())
+
+    def snapshot(self) -> dict[str, DeviceQueueStats]:
+        with self._lock:
+            return {
+                priority.name: stats.model_copy()
+                for priority, stats in self._stats.items()
+            }
+
+    def shutdown(
+        self, wait: bool = True, final: Callable[[], Any] | None = None
+    ) -> None:
+        """
+        Stop the owner thread once the queued operations were served.
+
+        `final` runs on the owner thread after them. Unlike `call()` it doesn't go through a bounded class queue, so
+        it can't be rejected with `DeviceBusyError`.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(
+                    _Job(
+                        priority=_STOP_PRIORITY,
+                        sequence=next(self._sequence),
+                        fn=final,
+                        future=None,
+                    )
+                )
+                self._thread = None
+        if thread is None:
+            # Nothing ever ran on this arbiter
+            if final is not None:
+                final()
+            return
+        if wait and threading.current_thread() is not thread:
+            thread.join()
+
+    def _on_owner_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._worker, name=self._name, daemon=True
+                )
+                self._thread.start()
+
+    def _worker(self) -> None:
+        # A BaseException (e.g. SystemExit from a device call) fails its own job only. The worker keeps serving the
+        # queue and re-raises it once it stopped, pending callers would wait forever otherwise.
+        fatal: BaseException | None = None
+        while True:
+            job = self._queue.get()
+            if job.priority == _STOP_PRIORITY:
+                if job.fn is not None:
+                    try:
+                        job.fn()
+                    except Exception as e:
+                        logger.error(f"Device arbiter {self._name}: {e}")
+                break
+            priority = DevicePriority(job.priority)
+            wait_ms = (time.monotonic() - job.enqueued_at) * 1000
+            with self._lock:
+                stats = self._stats[priority]
+                stats.depth -= 1
+                # Exponential moving average, reacts to load changes while staying cheap to maintain.
+                stats.avg_wait_ms = (
+                    wait_ms
+                    if stats.served == 0
+                    else 0.9 * stats.avg_wait_ms + 0.1 * wait_ms
+                )
+                stats.max_wait_ms = max(stats.max_wait_ms, wait_ms)
+                stats.served += 1
+            # Skip requests whose caller went away (e.g. HTTP client disconnected) while waiting in the queue.
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(job.fn())
+            except Exception as e:
+                job.future.set_exception(e)
+            except BaseException as e:
+                logger.error(
+                    f"Device arbiter {self._name}: {e!r} raised by a device operation"
+                )
+                job.future.set_exception(e)
+                fatal = fatal or e
+        logger.debug(f"Device arbiter {self._name} stopped")
+        if fatal is not None:
+            raise fatal
@@ -0,0 +1,109 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+from collections.abc import Callable
+
+from loguru import logger
+
+from .models import DeviceDiscoveryStats
+
+
+class DeviceDiscovery:
+    """
+    Caches the result of the serial port scan so that requests don't walk sysfs / the registry.
+
+    A background thread rescans every `interval` seconds to pick up hotplugged cameras. `invalidate()` marks the
+    cache stale (e.g. after a connection error) and the next `ports()` call rescans synchronously.
+    `on_change` is called with the new port list whenever a scan finds a different set of cameras. Changes are
+    applied one at a time and in scan order: the result of a scan that was overtaken by a newer one is dropped.
+    """
+
+    def __init__(
+        self,
+        scan: Callable[[], list[str]],
+        interval: float,
+        on_change: Callable[[list[str]], None],
+    ):
+        self._scan = scan
+        self._interval = interval
+        self._on_change = on_change
+        self._ports: list[str] = []
+        self._stale = True
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._applied_generation = 0
+        self._apply_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.stats = DeviceDiscoveryStats()
+
+    def ports(self) -> list[str]:
+        self._ensure_started()
+        if self._stale:
+            return self.refresh()
+        return self._ports
+
+    def refresh(self) -> list[str]:
+        with self._lock:
+            start = time.perf_counter()
+            ports = self._scan()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stats.scans += 1
+            self.stats.last_scan_ms = elapsed_ms
+            self.stats.total_scan_ms += elapsed_ms
+            self._stale = False
+            changed = ports != self._ports
+            self._ports = ports
+            self._generation += 1
+            generation = self._generation
+        if changed:
+            logger.info(
+                f"Device discovery found {len(ports)} device(s): {ports} ({elapsed_ms:.1f}ms)"
+            )
+            self._apply(generation, ports)
+        return ports
+
+    def _apply(self, generation: int, ports: list[str]) -> None:
+        # Outside of the scan lock, on_change may wait for devices to close.
+        with self._apply_lock:
+            if generation < self._applied_generation:
+                return
+            self._applied_generation = generation
+            self._on_change(ports)
+
+    def invalidate(self) -> None:
+        if not self._stale:
+            logger.debug("Device discovery cache invalidated")
+            self.stats.invalidations += 1
+        self._stale = True
+
+    def snapshot(self) -> DeviceDiscoveryStats:
+        return self.stats.model_copy(
+            update={"ports": list(self._ports), "stale": self._stale}
+        )
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and threading.current_thread() is not thread:
+            thread.join()
+        self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None or self._interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(
+                    target=self._watch, name="rsid-device-discovery", daemon=True
+                )
+                self._thread.start()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Device discovery failed: {e}")
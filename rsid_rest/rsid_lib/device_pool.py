@@ -0,0 +1,192 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+from collections.abc import Callable
+from pathlib import PurePath
+from typing import Any, TypeVar
+
+from loguru import logger
+
+from ..core.config import get_app_settings
+from .device_arbiter import DeviceArbiter, DevicePriority
+from .device_session import DeviceSession
+from .device_user_index import DeviceUserIndex
+from .models import DeviceStats
+
+T = TypeVar("T")
+
+
+def device_id_from_port(port: str) -> str:
+    """`/dev/ttyACM0` -> `ttyACM0`, `COM5` -> `COM5`. Short enough to be passed as a query parameter."""
+    return PurePath(port).name or port
+
+
+class Device:
+    """A single camera: its port, persistent session, operation scheduler and utilization counters."""
+
+    def __init__(
+        self, port: str, on_connection_error: Callable[[], None] | None = None
+    ):
+        settings = get_app_settings()
+        self.device_id = device_id_from_port(port)
+        self.port = port
+        self.session = DeviceSession(
+            port=port,
+            idle_timeout=settings.device_session_idle_timeout,
+            health_check_interval=settings.device_session_health_check_interval,
+            persistent=settings.device_session_persistent,
+            on_connection_error=on_connection_error,
+        )
+        # All work on this device runs on the arbiter's owner thread, never on the event loop.
+        self.arbiter = DeviceArbiter(
+            max_depth={
+                DevicePriority.auth: settings.device_queue_max_depth_auth,
+                DevicePriority.enroll: settings.device_queue_max_depth_enroll,
+                DevicePriority.query: settings.device_queue_max_depth_query,
+                DevicePriority.firmware: settings.device_queue_max_depth_firmware,
+            },
+            name=f"rsid-device-{self.device_id}",
+        )
+        self.users = DeviceUserIndex(
+            reconcile_interval=settings.device_users_reconcile_interval
+        )
+        self._lock = threading.Lock()
+        self._registered_at = time.monotonic()
+        self._in_flight = 0
+        self._operations = 0
+        self._busy_seconds = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def utilization(self) -> float:
+        elapsed = time.monotonic() - self._registered_at
+        return min(1.0, self._busy_seconds / elapsed) if elapsed > 0 else 0.0
+
+    async def run(
+        self, priority: DevicePriority, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        self._begin()
+        try:
+            return await self.arbiter.run(priority, self._timed, fn, *args, **kwargs)
+        finally:
+            self._end()
+
+    def call(
+        self, priority: DevicePriority, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        self._begin()
+        try:
+            return self.arbiter.call(priority, self._timed, fn, *args, **kwargs)
+        finally:
+            self._end()
+
+    def close(self) -> None:
+        # Closes the session after the queued operations, even when the query queue is full.
+        self.arbiter.shutdown(final=self.session.close)
+
+    def snapshot(self) -> DeviceStats:
+        return DeviceStats(
+            device_id=self.device_id,
+            port=self.port,
+            in_flight=self._in_flight,
+            operations=self._operations,
+            busy_seconds=round(self._busy_seconds, 3),
+            utilization=round(self.utilization, 4),
+            session=self.session.snapshot(),
+            queue=self.arbiter.snapshot(),
+            users=self.users.snapshot(),
+        )
+
+    def _timed(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        # Device context
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._busy_seconds += time.perf_counter() - start
+                self._operations += 1
+
+    def _begin(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+
+    def _end(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+
+def close_devices(devices: list[Device]) -> None:
+    # One failing device must not leave the others open
+    for device in devices:
+        try:
+            device.close()
+        except Exception as e:
+            logger.error(f"Failed to close device {device.device_id}: {e}")
+
+
+class DevicePool:
+    """Registry of every discovered camera, keyed by device id."""
+
+    def __init__(self, on_connection_error: Callable[[], None] | None = None):
+        self._devices: dict[str, Device] = {}
+        self._lock = threading.Lock()
+        self._on_connection_error = on_connection_error
+
+    def sync(self, ports: list[str]) -> list[Device]:
+        """
+        Register newly discovered ports and unregister devices whose port went away.
+
+        Returns the unregistered devices. The caller closes them, which waits for their queued operations.
+        """
+        removed: list[Device] = []
+        with self._lock:
+            wanted = {device_id_from_port(port): port for port in ports}
+            for device_id, device in list(self._devices.items()):
+                if wanted.get(device_id) != device.port:
+                    removed.append(self._devices.pop(device_id))
+            for device_id, port in wanted.items():
+                if device_id not in self._devices:
+                    logger.info(f"Registering device {device_id} on {port}")
+                    self._devices[device_id] = Device(
+                        port, on_connection_error=self._on_connection_error
+                    )
+        for device in removed:
+            logger.info(f"Unregistering device {device.device_id} on {device.port}")
+        return removed
+
+    def devices(self) -> list[Device]:
+        with self._lock:
+            return list(self._devices.values())
+
+    def get(self, device_id: str | None = None) -> Device:
+        """Return the device with `device_id`, or the first registered device if no id is given."""
+        with self._lock:
+            if device_id is None:
+                if not self._devices:
+                    raise RuntimeError("No RealSenseID device found")
+                return next(iter(self._devices.values()))
+            if device_id not in self._devices:
+                raise KeyError(f"Unknown device {device_id}")
+            return self._devices[device_id]
+
+    def least_busy(self) -> Device:
+        devices = self.devices()
+        if not devices:
+            raise RuntimeError("No RealSenseID device found")
+        return min(devices, key=lambda d: (d.in_flight, d.utilization))
+
+    def __contains__(self, device_id: str) -> bool:
+        with self._lock:
+            return device_id in self._devices
+
+    def close(self) -> None:
+        with self._lock:
+            devices = list(self._devices.values())
+            self._devices.clear()
+        close_devices(devices)
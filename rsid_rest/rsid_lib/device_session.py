@@ -0,0 +1,151 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from loguru import logger
+
+from . import rsid_py
+from .models import DeviceSessionStats
+
+
+class DeviceSession:
+    """
+    Keeps a single `rsid_py.FaceAuthenticator` connected to a port and hands it out to device operations, so that
+    the serial handshake is paid once instead of on every request.
+
+    The connection is dropped (and transparently re-opened on next use) when an operation raises, when the session
+    has been idle for longer than `idle_timeout` seconds, or when the periodic health check fails.
+    `on_connection_error` is called whenever the connection is dropped because of an error.
+    """
+
+    def __init__(
+        self,
+        port: str | None,
+        idle_timeout: float,
+        health_check_interval: float,
+        persistent: bool = True,
+        on_connection_error: Callable[[], None] | None = None,
+    ):
+        self._port = port
+        self._on_connection_error = on_connection_error
+        self._idle_timeout = idle_timeout
+        self._health_check_interval = health_check_interval
+        self._persistent = persistent
+        self._authenticator: rsid_py.FaceAuthenticator | None = None
+        self._last_used: float = 0.0
+        self._last_checked: float = 0.0
+        self._lock = threading.RLock()
+        self.stats = DeviceSessionStats()
+
+    @property
+    def port(self) -> str | None:
+        return self._port
+
+    @property
+    def connected(self) -> bool:
+        return self._authenticator is not None
+
+    def set_port(self, port: str | None) -> None:
+        with self._lock:
+            if port == self._port:
+                return
+            logger.info(f"Device session port changed from {self._port} to {port}")
+            self._disconnect()
+            self._port = port
+
+    @contextmanager
+    def acquire(self) -> Iterator[rsid_py.FaceAuthenticator]:
+        with self._lock:
+            authenticator = self._ensure_connected()
+            try:
+                yield authenticator
+            except Exception:
+                # Any SDK error may leave the serial connection in an unknown state. Start over on next use.
+                self.stats.errors += 1
+                self._disconnect()
+                self._notify_connection_error()
+                raise
+            finally:
+                self._last_used = time.monotonic()
+                if not self._persistent:
+                    self._disconnect()
+
+    @contextmanager
+    def released(self) -> Iterator[None]:
+        """Temporarily give up the port to SDK objects that open their own connection (DeviceController, FWUpdater)."""
+        with self._lock:
+            self._disconnect()
+            yield
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+    def snapshot(self) -> DeviceSessionStats:
+        return self.stats.model_copy(
+            update={"port": self._port, "connected": self.connected}
+        )
+
+    def _ensure_connected(self) -> rsid_py.FaceAuthenticator:
+        now = time.monotonic()
+        if self._authenticator is not None:
+            if now - self._last_used > self._idle_timeout:
+                logger.debug(
+                    f"Device session on {self._port} idle for {now - self._last_used:.1f}s. Reconnecting."
+                )
+                self.stats.idle_timeouts += 1
+                self._disconnect()
+            elif (
+                now - self._last_checked > self._health_check_interval
+                and not self._health_check()
+            ):
+                self._disconnect()
+                self._notify_connection_error()
+
+        if self._authenticator is not None:
+            self.stats.reuses += 1
+            return self._authenticator
+
+        if self.stats.connects > 0:
+            self.stats.reconnects += 1
+        logger.info(f"Connecting device session on {self._port}")
+        try:
+            self._authenticator = rsid_py.FaceAuthenticator(self._port)
+        except Exception:
+            self.stats.errors += 1
+            self._notify_connection_error()
+            raise
+        self.stats.connects += 1
+        self._last_checked = now
+        return self._authenticator
+
+    def _health_check(self) -> bool:
+        self.stats.health_checks += 1
+        self._last_checked = time.monotonic()
+        try:
+            self._authenticator.query_number_of_users()
+            return True
+        except Exception as e:
+            logger.warning(f"Device session health check failed on {self._port}: {e}")
+            self.stats.health_check_failures += 1
+            return False
+
+    def _notify_connection_error(self) -> None:
+        if self._on_connection_error is not None:
+            self._on_connection_error()
+
+    def _disconnect(self) -> None:
+        if self._authenticator is None:
+            return
+        try:
+            self._authenticator.disconnect()
+        except Exception as e:
+            logger.warning(
+                f"Error while disconnecting device session on {self._port}: {e}"
+            )
+        finally:
+            self._authenticator = None
@@ -0,0 +1,114 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import datetime
+import threading
+import time
+
+from loguru import logger
+
+from .models import DeviceUserIndexStats
+from .ttl_cache import CacheEntry, compute_etag
+
+
+class DeviceUserIndex:
+    """
+    In-memory mirror of the user ids enrolled on one device, so that membership checks and user listings don't need
+    a `query_user_ids()` round trip.
+
+    The index is loaded from the device on first use and kept up to date on enroll / remove. It is reloaded from the
+    device (reconciled) every `reconcile_interval` seconds (0 disables periodic reconciliation), after a failed write,
+    or on demand.
+    """
+
+    def __init__(self, reconcile_interval: float):
+        self._reconcile_interval = reconcile_interval
+        # dict keeps the device's enrollment order for listings
+        self._users: dict[str, None] | None = None
+        self._loaded_at: float = 0.0
+        self._dirty = False
+        self._last_modified = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+        self._lock = threading.Lock()
+        self.stats = DeviceUserIndexStats()
+
+    @property
+    def stale(self) -> bool:
+        if self._users is None or self._dirty:
+            return True
+        return (
+            self._reconcile_interval > 0
+            and time.monotonic() - self._loaded_at > self._reconcile_interval
+        )
+
+    def load(self, user_ids: list[str]) -> None:
+        """Replace the index with the user ids read from the device."""
+        with self._lock:
+            if self._users is not None:
+                drift = len(self._users.keys() ^ set(user_ids))
+                if drift:
+                    logger.warning(
+                        f"Device user index was out of sync with the device by {drift} user(s)"
+                    )
+                    self.stats.drift += drift
+                self.stats.reconciliations += 1
+            if self._users is None or list(self._users) != user_ids:
+                self._touch()
+            self._users = dict.fromkeys(user_ids)
+            self._loaded_at = time.monotonic()
+            self._dirty = False
+
+    def invalidate(self) -> None:
+        # Keep the ids so the next load() can report drift, but reload on next use.
+        self._dirty = True
+
+    def add(self, user_id: str) -> None:
+        with self._lock:
+            if self._users is not None and user_id not in self._users:
+                self._users[user_id] = None
+                self._touch()
+
+    def discard(self, user_id: str) -> None:
+        with self._lock:
+            if self._users is not None and user_id in self._users:
+                del self._users[user_id]
+                self._touch()
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._users:
+                self._touch()
+            self._users = {}
+            self._loaded_at = time.monotonic()
+            self._dirty = False
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            self.stats.hits += 1
+            return self._users is not None and user_id in self._users
+
+    def entry(self) -> CacheEntry[list[str]]:
+        with self._lock:
+            self.stats.hits += 1
+            users = list(self._users or ())
+            return CacheEntry(
+                value=users,
+                etag=compute_etag(users),
+                last_modified=self._last_modified,
+                expires_at=(
+                    self._loaded_at + self._reconcile_interval
+                    if self._reconcile_interval > 0
+                    else float("inf")
+                ),
+            )
+
+    def snapshot(self) -> DeviceUserIndexStats:
+        with self._lock:
+            return self.stats.model_copy(
+                update={
+                    "loaded": self._users is not None,
+                    "users": len(self._users or ()),
+                }
+            )
+
+    def _touch(self) -> None:
+        self._last_modified = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
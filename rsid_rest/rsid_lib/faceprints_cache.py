@@ -0,0 +1,100 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+from . import rsid_py
+from .models import FaceprintsCacheStats
+
+
+def build_faceprints(db_record: dict[str, Any]) -> rsid_py.Faceprints:
+    db_faceprints = rsid_py.Faceprints()
+    db_faceprints.flags = db_record["flags"]
+    db_faceprints.version = db_record["version"]
+    db_faceprints.features_type = db_record["features_type"]
+    db_faceprints.adaptive_descriptor_nomask = db_record["adaptive_descriptor_nomask"]
+    # Not stored when empty (deprecated)
+    if "adaptive_descriptor_withmask" in db_record:
+        db_faceprints.adaptive_descriptor_withmask = db_record[
+            "adaptive_descriptor_withmask"
+        ]
+    db_faceprints.enroll_descriptor = db_record["enroll_descriptor"]
+    return db_faceprints
+
+
+def record_key(db_record: dict[str, Any]) -> Hashable:
+    # Every backend stores a new revision on each write, including the writes of other workers. A lookup that read a
+    # record before it was replaced can't cache the old faceprints under the key of the new record.
+    # Qdrant points written before revisions were stored fall back to the time of their last write.
+    return (
+        db_record["user_id"],
+        db_record.get("revision")
+        or db_record.get("updated_at")
+        or db_record.get("created_at"),
+    )
+
+
+class FaceprintsCache:
+    """
+    Thread-safe LRU cache of `rsid_py.Faceprints` built from host DB payloads, so host mode matching doesn't copy the
+    descriptors of every candidate into a new object on every authentication. `capacity` 0 disables caching.
+
+    The objects are only read by the SDK matcher. Writes through this process must call `invalidate()`.
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._entries: OrderedDict[Hashable, rsid_py.Faceprints] = OrderedDict()
+        self._keys: dict[str, Hashable] = {}
+        self._lock = threading.Lock()
+        self.stats = FaceprintsCacheStats(capacity=capacity)
+
+    def get(self, db_record: dict[str, Any]) -> rsid_py.Faceprints:
+        key = record_key(db_record)
+        with self._lock:
+            faceprints = self._entries.get(key)
+            if faceprints is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return faceprints
+            self.stats.misses += 1
+        faceprints = build_faceprints(db_record)
+        if self._capacity > 0:
+            with self._lock:
+                self._drop(db_record["user_id"])
+                self._entries[key] = faceprints
+                self._keys[db_record["user_id"]] = key
+                while len(self._entries) > self._capacity:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._keys.pop(evicted[0], None)
+                    self.stats.evictions += 1
+        return faceprints
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._drop(user_id)
+            self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self.stats.invalidations += 1
+
+    def snapshot(self) -> FaceprintsCacheStats:
+        with self._lock:
+            lookups = self.stats.hits + self.stats.misses
+            return self.stats.model_copy(
+                update={
+                    "entries": len(self._entries),
+                    "hit_rate": self.stats.hits / lookups if lookups else 0.0,
+                }
+            )
+
+    def _drop(self, user_id: str) -> None:
+        key = self._keys.pop(user_id, None)
+        if key is not None:
+            self._entries.pop(key, None)
@@ -0,0 +1,21 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+from ..core.config import get_app_settings
+from ..core.settings.base import HostDBBackendTypes
+from .host_db_base import HostDBBase
+from .host_db_gallery_index import HostDBGalleryIndex
+from .host_db_local_file import HostDBLocalFile
+from .host_db_memmap import HostDBMemmap
+
+
+def create_host_db() -> HostDBBase:
+    settings = get_app_settings()
+    db: HostDBBase
+    if settings.host_db_backend == HostDBBackendTypes.memmap:
+        db = HostDBMemmap()
+    else:
+        db = HostDBLocalFile()
+    if settings.host_mode_gallery_index:
+        db = HostDBGalleryIndex(db)
+    return db
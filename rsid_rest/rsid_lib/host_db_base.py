@@ -2,16 +2,47 @@
 # Copyright (C) 2018-2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import threading
+import time
 from abc import abstractmethod
 from typing import Any
 
+from loguru import logger
+
 from . import rsid_py
+from .models import HostDBStats
+
+_revision_lock = threading.Lock()
+_last_revision = 0
+
+
+def next_revision() -> int:
+    """
+    Revision stored with every added or updated record, so caches keyed on it never serve faceprints that were
+    replaced. Nanoseconds of the wall clock: increases in this process and follows the writes of other workers.
+    """
+    global _last_revision
+    with _revision_lock:
+        _last_revision = max(time.time_ns(), _last_revision + 1)
+        return _last_revision
 
 
 class HostDBBase:
     def __init__(self, **kwargs: Any):
         pass
 
+    async def open(self) -> None:
+        """Called once at application startup."""
+        pass
+
+    async def close(self) -> None:
+        """Called once at application shutdown."""
+        pass
+
+    def collection_stats(self) -> HostDBStats | None:
+        """Collection statistics maintained in-process, if the backend keeps them."""
+        return None
+
     @abstractmethod
     async def add_faceprints(self, user_id: str, faceprints: rsid_py.Faceprints) -> None:
         ...
@@ -20,22 +51,55 @@ async def add_faceprints(self, user_id: str, faceprints: rsid_py.Faceprints) ->
     async def update_faceprints(self, user_id: str, faceprints: rsid_py.Faceprints) -> None:
         ...
 
+    async def update_many_faceprints(self, updates: dict[str, rsid_py.Faceprints]) -> list[str]:
+        """Apply the updates of several users. Returns the ids that were found and updated."""
+        updated = []
+        for user_id, faceprints in updates.items():
+            try:
+                await self.update_faceprints(user_id, faceprints)
+                updated.append(user_id)
+            except RuntimeError as e:
+                logger.warning(e)
+        return updated
+
     @abstractmethod
     async def get_user_ids(self) -> list[str]:
         ...
 
+    @abstractmethod
+    async def get_user_ids_page(
+        self, limit: int, cursor: str | None = None, prefix: str | None = None
+    ) -> tuple[list[str], str | None]:
+        """Up to `limit` user ids starting with `prefix`, from `cursor` on. Returns the cursor of the next page."""
+        ...
+
     @abstractmethod
     async def get_all_faceprints(self) -> list:
         ...
 
     @abstractmethod
-    async def get_faceprints(self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement) -> list:
+    async def get_faceprints(
+        self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, limit: int | None = None
+    ) -> list:
+        """Vector search candidates, best first. `limit` defaults to `host_mode_hybrid_max_results`."""
+        ...
+
+    @abstractmethod
+    async def get_nearest_faceprints(
+        self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, limit: int
+    ) -> list:
+        """Exact cosine nearest neighbours of `extracted_faceprints` over the whole gallery, best first."""
         ...
 
     @abstractmethod
     async def delete_user(self, user_id: str) -> None:
         ...
 
+    @abstractmethod
+    async def delete_users(self, user_ids: list[str]) -> list[str]:
+        """Delete all `user_ids` in one go. Returns the ids that were found and deleted."""
+        ...
+
     @abstractmethod
     async def delete_all_users(self) -> None:
         ...
@@ -0,0 +1,298 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import heapq
+import time
+from typing import Any
+
+import numpy as np
+from loguru import logger
+
+from ..core.config import get_app_settings
+from . import rsid_py
+from .descriptor_codec import (
+    DEPRECATED_DESCRIPTOR_FIELD,
+    DESCRIPTOR_DTYPE,
+    DESCRIPTOR_FIELDS,
+)
+from .host_db_base import HostDBBase, next_revision
+from .models import GalleryIndexStats, HostDBStats
+
+RSID_NUM_OF_RECOGNITION_FEATURES = 512
+RSID_DESCRIPTOR_SIZE = 515
+METADATA_FIELDS = ("flags", "version", "features_type", "revision")
+
+
+def faceprints_payload(user_id: str, faceprints: rsid_py.Faceprints) -> dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "flags": faceprints.flags,
+        "version": faceprints.version,
+        "features_type": faceprints.features_type,
+        "revision": next_revision(),
+        "adaptive_descriptor_nomask": faceprints.adaptive_descriptor_nomask,
+        "adaptive_descriptor_withmask": faceprints.adaptive_descriptor_withmask,
+        "enroll_descriptor": faceprints.enroll_descriptor,
+    }
+
+
+def normalized(descriptor: list[int]) -> np.ndarray:
+    vector = np.asarray(descriptor[:RSID_NUM_OF_RECOGNITION_FEATURES], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class HostDBGalleryIndex(HostDBBase):
+    """
+    Keeps the `enroll_descriptor` of every user of another host DB in a contiguous, L2-normalized float32 matrix so
+    that `get_faceprints` is an exact cosine top-k (one matrix-vector product) instead of an approximate search.
+
+    The faceprints are kept next to it as int16 arrays, row for row, and turned into payloads only for the returned
+    candidates. Writes go to the wrapped DB first and are then applied to the arrays. Reads are answered from memory.
+    """
+
+    def __init__(self, db: HostDBBase, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._db = db
+        self._matrix = np.zeros((0, RSID_NUM_OF_RECOGNITION_FEATURES), dtype=np.float32)
+        self._descriptors = np.zeros(
+            (0, len(DESCRIPTOR_FIELDS), RSID_DESCRIPTOR_SIZE), dtype=DESCRIPTOR_DTYPE
+        )
+        self._metadata = np.zeros((0, len(METADATA_FIELDS)), dtype=np.int64)
+        self._size = 0
+        self._user_ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self.stats = GalleryIndexStats()
+
+    async def open(self) -> None:
+        await self._db.open()
+        await self.load()
+
+    async def close(self) -> None:
+        await self._db.close()
+
+    async def load(self) -> None:
+        async with self._lock:
+            start = time.perf_counter()
+            payloads = await self._db.get_all_faceprints()
+            self._allocate(max(len(payloads), 1024))
+            self._size = 0
+            self._user_ids = []
+            self._rows = {}
+            for payload in payloads:
+                self._append(payload)
+            self._loaded = True
+            self.stats.load_ms = round((time.perf_counter() - start) * 1000, 3)
+            logger.info(
+                f"Gallery index loaded {self._size} users in {self.stats.load_ms:.1f}ms"
+            )
+
+    async def add_faceprints(
+        self, user_id: str, faceprints: rsid_py.Faceprints
+    ) -> None:
+        await self._db.add_faceprints(user_id, faceprints)
+        async with self._lock:
+            self._append(faceprints_payload(user_id, faceprints))
+
+    async def update_faceprints(
+        self, user_id: str, faceprints: rsid_py.Faceprints
+    ) -> None:
+        await self._db.update_faceprints(user_id, faceprints)
+        async with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                # Deleted while the write was in flight, don't bring it back
+                return
+            self._set_row(row, faceprints_payload(user_id, faceprints))
+
+    async def update_many_faceprints(
+        self, updates: dict[str, rsid_py.Faceprints]
+    ) -> list[str]:
+        updated = await self._db.update_many_faceprints(updates)
+        async with self._lock:
+            for user_id in updated:
+                row = self._rows.get(user_id)
+                if row is None:
+                    # Deleted while the write was in flight, don't bring it back
+                    continue
+                self._set_row(row, faceprints_payload(user_id, updates[user_id]))
+        return updated
+
+    async def get_user_ids(self) -> list[str]:
+        await self._ensure_loaded()
+        return list(self._user_ids)
+
+    async def get_user_ids_page(
+        self, limit: int, cursor: str | None = None, prefix: str | None = None
+    ) -> tuple[list[str], str | None]:
+        # Rows move on delete, page in user id order instead. The cursor is the next user id.
+        await self._ensure_loaded()
+        matches = (
+            user_id
+            for user_id in self._rows
+            if (not prefix or user_id.startswith(prefix))
+            and (cursor is None or user_id >= cursor)
+        )
+        page = heapq.nsmallest(limit + 1, matches)
+        return page[:limit], page[limit] if len(page) > limit else None
+
+    async def get_all_faceprints(self) -> list:
+        await self._ensure_loaded()
+        return [self._payload(row) for row in range(self._size)]
+
+    async def get_faceprints(
+        self,
+        extracted_faceprints: rsid_py.ExtractedFaceprintsElement,
+        limit: int | None = None,
+    ) -> list:
+        settings = get_app_settings()
+        return await self._search(
+            extracted_faceprints,
+            limit if limit is not None else settings.host_mode_hybrid_max_results,
+            settings.host_mode_hybrid_score_threshold,
+        )
+
+    async def get_nearest_faceprints(
+        self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, limit: int
+    ) -> list:
+        return await self._search(extracted_faceprints, limit, None)
+
+    async def _search(
+        self,
+        extracted_faceprints: rsid_py.ExtractedFaceprintsElement,
+        k: int | None,
+        score_threshold: float | None,
+    ) -> list:
+        await self._ensure_loaded()
+        query = normalized(extracted_faceprints.features)
+        async with self._lock:
+            # Matrix-vector product off the event loop. Writers wait on the lock, so rows don't move meanwhile.
+            start = time.perf_counter()
+            rows = await asyncio.to_thread(self._top_k, query, k, score_threshold)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.stats.searches += 1
+            self.stats.total_search_ms += elapsed_ms
+            self.stats.last_search_ms = elapsed_ms
+            return [self._payload(row) for row in rows]
+
+    async def delete_user(self, user_id: str) -> None:
+        await self._db.delete_user(user_id)
+        async with self._lock:
+            self._remove(user_id)
+
+    async def delete_users(self, user_ids: list[str]) -> list[str]:
+        deleted = await self._db.delete_users(user_ids)
+        async with self._lock:
+            for user_id in deleted:
+                self._remove(user_id)
+        return deleted
+
+    async def delete_all_users(self) -> None:
+        await self._db.delete_all_users()
+        async with self._lock:
+            self._size = 0
+            self._user_ids = []
+            self._rows = {}
+
+    def collection_stats(self) -> HostDBStats | None:
+        return self._db.collection_stats()
+
+    def snapshot(self) -> GalleryIndexStats:
+        return self.stats.model_copy(
+            update={"users": self._size, "capacity": len(self._matrix)}
+        )
+
+    async def _ensure_loaded(self) -> None:
+        # Loaded by open() at startup. Load lazily for callers outside of the app.
+        if not self._loaded:
+            await self.load()
+
+    def _top_k(
+        self, query: np.ndarray, k: int | None, score_threshold: float | None
+    ) -> list[int]:
+        scores = self._matrix[: self._size] @ query
+        candidates = (
+            np.flatnonzero(scores >= score_threshold)
+            if score_threshold is not None
+            else np.arange(self._size)
+        )
+        if k is not None and len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        return candidates[np.argsort(scores[candidates])[::-1]].tolist()
+
+    def _allocate(self, capacity: int) -> None:
+        self._matrix = np.zeros(
+            (capacity, RSID_NUM_OF_RECOGNITION_FEATURES), dtype=np.float32
+        )
+        self._descriptors = np.zeros(
+            (capacity, len(DESCRIPTOR_FIELDS), RSID_DESCRIPTOR_SIZE),
+            dtype=DESCRIPTOR_DTYPE,
+        )
+        self._metadata = np.zeros((capacity, len(METADATA_FIELDS)), dtype=np.int64)
+
+    def _grow(self) -> None:
+        matrix, descriptors, metadata = self._matrix, self._descriptors, self._metadata
+        self._allocate(max(2 * len(matrix), 1024))
+        self._matrix[: self._size] = matrix[: self._size]
+        self._descriptors[: self._size] = descriptors[: self._size]
+        self._metadata[: self._size] = metadata[: self._size]
+
+    def _append(self, payload: dict[str, Any]) -> None:
+        user_id = payload["user_id"]
+        row = self._rows.get(user_id)
+        if row is not None:
+            # Enrolled twice by an older version. The wrapped DB updates and deletes the records together, keep one
+            # row so that removing the user leaves none behind.
+            logger.error(
+                f"DB integrity error. More than one record found with this user_id {user_id}!"
+            )
+            self._set_row(row, payload)
+            return
+        if self._size == len(self._matrix):
+            self._grow()
+        self._set_row(self._size, payload)
+        self._user_ids.append(user_id)
+        self._rows[user_id] = self._size
+        self._size += 1
+
+    def _set_row(self, row: int, payload: dict[str, Any]) -> None:
+        self._matrix[row] = normalized(payload["enroll_descriptor"])
+        self._descriptors[row] = 0
+        for i, field in enumerate(DESCRIPTOR_FIELDS):
+            values = np.asarray(
+                (payload.get(field) or [])[:RSID_DESCRIPTOR_SIZE],
+                dtype=DESCRIPTOR_DTYPE,
+            )
+            self._descriptors[row, i, : len(values)] = values
+        # Records written before revisions were stored get one when they are loaded
+        payload = {**payload, "revision": payload.get("revision") or next_revision()}
+        self._metadata[row] = [payload[field] for field in METADATA_FIELDS]
+
+    def _payload(self, row: int) -> dict[str, Any]:
+        payload: dict[str, Any] = {"user_id": self._user_ids[row]}
+        payload.update(zip(METADATA_FIELDS, self._metadata[row].tolist(), strict=True))
+        for i, field in enumerate(DESCRIPTOR_FIELDS):
+            descriptor = self._descriptors[row, i]
+            # Not stored when empty (deprecated)
+            if field == DEPRECATED_DESCRIPTOR_FIELD and not descriptor.any():
+                continue
+            payload[field] = descriptor.tolist()
+        return payload
+
+    def _remove(self, user_id: str) -> None:
+        # Move the last row into the hole so the matrix stays contiguous.
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._descriptors[row] = self._descriptors[last]
+            self._metadata[row] = self._metadata[last]
+            self._user_ids[row] = self._user_ids[last]
+            self._rows[self._user_ids[row]] = row
+        self._user_ids.pop()
+        self._size -= 1
@@ -2,23 +2,34 @@
 # Copyright (C) 2018-2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import datetime
-import multiprocessing
 import sys
 import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any
 
 import numpy as np
 from loguru import logger
-from qdrant_client import QdrantClient, models, AsyncQdrantClient
+from qdrant_client import models, AsyncQdrantClient
 
 from . import rsid_py
 from qdrant_client.conversions import common_types as types
 from qdrant_client.http.models import Distance, PointStruct, VectorParams
 
-from .host_db_base import HostDBBase
+from .descriptor_codec import (
+    DEPRECATED_DESCRIPTOR_FIELD,
+    decode_payload,
+    encode_descriptors,
+    pack_payload,
+    payload_size,
+)
+from .host_db_base import HostDBBase, next_revision
+from .models import HostDBStats
 from ..core.config import get_app_settings
+from ..core.settings.base import HostDBQuantizationTypes
 
 
 def _rfc3339_string():
@@ -26,209 +37,493 @@ def _rfc3339_string():
 
 
 RSID_NUM_OF_RECOGNITION_FEATURES = 512
-DATABASE_LOCK = multiprocessing.Lock()
 
 
-# Qdrant in local mode locks the DB files per client. Let's make every client close the connection
-# after each call for the sample code to work properly. In production, you want a server deployment.
-class AsyncClosableDBSession:
-    def __init__(self, deb_file: str):
-        self._db_file = str(Path(deb_file).resolve())
+def _quantization_config(quantization: HostDBQuantizationTypes) -> models.QuantizationConfig | None:
+    # Quantized vectors are kept in RAM, the original vectors may live on disk and are only read for rescoring.
+    if quantization == HostDBQuantizationTypes.scalar:
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if quantization == HostDBQuantizationTypes.binary:
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def _update_operations(point_id: Any, faceprints: rsid_py.Faceprints) -> list[models.UpdateOperation]:
+    descriptors = encode_descriptors(faceprints)
+    operations: list[models.UpdateOperation] = [
+        models.UpdateVectorsOperation(
+            update_vectors=models.UpdateVectors(
+                points=[
+                    models.PointVectors(
+                        id=point_id,
+                        vector=faceprints.enroll_descriptor[:RSID_NUM_OF_RECOGNITION_FEATURES],
+                    )
+                ]
+            )
+        ),
+        # Don't use overwrite_payload to maintain `created_at`
+        models.SetPayloadOperation(
+            set_payload=models.SetPayload(
+                payload={
+                    "flags": faceprints.flags,
+                    "version": faceprints.version,
+                    "features_type": faceprints.features_type,
+                    **descriptors,
+                    "revision": next_revision(),
+                    "updated_at": _rfc3339_string()
+                },
+                points=[point_id],
+            )
+        ),
+    ]
+    if DEPRECATED_DESCRIPTOR_FIELD not in descriptors:
+        operations.append(
+            models.DeletePayloadOperation(
+                delete_payload=models.DeletePayload(keys=[DEPRECATED_DESCRIPTOR_FIELD], points=[point_id])
+            )
+        )
+    return operations
 
-    async def __aenter__(self):
-        DATABASE_LOCK.acquire()
-        self.client = AsyncQdrantClient(path=self._db_file, force_disable_check_same_thread=True)
-        return self.client
 
-    async def __aexit__(self, exc_type, exc_value, exc_tb):
-        await self.client.close()
-        DATABASE_LOCK.release()
+def _add_point_ids(point_ids: dict[str, list[Any]], records: list[types.Record]) -> None:
+    for record in records:
+        user_id = record.payload["user_id"]
+        if user_id in point_ids:
+            # Enrolled twice by an older version. Updates and deletes apply to every record of the user.
+            logger.error(f"DB integrity error. More than one record found with this user_id {user_id}!")
+        point_ids.setdefault(user_id, []).append(record.id)
 
 
 class HostDBLocalFile(HostDBBase):
-    client: QdrantClient | None
+    """
+    Qdrant backed host DB. A single `AsyncQdrantClient` is opened at application startup and reused by every call.
+
+    With `qdrant_url` set, the client connects to a Qdrant server. Otherwise Qdrant runs embedded on `db_file`; local
+    mode locks the DB files, so only one process (one server worker) can use it at a time.
+
+    The point ids of every user are kept in memory, so updates and deletes address the points directly instead of
+    scrolling the collection for the `user_id`. Adding a user that already exists is rejected. Duplicates left by
+    older versions are updated and deleted together. On a server, `user_id` also gets a keyword payload index, which
+    backs the lookups of ids that other workers enrolled and the filtered scrolls of bulk operations.
+    """
 
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
-        self.db_file = str(get_app_settings().db_file)
+        db_file = get_app_settings().db_file
+        self.db_file = str(Path(db_file).resolve()) if db_file else None
         self.collections_name: str = "RealsenseID_FacePrints"
-        client: QdrantClient | None = None
-        try:
-            client = QdrantClient(path=self.db_file)
-            client.create_collection(
-                collection_name=self.collections_name,
-                vectors_config=VectorParams(size=RSID_NUM_OF_RECOGNITION_FEATURES, distance=Distance.COSINE),
-            )
-        except ValueError:
-            pass
-        # In server deployment, you want to enable indexing:
-        # try:
-        #    client.create_payload_index(
-        #        collection_name=self.collections_name,
-        #        field_name="user_id",
-        #        field_schema="keyword",
-        #    )
-        # except Exception:
-        #    pass
-        if client is not None:
-            client.close()
-
-    # Production notes: client should use a server and should be a member variable (self.client) so that
-    # it can be reused.
+        self.vectors_config = VectorParams(size=RSID_NUM_OF_RECOGNITION_FEATURES, distance=Distance.COSINE)
+        self.quantization_config = _quantization_config(get_app_settings().qdrant_quantization)
+        self._client: AsyncQdrantClient | None = None
+        self._client_lock = asyncio.Lock()
+        self._point_ids: dict[str, list[Any]] = {}
+        self.stats = HostDBStats()
+        self._search_params: tuple[int, models.SearchParams] | None = None
 
-    async def add_faceprints(self, user_id: str, faceprints: rsid_py.Faceprints) -> None:
-        async with AsyncClosableDBSession(self.db_file) as client:
+    async def open(self) -> None:
+        async with self._client_lock:
+            if self._client is not None:
+                return
+            settings = get_app_settings()
+            client: AsyncQdrantClient
+            if settings.qdrant_url:
+                logger.info(f"Connecting to Qdrant server at {settings.qdrant_url}")
+                client = AsyncQdrantClient(url=settings.qdrant_url, api_key=settings.qdrant_api_key)
+            else:
+                logger.info(f"Opening local Qdrant DB at {self.db_file}")
+                client = AsyncQdrantClient(path=self.db_file, force_disable_check_same_thread=True)
+            if not await client.collection_exists(collection_name=self.collections_name):
+                await client.create_collection(
+                    collection_name=self.collections_name,
+                    vectors_config=self.vectors_config,
+                    quantization_config=self.quantization_config,
+                )
+            else:
+                await self._sync_quantization(client)
+            if settings.qdrant_url:
+                # Embedded Qdrant ignores payload indexes
+                await self._create_user_id_index(client)
+            self._point_ids = await self._load_point_ids(client)
+            # The only point count read from Qdrant. Afterwards it's maintained by this process' own writes.
             collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(f"Before: Collection: {self.collections_name} - {collection_info.points_count} records.")
+            self.stats.points = collection_info.points_count or 0
+            self._client = client
+
+    async def close(self) -> None:
+        async with self._client_lock:
+            if self._client is None:
+                return
+            await self._client.close()
+            self._client = None
+            self._point_ids = {}
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncQdrantClient]:
+        # Opened by the app lifespan. Open lazily for callers outside of the app (scripts, the demo).
+        if self._client is None:
+            await self.open()
+        yield self._client
+
+    async def add_faceprints(self, user_id: str, faceprints: rsid_py.Faceprints) -> None:
+        async with self._session() as client:
+            if await self._find_point_ids(client, [user_id]):
+                raise RuntimeError(f"A record already exists with this user_id {user_id}!")
+            logger.info(f"Before: Collection: {self.collections_name} - {self.stats.points} records.")
 
             vector = faceprints.enroll_descriptor[:RSID_NUM_OF_RECOGNITION_FEATURES]
+            point_id = str(uuid.uuid4())
             await client.upsert(
                 collection_name=self.collections_name,
                 wait=True,
                 points=[
                     PointStruct(
-                        id=str(uuid.uuid4()),
+                        id=point_id,
                         vector=vector,
                         payload={
                             "user_id": user_id,
                             "flags": faceprints.flags,
                             "version": faceprints.version,
                             "features_type": faceprints.features_type,
-                            "adaptive_descriptor_nomask": faceprints.adaptive_descriptor_nomask,
-                            "adaptive_descriptor_withmask": faceprints.adaptive_descriptor_withmask,
-                            "enroll_descriptor": faceprints.enroll_descriptor,
+                            **encode_descriptors(faceprints),
+                            "revision": next_revision(),
                             "created_at": _rfc3339_string()
                         },
                     )
                 ],
             )
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(f"After: Collection: {self.collections_name} - {collection_info.points_count} records.")
+            self._point_ids[user_id] = [point_id]
+            self.stats.points += 1
+            self.stats.adds += 1
+            logger.info(f"After: Collection: {self.collections_name} - {self.stats.points} records.")
 
     async def update_faceprints(self, user_id: str, faceprints: rsid_py.Faceprints) -> None:
-        async with AsyncClosableDBSession(self.db_file) as client:
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(
-                f"update_faceprints: > Collection: {self.collections_name} - {collection_info.points_count} records."
-            )
-
-            records = await self._validate_single_user(client, user_id)
-            point_id = records[0].id
+        async with self._session() as client:
+            logger.info(f"update_faceprints: > Collection: {self.collections_name} - {self.stats.points} records.")
 
-            vector = faceprints.enroll_descriptor[:RSID_NUM_OF_RECOGNITION_FEATURES]
+            operations = []
+            for point_id in await self._user_point_ids(client, user_id):
+                operations.extend(_update_operations(point_id, faceprints))
             await client.batch_update_points(
                 collection_name=self.collections_name,
                 wait=True,
-                update_operations=[
-                    models.UpdateVectorsOperation(
-                        update_vectors=models.UpdateVectors(
-                            points=[
-                                models.PointVectors(
-                                    id=point_id,
-                                    vector=vector,
-                                )
-                            ]
-                        )
-                    ),
-                    # Don't use overwrite_payload to maintain `created_at`
-                    models.SetPayloadOperation(
-                        set_payload=models.SetPayload(
-                            payload={
-                                "flags": faceprints.flags,
-                                "version": faceprints.version,
-                                "features_type": faceprints.features_type,
-                                "adaptive_descriptor_nomask": faceprints.adaptive_descriptor_nomask,
-                                "adaptive_descriptor_withmask": faceprints.adaptive_descriptor_withmask,
-                                "enroll_descriptor": faceprints.enroll_descriptor,
-                                "updated_at": _rfc3339_string()
-                            },
-                            points=[point_id],
-                        )
-                    ),
-                ],
-            )
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(
-                f"update_faceprints: < Collection: {self.collections_name} - {collection_info.points_count} records."
+                update_operations=operations,
             )
+            self.stats.updates += 1
+            logger.info(f"update_faceprints: < Collection: {self.collections_name} - {self.stats.points} records.")
+
+    async def update_many_faceprints(self, updates: dict[str, rsid_py.Faceprints]) -> list[str]:
+        if not updates:
+            return []
+        async with self._session() as client:
+            # One batch for all points instead of a round trip per user
+            point_ids = await self._point_ids_of(client, list(updates))
+            operations = []
+            for user_id, user_point_ids in point_ids.items():
+                for point_id in user_point_ids:
+                    operations.extend(_update_operations(point_id, updates[user_id]))
+            if operations:
+                await client.batch_update_points(
+                    collection_name=self.collections_name,
+                    wait=True,
+                    update_operations=operations,
+                )
+        self.stats.updates += len(point_ids)
+        return [user_id for user_id in updates if user_id in point_ids]
 
     async def get_user_ids(self) -> list[str]:
         records: list[types.Record]
-        async with AsyncClosableDBSession(self.db_file) as client:
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(f"Collection: {self.collections_name} - {collection_info.points_count} records.")
-            records, _ = await client.scroll(limit=sys.maxsize, collection_name=self.collections_name)
+        async with self._session() as client:
+            logger.info(f"Collection: {self.collections_name} - {self.stats.points} records.")
+            records, _ = await client.scroll(
+                limit=sys.maxsize, collection_name=self.collections_name, with_payload=["user_id"], with_vectors=False
+            )
         users = []
         for record in records:
             users.append(record.payload["user_id"])
         return users
 
+    async def get_user_ids_page(
+        self, limit: int, cursor: str | None = None, prefix: str | None = None
+    ) -> tuple[list[str], str | None]:
+        # The cursor is the point id of the next user. Qdrant can't filter keywords by prefix, filter while scrolling.
+        users: list[str] = []
+        offset: Any = cursor
+        async with self._session() as client:
+            while True:
+                records, next_offset = await client.scroll(
+                    collection_name=self.collections_name,
+                    limit=limit,
+                    offset=offset,
+                    with_payload=["user_id"],
+                    with_vectors=False,
+                )
+                for record in records:
+                    user_id = record.payload["user_id"]
+                    if prefix and not user_id.startswith(prefix):
+                        continue
+                    if len(users) == limit:
+                        return users, str(record.id)
+                    users.append(user_id)
+                if next_offset is None:
+                    return users, None
+                offset = next_offset
+
     async def get_all_faceprints(self) -> list:
         records: list[types.Record]
-        async with AsyncClosableDBSession(self.db_file) as client:
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(f"Collection: {self.collections_name} - {collection_info.points_count} records.")
+        async with self._session() as client:
+            logger.info(f"Collection: {self.collections_name} - {self.stats.points} records.")
             records, _ = await client.scroll(limit=sys.maxsize, collection_name=self.collections_name)
         result = []
         for record in records:
-            result.append(record.payload)
+            result.append(decode_payload(record.payload))
         return result
 
-    async def get_faceprints(self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement) -> list:
+    async def get_faceprints(
+        self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, limit: int | None = None
+    ) -> list:
         records: list[types.ScoredPoint]
-        async with AsyncClosableDBSession(self.db_file) as client:
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(f"Collection: {self.collections_name} - {collection_info.points_count} records.")
+        if limit is None:
+            limit = get_app_settings().host_mode_hybrid_max_results
+        async with self._session() as client:
+            logger.info(f"Collection: {self.collections_name} - {self.stats.points} records.")
             vector = extracted_faceprints.features[:RSID_NUM_OF_RECOGNITION_FEATURES]
             vector = np.array(vector, dtype=float)
             records = await client.search(
                 collection_name=self.collections_name,
-                search_params=models.SearchParams(hnsw_ef=128, exact=False),
+                search_params=self._hybrid_search_params(limit),
                 query_vector=vector,
-                limit=get_app_settings().host_mode_hybrid_max_results,
+                limit=limit,
                 score_threshold=get_app_settings().host_mode_hybrid_score_threshold,
             )
+            self.stats.searches += 1
         result = []
         for record in records:
-            result.append(record.payload)
+            result.append(decode_payload(record.payload))
         return result
 
+    async def get_nearest_faceprints(
+        self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, limit: int
+    ) -> list:
+        records: list[types.ScoredPoint]
+        async with self._session() as client:
+            vector = extracted_faceprints.features[:RSID_NUM_OF_RECOGNITION_FEATURES]
+            vector = np.array(vector, dtype=float)
+            # Brute force over all points, no score threshold
+            records = await client.search(
+                collection_name=self.collections_name,
+                search_params=models.SearchParams(
+                    exact=True, quantization=models.QuantizationSearchParams(ignore=True)
+                ),
+                query_vector=vector,
+                limit=limit,
+            )
+            self.stats.searches += 1
+        return [decode_payload(record.payload) for record in records]
+
     async def delete_user(self, user_id: str) -> None:
-        async with AsyncClosableDBSession(self.db_file) as client:
-            records = await self._validate_single_user(client, user_id)
-            point_id = records[0].id
+        async with self._session() as client:
+            point_ids = await self._user_point_ids(client, user_id)
             await client.delete(
                 collection_name=self.collections_name,
-                points_selector=[point_id],
+                points_selector=point_ids,
                 wait=True,
             )
-            collection_info = await client.get_collection(collection_name=self.collections_name)
-            logger.info(f"Collection: {self.collections_name} - {collection_info.points_count} records.")
+            self._point_ids.pop(user_id, None)
+            self.stats.points -= len(point_ids)
+            self.stats.deletes += 1
+            logger.info(f"Collection: {self.collections_name} - {self.stats.points} records.")
+
+    async def delete_users(self, user_ids: list[str]) -> list[str]:
+        async with self._session() as client:
+            point_ids = await self._point_ids_of(client, user_ids)
+            selected = [point_id for user_point_ids in point_ids.values() for point_id in user_point_ids]
+            if selected:
+                await client.delete(
+                    collection_name=self.collections_name,
+                    points_selector=selected,
+                    wait=True,
+                )
+            for user_id in point_ids:
+                self._point_ids.pop(user_id, None)
+            self.stats.points -= len(selected)
+            self.stats.deletes += len(point_ids)
+            logger.info(f"Collection: {self.collections_name} - {self.stats.points} records.")
+        return [user_id for user_id in user_ids if user_id in point_ids]
+
+    async def migrate_payloads(self, batch_size: int = 256) -> tuple[int, int, int, int]:
+        """
+        Convert payloads with descriptors stored as JSON integer lists to the packed format, in place.
+
+        Returns the number of points, the number of migrated points and the payload bytes before and after.
+        """
+        points = migrated = bytes_before = bytes_after = 0
+        offset: Any = None
+        async with self._session() as client:
+            while True:
+                records, offset = await client.scroll(
+                    collection_name=self.collections_name, limit=batch_size, offset=offset, with_vectors=False
+                )
+                operations = []
+                for record in records:
+                    packed = pack_payload(record.payload)
+                    points += 1
+                    bytes_before += payload_size(record.payload)
+                    bytes_after += payload_size(packed)
+                    if packed != record.payload:
+                        migrated += 1
+                        operations.append(
+                            models.OverwritePayloadOperation(
+                                overwrite_payload=models.SetPayload(payload=packed, points=[record.id])
+                            )
+                        )
+                if operations:
+                    await client.batch_update_points(
+                        collection_name=self.collections_name, wait=True, update_operations=operations
+                    )
+                if offset is None:
+                    break
+        return points, migrated, bytes_before, bytes_after
+
+    def collection_stats(self) -> HostDBStats:
+        return self.stats.model_copy()
+
+    async def _user_point_ids(self, client: AsyncQdrantClient, user_id: str) -> list[Any]:
+        point_ids = (await self._find_point_ids(client, [user_id])).get(user_id)
+        if not point_ids:
+            raise RuntimeError(f"No records were found with this user_id {user_id}!")
+        return point_ids
+
+    async def _point_ids_of(self, client: AsyncQdrantClient, user_ids: list[str]) -> dict[str, list[Any]]:
+        point_ids = await self._find_point_ids(client, user_ids)
+        for user_id in dict.fromkeys(user_ids):
+            if user_id not in point_ids:
+                logger.warning(f"No records were found with this user_id {user_id}!")
+        return point_ids
 
-    async def _validate_single_user(self, client, user_id):
+    async def _find_point_ids(self, client: AsyncQdrantClient, user_ids: list[str]) -> dict[str, list[Any]]:
+        # Embedded Qdrant is only opened by this process, the map is authoritative and a user missing from it doesn't
+        # exist. On a shared server other workers may have deleted or re-enrolled users: the cached ids are checked
+        # with one retrieve and the other users are looked up with one filtered scroll. Users that aren't found are
+        # left out.
+        point_ids = {
+            user_id: self._point_ids[user_id] for user_id in dict.fromkeys(user_ids) if user_id in self._point_ids
+        }
+        if get_app_settings().qdrant_url:
+            if point_ids:
+                records = await client.retrieve(
+                    collection_name=self.collections_name,
+                    ids=[point_id for user_point_ids in point_ids.values() for point_id in user_point_ids],
+                    with_payload=["user_id"],
+                    with_vectors=False,
+                )
+                current = {record.id: record.payload.get("user_id") for record in records}
+                for user_id, user_point_ids in list(point_ids.items()):
+                    if any(current.get(point_id) != user_id for point_id in user_point_ids):
+                        del point_ids[user_id]
+                        self._point_ids.pop(user_id, None)
+            missing = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in point_ids]
+            if missing:
+                found = await self._scroll_point_ids(client, missing)
+                self._point_ids.update(found)
+                point_ids.update(found)
+        return point_ids
+
+    async def _scroll_point_ids(self, client: AsyncQdrantClient, user_ids: list[str]) -> dict[str, list[Any]]:
+        point_ids: dict[str, list[Any]] = {}
+        offset: Any = None
+        while True:
+            records, offset = await client.scroll(
+                collection_name=self.collections_name,
+                scroll_filter=models.Filter(
+                    must=[models.FieldCondition(key="user_id", match=models.MatchAny(any=user_ids))]
+                ),
+                limit=len(user_ids),
+                offset=offset,
+                with_payload=["user_id"],
+                with_vectors=False,
+            )
+            _add_point_ids(point_ids, records)
+            if offset is None:
+                return point_ids
+
+    async def _load_point_ids(self, client: AsyncQdrantClient) -> dict[str, list[Any]]:
         records, _ = await client.scroll(
+            collection_name=self.collections_name, limit=sys.maxsize, with_payload=["user_id"], with_vectors=False
+        )
+        point_ids: dict[str, list[Any]] = {}
+        _add_point_ids(point_ids, records)
+        return point_ids
+
+    async def _sync_quantization(self, client: AsyncQdrantClient) -> None:
+        # Apply a changed `qdrant_quantization` to an existing collection. The server re-quantizes in the background.
+        collection_info = await client.get_collection(collection_name=self.collections_name)
+        current = collection_info.config.quantization_config
+        if current == self.quantization_config:
+            return
+        logger.info(f"Changing quantization of {self.collections_name} from {current} to {self.quantization_config}")
+        await client.update_collection(
             collection_name=self.collections_name,
-            scroll_filter=models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="user_id",
-                        match=models.MatchValue(
-                            value=user_id,
-                        ),
-                    )
-                ]
-            ),
-            limit=2,
+            quantization_config=self.quantization_config or models.Disabled.DISABLED,
+        )
+
+    def _hybrid_search_params(self, limit: int | None) -> models.SearchParams:
+        search_params = self._search_strategy()
+        if search_params.hnsw_ef is not None and limit is not None and limit > search_params.hnsw_ef:
+            # HNSW can't return more results than `ef` candidates
+            return search_params.model_copy(update={"hnsw_ef": limit})
+        return search_params
+
+    def _search_strategy(self) -> models.SearchParams:
+        # Depends on the gallery size only, recomputed when the number of points changes.
+        if self._search_params is not None and self._search_params[0] == self.stats.points:
+            return self._search_params[1]
+        settings = get_app_settings()
+        if self.stats.points < settings.qdrant_exact_search_threshold:
+            # Exact search scores every point, skip the quantized vectors like get_nearest_faceprints()
+            search_params = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+        else:
+            curve = settings.qdrant_hnsw_ef_curve
+            applicable = [points for points in curve if points <= self.stats.points]
+            ef = curve[max(applicable)] if applicable else 128
+            search_params = models.SearchParams(hnsw_ef=ef, exact=False, quantization=self._quantization_params())
+        if self._search_params is None or self._search_params[1] != search_params:
+            logger.info(f"Search strategy for {self.stats.points} points: {search_params}")
+        self._search_params = (self.stats.points, search_params)
+        return search_params
+
+    def _quantization_params(self) -> models.QuantizationSearchParams | None:
+        if self.quantization_config is None:
+            return None
+        # Fetch more candidates with the quantized vectors, then rescore them with the original vectors.
+        return models.QuantizationSearchParams(
+            rescore=True, oversampling=get_app_settings().qdrant_quantization_oversampling
+        )
+
+    async def _create_user_id_index(self, client: AsyncQdrantClient) -> None:
+        collection_info = await client.get_collection(collection_name=self.collections_name)
+        if "user_id" in (collection_info.payload_schema or {}):
+            return
+        logger.info(f"Creating the user_id payload index of {self.collections_name}")
+        await client.create_payload_index(
+            collection_name=self.collections_name,
+            field_name="user_id",
+            field_schema=models.PayloadSchemaType.KEYWORD,
+            wait=True,
         )
-        if len(records) > 1:
-            logger.error(records)
-            raise RuntimeError(f"DB integrity error. More than one record found with this user_id {user_id}!")
-        if len(records) == 0:
-            logger.error(records)
-            raise RuntimeError(f"No records were found with this user_id {user_id}!")
-        return records
 
     async def delete_all_users(self) -> None:
-        # TODO: Implement
-        # delete_collection
-        raise RuntimeError("Not implemented in host mode")
+        # Dropping the collection doesn't depend on the number of points, unlike deleting them.
+        async with self._session() as client:
+            logger.info(f"Dropping collection: {self.collections_name} - {self.stats.points} records.")
+            await client.delete_collection(collection_name=self.collections_name)
+            await client.create_collection(
+                collection_name=self.collections_name,
+                vectors_config=self.vectors_config,
+                quantization_config=self.quantization_config,
+            )
+            if get_app_settings().qdrant_url:
+                await self._create_user_id_index(client)
+            self._point_ids = {}
+            self.stats.points = 0
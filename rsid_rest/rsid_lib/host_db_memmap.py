@@ -0,0 +1,375 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from loguru import logger
+
+from ..core.config import get_app_settings
+from . import rsid_py
+from .host_db_base import HostDBBase, next_revision
+
+RSID_NUM_OF_RECOGNITION_FEATURES = 512
+RSID_DESCRIPTOR_SIZE = 515
+# adaptive_descriptor_nomask, adaptive_descriptor_withmask, enroll_descriptor
+DESCRIPTORS_PER_RECORD = 3
+ENROLL_DESCRIPTOR = 2
+DESCRIPTOR_DTYPE = np.dtype("<i2")
+DESCRIPTOR_STRIDE = (
+    DESCRIPTORS_PER_RECORD * RSID_DESCRIPTOR_SIZE * DESCRIPTOR_DTYPE.itemsize
+)
+# user_id is at most 100 characters, 400 bytes in utf-8
+RECORD_DTYPE = np.dtype(
+    [
+        ("user_id", "S400"),
+        ("version", "<i4"),
+        ("flags", "<i4"),
+        ("features_type", "<i4"),
+        ("revision", "<i8"),
+        ("deleted", "u1"),
+    ]
+)
+SEARCH_CHUNK_ROWS = 16384
+
+
+class HostDBMemmap(HostDBBase):
+    """
+    Gallery stored in two fixed-stride files in `db_gallery_dir`, read through `np.memmap`:
+
+    - `descriptors.i16`: per record, the three 515 x int16 descriptors.
+    - `records.bin`: per record, `RECORD_DTYPE` (user_id, version, flags, features_type, revision, deleted).
+
+    Opening the gallery maps the files without reading them, and the pages are shared with every process that maps
+    the same files. Writes only append records; updates append the new faceprints and tombstone the previous record,
+    deletes set the tombstone. Tombstoned records stay until `compact()` is run (`poe compact_gallery`). Files are
+    never shrunk in place, other processes may still map them: `delete_all_users()` and `compact()` write new files
+    and rename them over the old ones, and every process remaps once it sees a different file.
+
+    Writes are serialized within a process only. Run a single server worker for enrollments or use the Qdrant backend
+    for deployments with several writers.
+    """
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.directory = Path(get_app_settings().db_gallery_dir).resolve()
+        self._descriptors_path = self.directory / "descriptors.i16"
+        self._records_path = self.directory / "records.bin"
+        self._descriptors = np.zeros(
+            (0, DESCRIPTORS_PER_RECORD, RSID_DESCRIPTOR_SIZE), dtype=DESCRIPTOR_DTYPE
+        )
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+        self._files: tuple[os.stat_result, os.stat_result] | None = None
+        self._opened = False
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> None:
+        async with self._lock:
+            if self._opened:
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._descriptors_path.touch(exist_ok=True)
+            self._records_path.touch(exist_ok=True)
+            self._repair()
+            self._map()
+            self._opened = True
+            # Counting live users would read every page of records.bin
+            logger.info(
+                f"Mapped gallery {self.directory}: {len(self._records)} records"
+            )
+
+    async def close(self) -> None:
+        async with self._lock:
+            self._unmap()
+            self._opened = False
+
+    async def add_faceprints(
+        self, user_id: str, faceprints: rsid_py.Faceprints
+    ) -> None:
+        async with self._session():
+            if len(self._rows_of(user_id)):
+                raise RuntimeError(
+                    f"A record already exists with this user_id {user_id}!"
+                )
+            self._append(user_id, faceprints)
+
+    async def update_faceprints(
+        self, user_id: str, faceprints: rsid_py.Faceprints
+    ) -> None:
+        async with self._session():
+            rows = self._user_rows(user_id)
+            self._append(user_id, faceprints)
+            self._tombstone(rows)
+
+    async def get_user_ids(self) -> list[str]:
+        async with self._session():
+            return [self._records["user_id"][row].decode() for row in self._live_rows()]
+
+    async def get_user_ids_page(
+        self, limit: int, cursor: str | None = None, prefix: str | None = None
+    ) -> tuple[list[str], str | None]:
+        # The cursor is the row of the next user. Rows only move when the gallery is compacted at startup.
+        async with self._session():
+            rows = self._live_rows()
+            if cursor is not None:
+                rows = rows[rows >= int(cursor)]
+            if prefix:
+                rows = rows[
+                    np.char.startswith(self._records["user_id"][rows], prefix.encode())
+                ]
+            page = rows[: limit + 1]
+            users = [self._records["user_id"][row].decode() for row in page[:limit]]
+            return users, str(int(page[limit])) if len(page) > limit else None
+
+    async def get_all_faceprints(self) -> list:
+        async with self._session():
+            return [self._payload(row) for row in self._live_rows()]
+
+    async def get_faceprints(
+        self,
+        extracted_faceprints: rsid_py.ExtractedFaceprintsElement,
+        limit: int | None = None,
+    ) -> list:
+        settings = get_app_settings()
+        return await self._search(
+            extracted_faceprints,
+            limit if limit is not None else settings.host_mode_hybrid_max_results,
+            settings.host_mode_hybrid_score_threshold,
+        )
+
+    async def get_nearest_faceprints(
+        self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, limit: int
+    ) -> list:
+        return await self._search(extracted_faceprints, limit, None)
+
+    async def _search(
+        self,
+        extracted_faceprints: rsid_py.ExtractedFaceprintsElement,
+        k: int | None,
+        score_threshold: float | None,
+    ) -> list:
+        query = np.asarray(
+            extracted_faceprints.features[:RSID_NUM_OF_RECOGNITION_FEATURES],
+            dtype=np.float32,
+        )
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        async with self._session():
+            rows = await asyncio.to_thread(self._top_k, query, k, score_threshold)
+            return [self._payload(row) for row in rows]
+
+    async def delete_user(self, user_id: str) -> None:
+        async with self._session():
+            self._tombstone(self._user_rows(user_id))
+
+    async def delete_users(self, user_ids: list[str]) -> list[str]:
+        async with self._session():
+            encoded = np.array(
+                [user_id.encode() for user_id in user_ids],
+                dtype=RECORD_DTYPE["user_id"],
+            )
+            rows = np.flatnonzero(
+                np.isin(self._records["user_id"], encoded)
+                & (self._records["deleted"] == 0)
+            )
+            self._tombstone(rows.tolist())
+            found = {self._records["user_id"][row].decode() for row in rows}
+        return [user_id for user_id in user_ids if user_id in found]
+
+    async def delete_all_users(self) -> None:
+        async with self._session():
+            # Empty files renamed over the old ones, as fast as truncating regardless of the gallery size. Truncating
+            # in place would SIGBUS other processes reading their mapping of the old files.
+            self._unmap()
+            for path in (self._descriptors_path, self._records_path):
+                self._replace(path, b"")
+            self._map()
+
+    async def compact(self) -> tuple[int, int]:
+        """
+        Rewrite the gallery without its tombstoned records. Returns the live and dropped record counts.
+
+        Rows are renumbered, run it while the server is stopped.
+        """
+        async with self._session():
+            rows = self._live_rows()
+            dropped = len(self._records) - len(rows)
+            if dropped == 0:
+                return len(rows), 0
+            logger.info(
+                f"Compacting gallery {self.directory}: dropping {dropped} deleted records"
+            )
+            descriptors = np.array(self._descriptors[rows])
+            records = np.array(self._records[rows])
+            self._unmap()
+            self._replace(self._descriptors_path, descriptors.tobytes())
+            self._replace(self._records_path, records.tobytes())
+            self._map()
+            return len(rows), dropped
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[None]:
+        # Opened by the app lifespan. Open lazily for callers outside of the app.
+        if not self._opened:
+            await self.open()
+        async with self._lock:
+            self._refresh()
+            yield
+
+    def _refresh(self) -> None:
+        # Pick up records appended by other processes, or files they replaced.
+        if self._file_versions() != self._versions(self._files):
+            self._map()
+
+    def _file_stats(self) -> tuple[os.stat_result, os.stat_result]:
+        return self._descriptors_path.stat(), self._records_path.stat()
+
+    def _file_versions(self) -> tuple[tuple[int, int], ...]:
+        return self._versions(self._file_stats())
+
+    @staticmethod
+    def _versions(
+        files: tuple[os.stat_result, os.stat_result] | None,
+    ) -> tuple[tuple[int, int], ...]:
+        return tuple((f.st_ino, f.st_size) for f in files) if files else ()
+
+    def _replace(self, path: Path, data: bytes) -> None:
+        # A new file renamed over the old one: processes that map the old file keep reading it until they remap.
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _map(self) -> None:
+        self._files = self._file_stats()
+        rows = min(
+            self._files[0].st_size // DESCRIPTOR_STRIDE,
+            self._files[1].st_size // RECORD_DTYPE.itemsize,
+        )
+        if rows == 0:
+            self._unmap()
+            return
+        self._descriptors = np.memmap(
+            self._descriptors_path,
+            dtype=DESCRIPTOR_DTYPE,
+            mode="r",
+            shape=(rows, DESCRIPTORS_PER_RECORD, RSID_DESCRIPTOR_SIZE),
+        )
+        self._records = np.memmap(
+            self._records_path, dtype=RECORD_DTYPE, mode="r", shape=(rows,)
+        )
+
+    def _unmap(self) -> None:
+        self._descriptors = np.zeros(
+            (0, DESCRIPTORS_PER_RECORD, RSID_DESCRIPTOR_SIZE), dtype=DESCRIPTOR_DTYPE
+        )
+        self._records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def _repair(self) -> None:
+        # A write interrupted between the two files leaves a partial record. Drop it so both files stay aligned.
+        descriptors_size, records_size = (f.st_size for f in self._file_stats())
+        rows = min(
+            descriptors_size // DESCRIPTOR_STRIDE, records_size // RECORD_DTYPE.itemsize
+        )
+        if (
+            descriptors_size != rows * DESCRIPTOR_STRIDE
+            or records_size != rows * RECORD_DTYPE.itemsize
+        ):
+            logger.warning(
+                f"Gallery {self.directory} has a partial record, truncating to {rows} records"
+            )
+            os.truncate(self._descriptors_path, rows * DESCRIPTOR_STRIDE)
+            os.truncate(self._records_path, rows * RECORD_DTYPE.itemsize)
+
+    def _append(self, user_id: str, faceprints: rsid_py.Faceprints) -> None:
+        descriptors = np.zeros(
+            (DESCRIPTORS_PER_RECORD, RSID_DESCRIPTOR_SIZE), dtype=DESCRIPTOR_DTYPE
+        )
+        for i, descriptor in enumerate(
+            (
+                faceprints.adaptive_descriptor_nomask,
+                faceprints.adaptive_descriptor_withmask,
+                faceprints.enroll_descriptor,
+            )
+        ):
+            values = np.asarray(
+                (descriptor or [])[:RSID_DESCRIPTOR_SIZE], dtype=DESCRIPTOR_DTYPE
+            )
+            descriptors[i, : len(values)] = values
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record["user_id"] = user_id.encode()
+        record["version"] = faceprints.version
+        record["flags"] = faceprints.flags
+        record["features_type"] = faceprints.features_type
+        record["revision"] = next_revision()
+        # Descriptors first: a record only exists once its row in records.bin is complete.
+        with open(self._descriptors_path, "ab") as f:
+            f.write(descriptors.tobytes())
+        with open(self._records_path, "ab") as f:
+            f.write(record.tobytes())
+        self._map()
+
+    def _tombstone(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        offset = RECORD_DTYPE.fields["deleted"][1]
+        with open(self._records_path, "r+b") as f:
+            for row in rows:
+                f.seek(row * RECORD_DTYPE.itemsize + offset)
+                f.write(b"\x01")
+
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._records["deleted"] == 0)
+
+    def _rows_of(self, user_id: str) -> np.ndarray:
+        return np.flatnonzero(
+            (self._records["user_id"] == user_id.encode())
+            & (self._records["deleted"] == 0)
+        )
+
+    def _user_rows(self, user_id: str) -> list[int]:
+        rows = self._rows_of(user_id)
+        if len(rows) == 0:
+            raise RuntimeError(f"No records were found with this user_id {user_id}!")
+        # An update interrupted before its tombstone leaves two records, updates and deletes replace both.
+        return rows.tolist()
+
+    def _payload(self, row: int) -> dict[str, Any]:
+        record = self._records[row]
+        descriptors = self._descriptors[row]
+        return {
+            "user_id": record["user_id"].decode(),
+            "flags": int(record["flags"]),
+            "version": int(record["version"]),
+            "features_type": int(record["features_type"]),
+            "revision": int(record["revision"]),
+            "adaptive_descriptor_nomask": descriptors[0].tolist(),
+            "adaptive_descriptor_withmask": descriptors[1].tolist(),
+            "enroll_descriptor": descriptors[ENROLL_DESCRIPTOR].tolist(),
+        }
+
+    def _top_k(
+        self, query: np.ndarray, k: int | None, score_threshold: float | None
+    ) -> list[int]:
+        # Exact cosine scores, converted to float32 one chunk at a time to bound memory.
+        rows = len(self._records)
+        scores = np.full(rows, -np.inf, dtype=np.float32)
+        for start in range(0, rows, SEARCH_CHUNK_ROWS):
+            end = min(start + SEARCH_CHUNK_ROWS, rows)
+            chunk = self._descriptors[
+                start:end, ENROLL_DESCRIPTOR, :RSID_NUM_OF_RECOGNITION_FEATURES
+            ]
+            chunk = chunk.astype(np.float32)
+            norms = np.maximum(np.linalg.norm(chunk, axis=1), 1e-12)
+            scores[start:end] = (chunk @ query) / norms
+        scores[self._records["deleted"] != 0] = -np.inf
+        candidates = np.flatnonzero(
+            scores >= (score_threshold if score_threshold is not None else -1.0)
+        )
+        if k is not None and len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        return candidates[np.argsort(scores[candidates])[::-1]].tolist()
@@ -3,14 +3,15 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import copy
-from typing import Any, Optional
+from typing import Annotated, Any
 
-from . import rsid_py
 from pydantic import (
     BaseModel,
-    Field, HttpUrl,
+    Field,
+    HttpUrl,
 )
 
+from . import rsid_py
 from .gen.models import (
     AlgoFlowEnum,
     AuthenticateStatusEnum,
@@ -31,6 +32,25 @@ def val_examples(field: str, prefix: str, example: list[Any]) -> str:
 
 class UsersQueryResponse(BaseModel, validate_assignment=True):
     users: list[str]
+    next_cursor: str | None = None
+
+
+class BulkDeleteRequest(BaseModel, validate_assignment=True):
+    user_ids: list[Annotated[str, Field(min_length=1, max_length=100)]] = Field(min_length=1)
+
+
+class BulkDeleteResult(BaseModel):
+    user_id: str
+    status: StatusEnum
+    message: str | None = None
+
+
+class BulkDeleteResponse(BaseModel, validate_assignment=True):
+    status: StatusEnum
+    results: list[BulkDeleteResult]
+    deleted: int
+    elapsed_ms: float
+    users_per_second: float
 
 
 class CommonOperationResponse(
@@ -46,7 +66,7 @@ class CommonOperationResponse(
             ],
         }
     )
-    message: Optional[str]
+    message: str | None
 
 
 class DeviceConfig(BaseModel, validate_assignment=True):
@@ -118,7 +138,7 @@ class DeviceConfigResponse(
             "examples": [f"{StatusEnum.Ok}", f"{StatusEnum.Error}"],
         }
     )
-    config: Optional[DeviceConfig] = Field(
+    config: DeviceConfig | None = Field(
         json_schema_extra={
             "content": {
                 "application/json": {
@@ -159,7 +179,7 @@ class AuthenticationResponse(
             ],
         }
     )
-    user_id: Optional[str] = Field(
+    user_id: str | None = Field(
         json_schema_extra={
             "title": "user_id",
             "description": "user_id if authenticated, null if unauthenticated",
@@ -168,12 +188,19 @@ class AuthenticationResponse(
             ],
         }
     )
-    faces: Optional[list[FaceRect]] = Field(
+    faces: list[FaceRect] | None = Field(
         json_schema_extra={
             "title": "faces",
             "description": "list of faces if authenticated, null if unauthenticated",
         }
     )
+    candidates_evaluated: int | None = Field(
+        default=None,
+        json_schema_extra={
+            "title": "candidates_evaluated",
+            "description": "Host DB mode only: number of DB faceprints run through the device matcher",
+        },
+    )
 
 
 class EnrollResponse(BaseModel, validate_assignment=True):
@@ -187,7 +214,7 @@ class EnrollResponse(BaseModel, validate_assignment=True):
             ],
         }
     )
-    user_id: Optional[str]
+    user_id: str | None
 
 
 class DeviceInfoResponse(
@@ -286,3 +313,148 @@ class FWUpdateStatusReportResponse(BaseModel, validate_assignment=True):
     db_compat_display_message: str
     update_policy_compat: bool
     update_policy_compat_display_message: str
+
+
+class DeviceSessionStats(BaseModel):
+    port: str | None = None
+    connected: bool = False
+    connects: int = 0
+    reconnects: int = 0
+    reuses: int = 0
+    idle_timeouts: int = 0
+    health_checks: int = 0
+    health_check_failures: int = 0
+    errors: int = 0
+
+
+class DeviceQueueStats(BaseModel):
+    depth: int = 0
+    max_depth: int | None = None
+    submitted: int = 0
+    served: int = 0
+    rejected: int = 0
+    avg_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+
+
+class DeviceUserIndexStats(BaseModel):
+    loaded: bool = False
+    users: int = 0
+    hits: int = 0
+    reconciliations: int = 0
+    drift: int = 0
+
+
+class DeviceStats(BaseModel):
+    device_id: str
+    port: str
+    in_flight: int = 0
+    operations: int = 0
+    busy_seconds: float = 0.0
+    utilization: float = 0.0
+    session: DeviceSessionStats
+    queue: dict[str, DeviceQueueStats]
+    users: DeviceUserIndexStats
+
+
+class DevicesResponse(BaseModel, validate_assignment=True):
+    devices: list[DeviceStats]
+
+
+class DeviceDiscoveryStats(BaseModel):
+    ports: list[str] = []
+    stale: bool = True
+    scans: int = 0
+    invalidations: int = 0
+    last_scan_ms: float = 0.0
+    total_scan_ms: float = 0.0
+
+
+class CacheStats(BaseModel):
+    ttl: float = 0.0
+    entries: int = 0
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+
+
+class GalleryIndexStats(BaseModel):
+    users: int = 0
+    capacity: int = 0
+    load_ms: float = 0.0
+    searches: int = 0
+    last_search_ms: float = 0.0
+    total_search_ms: float = 0.0
+
+
+class HostDBStats(BaseModel):
+    # Maintained in-process: writes of other workers sharing a Qdrant server only show after a restart
+    points: int = 0
+    adds: int = 0
+    updates: int = 0
+    deletes: int = 0
+    searches: int = 0
+
+
+class WarmUpStep(BaseModel):
+    name: str
+    ok: bool
+    elapsed_ms: float
+    error: str | None = None
+    attempts: int = 1
+
+
+class ReadinessResponse(BaseModel, validate_assignment=True):
+    ready: bool = False
+    startup_ms: float | None = None
+    steps: list[WarmUpStep] = []
+
+
+class AuthCoalescingStats(BaseModel):
+    enabled: bool = False
+    captures: int = 0
+    joined: int = 0
+    window_hits: int = 0
+
+
+class FaceprintsCacheStats(BaseModel):
+    capacity: int = 0
+    entries: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    hit_rate: float = 0.0
+
+
+class UpdateQueueStats(BaseModel):
+    enabled: bool = False
+    pending: int = 0
+    queued: int = 0
+    coalesced: int = 0
+    rejected: int = 0
+    flushes: int = 0
+    written: int = 0
+    failed: int = 0
+    last_flush_ms: float = 0.0
+
+
+class HybridStageStats(BaseModel):
+    # Candidates searched in this stage, 0 = whole gallery
+    k: int
+    searches: int = 0
+    matches: int = 0
+    candidates_evaluated: int = 0
+    hit_rate: float = 0.0
+
+
+class StatsResponse(BaseModel, validate_assignment=True):
+    devices: list[DeviceStats]
+    discovery: DeviceDiscoveryStats | None
+    caches: dict[str, CacheStats]
+    gallery_index: GalleryIndexStats | None = None
+    host_db: HostDBStats | None = None
+    hybrid_stages: list[HybridStageStats] = []
+    faceprints_cache: FaceprintsCacheStats | None = None
+    update_queue: UpdateQueueStats | None = None
+    auth_coalescing: AuthCoalescingStats
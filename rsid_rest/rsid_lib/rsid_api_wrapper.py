@@ -4,28 +4,55 @@
 
 import asyncio
 import copy
+import heapq
+import json
 import math
 import os
 import threading
+import time
 import uuid
+from collections.abc import AsyncIterator
 from pathlib import Path
+from typing import Annotated
 
 import cv2
 import numpy as np
 from . import rsid_py
 from cv2.typing import MatLike
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from simplejpeg import encode_jpeg
 from starlette.responses import AsyncContentStream
 
 from . import models
+from .auth_coalescer import AuthCoalescer
+from .device_arbiter import DevicePriority
+from .device_discovery import DeviceDiscovery
+from .device_pool import Device, DevicePool, close_devices
+from .device_user_index import DeviceUserIndex
+from .faceprints_cache import FaceprintsCache
 from .gen.models import AuthenticateStatusEnum
-from .host_db_local_file import HostDBLocalFile
-from .models import AuthenticationResponse, DeviceInfoResponse, EnrollResponse
+from .host_db import create_host_db
+from .host_db_base import HostDBBase
+from .host_db_gallery_index import HostDBGalleryIndex
+from .models import (
+    AuthenticationResponse,
+    BulkDeleteResponse,
+    BulkDeleteResult,
+    DeviceInfoResponse,
+    DeviceStats,
+    EnrollResponse,
+    HybridStageStats,
+    ReadinessResponse,
+    StatsResponse,
+)
 from .models import FaceRect as FaceRectModel
+from .ttl_cache import CacheEntry, TTLCache
+from .update_queue import FaceprintsUpdateQueue
+from .warm_up import WarmUp
 from ..core.config import get_app_settings
-from ..core.settings.base import HostModeAuthTypes, StreamEncodingStypes
+from ..core.settings.base import ApplicationDBTypes, HostModeAuthTypes, StreamEncodingStypes
 
 if os.name == "nt":  # sys.platform == 'win32':
     from serial.tools.list_ports_windows import comports
@@ -38,16 +65,40 @@
 class RSIDApiWrapper:
     _instance = None
     _lock = threading.Lock()
-    _condition = asyncio.Condition()
     _preview_condition = threading.Condition()
     _preview: rsid_py.Preview | None = None
     _preview_tickets: list[uuid.UUID] = []
     _preview_image = None
     _preview_encoder_lock = threading.Lock()
+    _initialized = False
 
     def __init__(self):
-        self.db = HostDBLocalFile()
-        self._port = None
+        # __new__ hands out the same instance every time, don't reset its state on every call.
+        if self._initialized:
+            return
+        self._initialized = True
+        settings = get_app_settings()
+        self.warm_up = WarmUp()
+        self.db: HostDBBase = create_host_db()
+        self._ports: list[str] = []
+        self._pool = DevicePool(on_connection_error=self._on_connection_error)
+        self._discovery = DeviceDiscovery(
+            scan=discover_device_ports,
+            interval=settings.device_discovery_interval,
+            on_change=self.set_ports,
+        )
+        self._auth_coalescer = AuthCoalescer(window=settings.auth_coalescing_window_ms / 1000)
+        self._device_info_cache: TTLCache[DeviceInfoResponse] = TTLCache(ttl=settings.device_info_cache_ttl)
+        self._device_config_cache: TTLCache[models.DeviceConfig] = TTLCache(ttl=settings.device_config_cache_ttl)
+        self._hybrid_stages: dict[int, HybridStageStats] = {}
+        self._faceprints_cache = FaceprintsCache(capacity=settings.host_mode_faceprints_cache_size)
+        self.update_queue = FaceprintsUpdateQueue(
+            db=self.db,
+            max_size=settings.host_mode_update_queue_size,
+            flush_interval=settings.host_mode_update_flush_interval,
+            batch_size=settings.host_mode_update_batch_size,
+            on_flushed=self._on_faceprints_updated,
+        )
 
     def __new__(cls):
         if cls._instance is None:
@@ -57,16 +108,81 @@ def __new__(cls):
         return cls._instance
 
     def set_port(self, port: str):
+        self.set_ports([port] if port else [])
+
+    def set_ports(self, ports: list[str]):
         with self._lock:
-            self._port = port
+            if ports == self._ports:
+                return
+            self._ports = list(ports)
+            removed = self._pool.sync(self._ports)
+        # Closing waits behind the device's queued operations, stream() must not wait for that on the event loop.
+        close_devices(removed)
+
+    def discover_devices(self) -> None:
+        # Served from the discovery cache, the port scan only runs when the cache is stale.
+        self._discovery.ports()
+
+    def _on_connection_error(self) -> None:
+        if get_app_settings().auto_detect:
+            self._discovery.invalidate()
+
+    def has_device(self, device_id: str) -> bool:
+        return device_id in self._pool
+
+    def close(self) -> None:
+        self._discovery.stop()
+        self._pool.close()
+
+    async def open_sessions(self) -> None:
+        devices = self._pool.devices()
+        if not devices:
+            raise RuntimeError("No RealSenseID device found")
+
+        def open_session(device: Device):
+            with device.session.acquire():
+                pass
+
+        for device in devices:
+            await device.run(DevicePriority.query, open_session, device)
+
+    def query_devices(self) -> list[DeviceStats]:
+        return [device.snapshot() for device in self._pool.devices()]
+
+    def query_stats(self) -> StatsResponse:
+        host_mode = get_app_settings().db_mode == ApplicationDBTypes.host
+        return StatsResponse(
+            devices=self.query_devices(),
+            discovery=self._discovery.snapshot() if get_app_settings().auto_detect else None,
+            caches={
+                "device_info": self._device_info_cache.snapshot(),
+                "device_config": self._device_config_cache.snapshot(),
+            },
+            gallery_index=self.db.snapshot() if isinstance(self.db, HostDBGalleryIndex) else None,
+            host_db=self.db.collection_stats() if host_mode else None,
+            hybrid_stages=[
+                stage.model_copy(update={"hit_rate": stage.matches / stage.searches if stage.searches else 0.0})
+                for stage in self._hybrid_stages.values()
+            ],
+            faceprints_cache=self._faceprints_cache.snapshot() if host_mode else None,
+            update_queue=self.update_queue.snapshot() if host_mode else None,
+            auth_coalescing=self._auth_coalescer.stats.model_copy(
+                update={"enabled": get_app_settings().auth_coalescing}
+            ),
+        )
+
+    async def auth(self, device_id: str | None = None) -> AuthenticationResponse:
+        device = self._pool.get(device_id)
+        if get_app_settings().auth_coalescing:
+            return await self._auth_coalescer.run(("device", device.device_id), lambda: self._auth(device))
+        return await self._auth(device)
 
-    async def auth(self) -> AuthenticationResponse:
-        logger.info(f"authenticating with {self._port}")
+    async def _auth(self, device: Device) -> AuthenticationResponse:
+        logger.info(f"authenticating with {device.port}")
 
         auth_result: rsid_py.AuthenticateStatus | None = None
         user_id: str | None = None
         faces: list[rsid_py.FaceRect] | None = None
-        exception: Exception | None = None
 
         def on_hint(hint: rsid_py.AuthenticateStatus | None, score: float | None):
             # TODO: Publish on websocket
@@ -79,7 +195,6 @@ def on_result(result: rsid_py.AuthenticateStatus, result_user_id: str):
             success = result == rsid_py.AuthenticateStatus.Success
             auth_result = result
             logger.debug(f'Success "{user_id}"' if success else str(result))
-            self._condition.notify()
 
         def on_faces(face_rects: list[rsid_py.FaceRect], timestamp: int):
             nonlocal faces
@@ -89,39 +204,44 @@ def on_faces(face_rects: list[rsid_py.FaceRect], timestamp: int):
                 faces.append(FaceRectModel.from_rsid_face_rect(face))
             logger.debug(f"detected {len(faces)} face(s)")
 
-        with self._lock:
-            async with self._condition:
-                with rsid_py.FaceAuthenticator(self._port) as authenticator:
-                    try:
-                        authenticator.authenticate(
-                            on_hint=on_hint,
-                            on_result=on_result,
-                            on_faces=on_faces,
-                        )
-                    except Exception as e:
-                        logger.error(e)
-                        exception = e
-                    finally:
-                        authenticator.disconnect()
-                await self._condition.wait_for(lambda: auth_result is not None)
-
-        if exception is not None:
-            raise exception
+        def authenticate():
+            # Device context. authenticate() returns after on_result was called.
+            with device.session.acquire() as authenticator:
+                authenticator.authenticate(
+                    on_hint=on_hint,
+                    on_result=on_result,
+                    on_faces=on_faces,
+                )
+
+        try:
+            await device.run(DevicePriority.auth, authenticate)
+        except Exception as e:
+            logger.error(e)
+            raise e
         return AuthenticationResponse(
             user_id=user_id,
             faces=faces,
             status=AuthenticateStatusEnum.from_rsid_py(auth_result),
         )
 
-    async def auth_host(self) -> AuthenticationResponse:
-        logger.info(f"authenticating with {self._port}")
+    async def auth_host(self, device_id: str | None = None) -> AuthenticationResponse:
+        # Host mode keeps the DB on the host, any camera can serve the request.
+        if device_id is not None:
+            device = self._pool.get(device_id)
+            if get_app_settings().auth_coalescing:
+                return await self._auth_coalescer.run(("host", device.device_id), lambda: self._auth_host(device))
+            return await self._auth_host(device)
+        if get_app_settings().auth_coalescing:
+            # Join the capture in flight on whichever camera it runs, the least busy one is picked when it starts.
+            return await self._auth_coalescer.run(("host", None), lambda: self._auth_host(self._pool.least_busy()))
+        return await self._auth_host(self._pool.least_busy())
+
+    async def _auth_host(self, device: Device) -> AuthenticationResponse:
+        logger.info(f"authenticating with {device.port}")
 
         auth_result: rsid_py.AuthenticateStatus | None = None
         extracted_faceprints: rsid_py.ExtractedFaceprintsElement | None = None
         faces: list[rsid_py.FaceRect] | None = None
-        exception: Exception | None = None
-        best_match_updated_faceprints: rsid_py.Faceprints | None = None
-        best_match_db_record = None
 
         def on_hint(hint: rsid_py.AuthenticateStatus | None, score: float | None):
             # SDK Context
@@ -151,51 +271,25 @@ def on_result(
                 #   don't use extracted_faceprints = faceprints
                 #   use copy instead
                 extracted_faceprints = copy.copy(faceprints)
-            self._condition.notify()
-
-        with self._lock:
-            async with self._condition:
-                with rsid_py.FaceAuthenticator(self._port) as authenticator:
-                    try:
-                        authenticator.extract_faceprints_for_auth(
-                            on_result=on_result, on_hint=on_hint, on_faces=on_faces
-                        )
-                    except Exception as e:
-                        logger.error(e)
-                        exception = e
-                    finally:
-                        authenticator.disconnect()
-
-                # Wait for callback response.
-                await self._condition.wait_for(lambda: auth_result is not None)
-
-                if exception is not None:
-                    raise exception
-
-                if auth_result != rsid_py.AuthenticateStatus.Success:
-                    return AuthenticationResponse(
-                        user_id=None,
-                        faces=faces,
-                        status=AuthenticateStatusEnum.from_rsid_py(auth_result),
-                    )
-
-                faceprints_db: list = []
-                if get_app_settings().host_mode_auth_type == HostModeAuthTypes.hybrid:
-                    faceprints_db = await self.db.get_faceprints(extracted_faceprints)
-                elif get_app_settings().host_mode_auth_type == HostModeAuthTypes.device:
-                    faceprints_db = await self.db.get_all_faceprints()
 
-                logger.info(f"Searching in {len(faceprints_db)} DB faceprints...")
-
-                max_score = -100
+        def extract_faceprints():
+            # Device context. extract_faceprints_for_auth() returns after on_result was called.
+            with device.session.acquire() as authenticator:
+                authenticator.extract_faceprints_for_auth(
+                    on_result=on_result, on_hint=on_hint, on_faces=on_faces
+                )
+
+        def match_faceprints(faceprints_db: list, accept_score: float | None):
+            # Device context. Matching runs on the host but uses the SDK matcher of the connected authenticator.
+            best_match_db_record = None
+            best_match_updated_faceprints: rsid_py.Faceprints | None = None
+            best_match_should_update = False
+            max_score = -100
+            evaluated = 0
+            with device.session.acquire() as authenticator:
                 for i, db_record in enumerate(faceprints_db):
-                    db_faceprints = rsid_py.Faceprints()
-                    db_faceprints.flags = db_record["flags"]
-                    db_faceprints.version = db_record["version"]
-                    db_faceprints.features_type = db_record["features_type"]
-                    db_faceprints.adaptive_descriptor_nomask = db_record["adaptive_descriptor_nomask"]
-                    db_faceprints.adaptive_descriptor_withmask = db_record["adaptive_descriptor_withmask"]
-                    db_faceprints.enroll_descriptor = db_record["enroll_descriptor"]
+                    evaluated += 1
+                    db_faceprints = self._faceprints_cache.get(db_record)
 
                     out_faceprints = rsid_py.Faceprints()
                     # TODO: Grab MatcherConfidenceLevel from device
@@ -212,27 +306,97 @@ def on_result(
                             max_score = match_result.score
                             best_match_db_record = db_record
                             best_match_updated_faceprints = out_faceprints
+                            best_match_should_update = match_result.should_update
+                        if accept_score is not None and match_result.score >= accept_score:
+                            # Vector order isn't matcher order, a later candidate may still score higher. Trade it
+                            # for latency once the score is good enough.
+                            break
+            return best_match_db_record, best_match_updated_faceprints, best_match_should_update, evaluated
+
+        try:
+            await device.run(DevicePriority.auth, extract_faceprints)
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        if auth_result != rsid_py.AuthenticateStatus.Success:
+            return AuthenticationResponse(
+                user_id=None,
+                faces=faces,
+                status=AuthenticateStatusEnum.from_rsid_py(auth_result),
+            )
+
+        settings = get_app_settings()
+        hybrid = settings.host_mode_auth_type == HostModeAuthTypes.hybrid
+        # Hybrid widens the search in stages while no candidate matches on the device.
+        stages = [settings.host_mode_hybrid_max_results or 0, *settings.host_mode_hybrid_widening] if hybrid else [0]
+        best_match_db_record = None
+        best_match_updated_faceprints = None
+        should_update = False
+        evaluated = 0
+        searched: set[str] = set()
+        for k in stages:
+            faceprints_db = [
+                db_record
+                for db_record in await self._host_candidates(extracted_faceprints, k)
+                if db_record["user_id"] not in searched
+            ]
+            searched.update(db_record["user_id"] for db_record in faceprints_db)
+            logger.info(f"Searching in {len(faceprints_db)} DB faceprints...")
+
+            # Vector search candidates come best first, so matching can stop at the first confident match.
+            accept_score = settings.host_mode_hybrid_accept_score if hybrid and k else None
+            best_match_db_record, best_match_updated_faceprints, should_update, stage_evaluated = await device.run(
+                DevicePriority.auth, match_faceprints, faceprints_db, accept_score
+            )
+            logger.info(f"Evaluated {stage_evaluated} of {len(faceprints_db)} DB faceprints")
+            evaluated += stage_evaluated
+            if hybrid:
+                stage = self._hybrid_stages.setdefault(k, HybridStageStats(k=k))
+                stage.searches += 1
+                stage.candidates_evaluated += stage_evaluated
+                stage.matches += best_match_db_record is not None
+            if best_match_db_record is not None:
+                break
 
         if best_match_db_record is None:
             # Return with Forbidden status
-            return AuthenticationResponse(user_id=None, faces=faces, status=AuthenticateStatusEnum.Forbidden)
+            return AuthenticationResponse(
+                user_id=None, faces=faces, status=AuthenticateStatusEnum.Forbidden, candidates_evaluated=evaluated
+            )
 
         user_id = best_match_db_record["user_id"]
 
-        if match_result.should_update:
+        if should_update and not self.update_queue.put(user_id, best_match_updated_faceprints):
+            # Queue disabled or full, write before responding
             await self.db.update_faceprints(user_id, best_match_updated_faceprints)
+            self._faceprints_cache.invalidate(user_id)
 
         return AuthenticationResponse(
             user_id=user_id,
             faces=faces,
             status=AuthenticateStatusEnum.from_rsid_py(auth_result),
+            candidates_evaluated=evaluated,
         )
 
-    async def enroll(self, user_id: str) -> EnrollResponse:
+    def _on_faceprints_updated(self, user_ids: list[str]) -> None:
+        for user_id in user_ids:
+            self._faceprints_cache.invalidate(user_id)
+
+    async def _host_candidates(self, extracted_faceprints: rsid_py.ExtractedFaceprintsElement, k: int) -> list:
+        auth_type = get_app_settings().host_mode_auth_type
+        if auth_type == HostModeAuthTypes.vectorized:
+            # Score the whole gallery on the host at once, the device matcher only confirms the best candidate.
+            return await self.db.get_nearest_faceprints(extracted_faceprints, limit=1)
+        if auth_type == HostModeAuthTypes.device or k == 0:
+            return await self.db.get_all_faceprints()
+        return await self.db.get_faceprints(extracted_faceprints, limit=k)
+
+    async def enroll(self, user_id: str, device_id: str | None = None) -> EnrollResponse:
         logger.info(f"enrolling user: {user_id}")
+        device = self._pool.get(device_id)
 
         enroll_result: rsid_py.EnrollStatus | None = None
-        exception: Exception | None = None
 
         def on_progress(face_pose: rsid_py.FacePose):
             # TODO: Publish on websocket?
@@ -247,33 +411,30 @@ def on_result(result: rsid_py.EnrollStatus, uid: str | None = None):
             success = result == rsid_py.EnrollStatus.Success
             enroll_result = result
             logger.debug(f'Success "{uid}"' if success else str(result))
-            self._condition.notify()
 
         def on_faces(faces: list[rsid_py.FaceRect], timestamp: int):
             # TODO: Publish on websocket?
             logger.debug(f"detected {len(faces)} face(s)")
 
-        with self._lock:
-            async with self._condition:
-                with rsid_py.FaceAuthenticator(self._port) as authenticator:
-                    try:
-                        await run_in_threadpool(authenticator.enroll,
-                                                on_hint=on_hint,
-                                                on_progress=on_progress,
-                                                on_result=on_result,
-                                                on_faces=on_faces,
-                                                user_id=user_id,
-                                                )
-                    except Exception as e:
-                        exception = e
-                        logger.error(e)
-                    finally:
-                        authenticator.disconnect()
-
-                await self._condition.wait_for(lambda: enroll_result is not None)
+        def enroll():
+            # Device context. enroll() returns after on_result was called.
+            with device.session.acquire() as authenticator:
+                authenticator.enroll(
+                    on_hint=on_hint,
+                    on_progress=on_progress,
+                    on_result=on_result,
+                    on_faces=on_faces,
+                    user_id=user_id,
+                )
 
-        if exception is not None:
-            raise exception
+        try:
+            await device.run(DevicePriority.enroll, enroll)
+        except Exception as e:
+            logger.error(e)
+            device.users.invalidate()
+            raise e
+        if enroll_result == rsid_py.EnrollStatus.Success:
+            device.users.add(user_id)
         return EnrollResponse(user_id=user_id, status=models.EnrollStatusEnum.from_rsid_py(enroll_result))
 
     def _resize_if_big(self, im_cv: MatLike) -> MatLike:
@@ -291,26 +452,27 @@ def _resize_if_big(self, im_cv: MatLike) -> MatLike:
             logger.info(f"Scaled down to {im_cv.shape[1]}x{im_cv.shape[0]} ({img_size_kb} KB) to fit max size")
         return im_cv
 
-    async def enroll_image(self, user_id: str, file_path: Path) -> EnrollResponse:
-        exception: Exception | None = None
+    async def enroll_image(self, user_id: str, file_path: Path, device_id: str | None = None) -> EnrollResponse:
+        device = self._pool.get(device_id)
         image = await run_in_threadpool(self._resize_if_big, (cv2.imread(str(file_path))))
         h, w, _ = image.shape
 
-        with self._lock:
-            with rsid_py.FaceAuthenticator(self._port) as f:
-                try:
-                    enroll_result = await run_in_threadpool(f.enroll_image, user_id, image.flatten().tolist(), w, h)
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
-                finally:
-                    f.disconnect()
+        def enroll_image():
+            with device.session.acquire() as f:
+                return f.enroll_image(user_id, image.flatten().tolist(), w, h)
 
-        if exception is not None:
-            raise exception
+        try:
+            enroll_result = await device.run(DevicePriority.enroll, enroll_image)
+        except Exception as e:
+            logger.error(e)
+            device.users.invalidate()
+            raise e
+        if enroll_result == rsid_py.EnrollStatus.Success:
+            device.users.add(user_id)
         return EnrollResponse(user_id=user_id, status=models.EnrollStatusEnum.from_rsid_py(enroll_result))
 
-    async def enroll_host(self, user_id: str) -> EnrollResponse:
+    async def enroll_host(self, user_id: str, device_id: str | None = None) -> EnrollResponse:
+        device = self._pool.get(device_id)
         enroll_status: rsid_py.EnrollStatus | None = None
         extracted_prints: rsid_py.ExtractedFaceprintsElement | None = None
 
@@ -327,7 +489,6 @@ def on_fp_enroll_result(status: rsid_py.EnrollStatus, faceprints: rsid_py.Extrac
                 extracted_prints.version = faceprints.version
                 extracted_prints.features_type = faceprints.features_type
                 extracted_prints.features = faceprints.features
-            self._condition.notify()
 
         def on_progress(p: rsid_py.FacePose):
             logger.info(f"on_progress {p}")
@@ -338,19 +499,17 @@ def on_hint(s: rsid_py.EnrollStatus, score: float | None):
         def on_faces(faces: list[rsid_py.FaceRect], i: int):
             logger.info(f"on_faces {faces}")
 
-        with self._lock:
-            async with self._condition:
-                with rsid_py.FaceAuthenticator(self._port) as authenticator:
-                    try:
-                        await run_in_threadpool(authenticator.extract_faceprints_for_enroll,
-                                                on_progress=on_progress,
-                                                on_hint=on_hint,
-                                                on_faces=on_faces,
-                                                on_result=on_fp_enroll_result,
-                                                )
-                    finally:
-                        authenticator.disconnect()
-                await self._condition.wait_for(lambda: enroll_status is not None)
+        def extract_faceprints():
+            # Device context. extract_faceprints_for_enroll() returns after on_result was called.
+            with device.session.acquire() as authenticator:
+                authenticator.extract_faceprints_for_enroll(
+                    on_progress=on_progress,
+                    on_hint=on_hint,
+                    on_faces=on_faces,
+                    on_result=on_fp_enroll_result,
+                )
+
+        await device.run(DevicePriority.enroll, extract_faceprints)
 
         if enroll_status == rsid_py.EnrollStatus.Success:
             try:
@@ -362,28 +521,26 @@ def on_faces(faces: list[rsid_py.FaceRect], i: int):
                 db_item.adaptive_descriptor_withmask = [0] * 515  # deprecated.
                 db_item.enroll_descriptor = extracted_prints.features
                 await self.db.add_faceprints(user_id, db_item)
+                self._faceprints_cache.invalidate(user_id)
             except Exception as e:
                 logger.error(e)
                 raise e
 
         return EnrollResponse(user_id=user_id, status=models.EnrollStatusEnum.from_rsid_py(enroll_status))
 
-    async def enroll_host_image(self, user_id: str, file_path: Path) -> EnrollResponse:
+    async def enroll_host_image(self, user_id: str, file_path: Path, device_id: str | None = None) -> EnrollResponse:
+        # Extraction from an image doesn't depend on the camera, use the least busy one.
+        device = self._pool.get(device_id) if device_id is not None else self._pool.least_busy()
         image = await run_in_threadpool(self._resize_if_big, (cv2.imread(str(file_path))))
         h, w, _ = image.shape
-        extracted_prints: rsid_py.ExtractedFaceprintsElement
-        with self._lock:
-            async with self._condition:
-                with rsid_py.FaceAuthenticator(self._port) as f:
-                    try:
-                        extracted_prints = await run_in_threadpool(
-                            f.extract_image_faceprints_for_enroll,
-                            image.flatten().tolist(),
-                            w,
-                            h,
-                        )
-                    finally:
-                        f.disconnect()
+
+        def extract_faceprints() -> rsid_py.ExtractedFaceprintsElement:
+            with device.session.acquire() as f:
+                return f.extract_image_faceprints_for_enroll(image.flatten().tolist(), w, h)
+
+        extracted_prints: rsid_py.ExtractedFaceprintsElement = await device.run(
+            DevicePriority.enroll, extract_faceprints
+        )
         try:
             db_item = rsid_py.Faceprints()
             db_item.version = extracted_prints.version
@@ -393,126 +550,279 @@ async def enroll_host_image(self, user_id: str, file_path: Path) -> EnrollRespon
             # db_item.adaptive_descriptor_withmask = [0]    # FIXME: deprecated?
             db_item.enroll_descriptor = extracted_prints.features
             await self.db.add_faceprints(user_id, db_item)
+            self._faceprints_cache.invalidate(user_id)
         except Exception as e:
             logger.error(e)
             raise e
 
         return EnrollResponse(user_id=user_id, status=models.EnrollStatusEnum.Success)
 
-    async def query_users(self) -> list[str]:
-        users = []
-        exception: Exception | None = None
-        with self._lock:
-            with rsid_py.FaceAuthenticator(self._port) as f:
-                try:
-                    users = await run_in_threadpool(f.query_user_ids)
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
-                finally:
-                    f.disconnect()
-        if exception is not None:
-            raise exception
-        return users
+    async def reconcile_users(self, device_id: str | None = None) -> list[str]:
+        """Reload the device's user index from the device."""
+        device = self._pool.get(device_id)
+
+        def query_user_ids() -> list[str]:
+            with device.session.acquire() as f:
+                return f.query_user_ids()
+
+        try:
+            user_ids = await device.run(DevicePriority.query, query_user_ids)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        device.users.load(user_ids)
+        return user_ids
+
+    async def _user_index(self, device: Device) -> DeviceUserIndex:
+        if device.users.stale:
+            await self.reconcile_users(device.device_id)
+        return device.users
+
+    async def query_users(self, device_id: str | None = None) -> list[str]:
+        return (await self.query_users_cached(device_id=device_id)).value
+
+    async def query_users_cached(self, device_id: str | None = None) -> CacheEntry[list[str]]:
+        device = self._pool.get(device_id)
+        return (await self._user_index(device)).entry()
+
+    @staticmethod
+    def users_page(
+        users: list[str], limit: int | None, cursor: str | None = None, prefix: str | None = None
+    ) -> tuple[list[str], str | None]:
+        """Page of an in-memory user list, in user id order. The cursor is the next user id."""
+        matches = [
+            user_id
+            for user_id in users
+            if (not prefix or user_id.startswith(prefix)) and (cursor is None or user_id >= cursor)
+        ]
+        if limit is None:
+            return sorted(matches), None
+        page = heapq.nsmallest(limit + 1, matches)
+        return page[:limit], page[limit] if len(page) > limit else None
 
     async def query_host_users(self) -> list[str]:
         users = await self.db.get_user_ids()
         return users
 
-    async def remove_user(self, user_id: str) -> None:
-        exception: Exception | None = None
-        with self._lock:
-            with rsid_py.FaceAuthenticator(self._port) as f:
-                try:
-                    users = f.query_user_ids()
-                    if user_id in users:
-                        await run_in_threadpool(f.remove_user, user_id=user_id)
-                    else:
-                        raise KeyError(f"User {user_id} is not in current users")
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
-                finally:
-                    f.disconnect()
-        if exception is not None:
-            raise exception
+    async def query_host_users_page(
+        self, limit: int, cursor: str | None = None, prefix: str | None = None
+    ) -> tuple[list[str], str | None]:
+        return await self.db.get_user_ids_page(limit, cursor=cursor, prefix=prefix)
+
+    async def stream_host_users(self, cursor: str | None = None, prefix: str | None = None) -> AsyncIterator[bytes]:
+        """
+        The whole user list as `UsersQueryResponse` JSON, fetched from the host DB one page at a time.
+
+        The first page is read before returning, so a bad cursor or an unavailable DB still fails the request.
+        """
+        page_size = get_app_settings().host_mode_users_page_size
+        users, cursor = await self.db.get_user_ids_page(page_size, cursor=cursor, prefix=prefix)
+
+        async def body() -> AsyncIterator[bytes]:
+            nonlocal users, cursor
+            yield b'{"users":['
+            separator = b""
+            while True:
+                if users:
+                    yield separator + b",".join(json.dumps(user_id).encode() for user_id in users)
+                    separator = b","
+                if cursor is None:
+                    break
+                users, cursor = await self.db.get_user_ids_page(page_size, cursor=cursor, prefix=prefix)
+            yield b'],"next_cursor":null}'
+
+        return body()
+
+    async def remove_user(self, user_id: str, device_id: str | None = None) -> None:
+        device = self._pool.get(device_id)
+        if user_id not in await self._user_index(device):
+            logger.error(f"User {user_id} is not in current users")
+            raise KeyError(f"User {user_id} is not in current users")
+
+        def remove_user():
+            with device.session.acquire() as f:
+                f.remove_user(user_id=user_id)
+
+        try:
+            await device.run(DevicePriority.enroll, remove_user)
+        except Exception as e:
+            logger.error(e)
+            device.users.invalidate()
+            raise e
+        device.users.discard(user_id)
 
     async def remove_host_user(self, user_id: str) -> None:
+        self.update_queue.discard(user_id)
         await self.db.delete_user(user_id=user_id)
+        self._faceprints_cache.invalidate(user_id)
+
+    async def remove_all_host_users(self) -> None:
+        self.update_queue.clear()
+        await self.db.delete_all_users()
+        self._faceprints_cache.clear()
+
+    async def remove_users(self, user_ids: list[str], device_id: str | None = None) -> BulkDeleteResponse:
+        start = time.perf_counter()
+        user_ids = list(dict.fromkeys(user_ids))
+        device = self._pool.get(device_id)
+        index = await self._user_index(device)
+        errors: dict[str, str] = {
+            user_id: f"User {user_id} is not in current users" for user_id in user_ids if user_id not in index
+        }
+        to_remove = [user_id for user_id in user_ids if user_id not in errors]
+
+        def remove_users():
+            # Device context. A single job and session for the whole batch.
+            with device.session.acquire() as f:
+                for user_id in to_remove:
+                    try:
+                        f.remove_user(user_id=user_id)
+                    except Exception as e:
+                        logger.error(f"Failed to remove user {user_id}: {e}")
+                        errors[user_id] = str(e)
 
-    def remove_all_users(self) -> None:
-        exception: Exception | None = None
-        with self._lock:
-            with rsid_py.FaceAuthenticator(self._port) as authenticator:
-                try:
-                    authenticator.remove_all_users()
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
-                finally:
-                    authenticator.disconnect()
-        if exception is not None:
-            raise exception
+        try:
+            if to_remove:
+                await device.run(DevicePriority.enroll, remove_users)
+        except Exception as e:
+            logger.error(e)
+            device.users.invalidate()
+            raise e
+        for user_id in to_remove:
+            if user_id in errors:
+                device.users.invalidate()
+            else:
+                device.users.discard(user_id)
+        return self._bulk_delete_response(user_ids, errors, time.perf_counter() - start)
+
+    async def remove_host_users(self, user_ids: list[str]) -> BulkDeleteResponse:
+        start = time.perf_counter()
+        user_ids = list(dict.fromkeys(user_ids))
+        for user_id in user_ids:
+            self.update_queue.discard(user_id)
+        deleted = set(await self.db.delete_users(user_ids=user_ids))
+        for user_id in deleted:
+            self._faceprints_cache.invalidate(user_id)
+        errors = {
+            user_id: f"No records were found with this user_id {user_id}!"
+            for user_id in user_ids
+            if user_id not in deleted
+        }
+        return self._bulk_delete_response(user_ids, errors, time.perf_counter() - start)
+
+    @staticmethod
+    def _bulk_delete_response(user_ids: list[str], errors: dict[str, str], elapsed: float) -> BulkDeleteResponse:
+        deleted = len(user_ids) - len(errors)
+        logger.info(
+            f"Bulk delete: {deleted}/{len(user_ids)} user(s) deleted in {elapsed * 1000:.1f}ms "
+            f"({deleted / elapsed if elapsed > 0 else 0:.1f} users/s)"
+        )
+        return BulkDeleteResponse(
+            status=models.StatusEnum.Ok if not errors else models.StatusEnum.Error,
+            results=[
+                BulkDeleteResult(
+                    user_id=user_id,
+                    status=models.StatusEnum.Error if user_id in errors else models.StatusEnum.Ok,
+                    message=errors.get(user_id),
+                )
+                for user_id in user_ids
+            ],
+            deleted=deleted,
+            elapsed_ms=round(elapsed * 1000, 3),
+            users_per_second=round(deleted / elapsed, 1) if elapsed > 0 else 0.0,
+        )
 
-    def query_device_info(self) -> DeviceInfoResponse:
-        exception: Exception | None = None
-        with self._lock:
-            with rsid_py.DeviceController(self._port) as device_controller:
+    def remove_all_users(self, device_id: str | None = None) -> None:
+        device = self._pool.get(device_id)
+
+        def remove_all_users():
+            with device.session.acquire() as authenticator:
+                authenticator.remove_all_users()
+
+        try:
+            device.call(DevicePriority.enroll, remove_all_users)
+        except Exception as e:
+            logger.error(e)
+            device.users.invalidate()
+            raise e
+        device.users.clear()
+
+    def query_device_info(self, device_id: str | None = None) -> DeviceInfoResponse:
+        device = self._pool.get(device_id)
+
+        def query_device_info() -> DeviceInfoResponse:
+            with device.session.released(), rsid_py.DeviceController(device.port) as device_controller:
                 try:
                     serial_number: str = device_controller.query_serial_number()
                     firmware_version: str = device_controller.query_firmware_version()
-                    device_info: DeviceInfoResponse = DeviceInfoResponse(
+                    return DeviceInfoResponse(
                         status=models.StatusEnum.Ok,
                         serial_number=serial_number,
                         firmware_version=firmware_version,
                     )
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
                 finally:
                     device_controller.disconnect()
-        if exception is not None:
-            raise exception
-        return device_info
 
-    def query_device_config(self) -> models.DeviceConfig:
-        exception: Exception | None = None
-        with self._lock:
-            with rsid_py.FaceAuthenticator(self._port) as f:
-                try:
-                    config = f.query_device_config()
-                    config = models.DeviceConfig.from_rsid_config(config)
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
-                finally:
-                    f.disconnect()
-        if exception is not None:
-            raise exception
-        return config
+        try:
+            return device.call(DevicePriority.query, query_device_info)
+        except Exception as e:
+            logger.error(e)
+            raise e
 
-    def update_device_config(self, config: models.DeviceConfig) -> models.DeviceConfig:
-        exception: Exception | None = None
-        with self._lock:
-            with rsid_py.FaceAuthenticator(self._port) as f:
-                try:
-                    rsid_config = rsid_py.DeviceConfig()
-                    rsid_config.algo_flow = config.algo_flow.to_rsid_py()
-                    rsid_config.camera_rotation = config.camera_rotation.to_rsid_py()
-                    rsid_config.security_level = config.security_level.to_rsid_py()
-                    #rsid_config.face_selection_policy = config.face_selection_policy.to_rsid_py()
-                    rsid_config.matcher_confidence_level = config.matcher_confidence_level.to_rsid_py()
-                    f.set_device_config(rsid_config)
-                except Exception as e:
-                    logger.error(e)
-                    exception = e
-                finally:
-                    f.disconnect()
-        if exception is not None:
-            raise exception
-        return self.query_device_config()
+    def query_device_info_cached(self, device_id: str | None = None) -> CacheEntry[DeviceInfoResponse]:
+        device = self._pool.get(device_id)
+        entry = self._device_info_cache.get(device.device_id)
+        if entry is None:
+            entry = self._device_info_cache.put(device.device_id, self.query_device_info(device.device_id))
+        return entry
 
-    async def stream(self, ticket: uuid.UUID) -> AsyncContentStream:
+    def query_device_config(self, device_id: str | None = None) -> models.DeviceConfig:
+        device = self._pool.get(device_id)
+
+        def query_device_config() -> rsid_py.DeviceConfig:
+            with device.session.acquire() as f:
+                return f.query_device_config()
+
+        try:
+            return models.DeviceConfig.from_rsid_config(device.call(DevicePriority.query, query_device_config))
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    def query_device_config_cached(self, device_id: str | None = None) -> CacheEntry[models.DeviceConfig]:
+        device = self._pool.get(device_id)
+        entry = self._device_config_cache.get(device.device_id)
+        if entry is None:
+            entry = self._device_config_cache.put(device.device_id, self.query_device_config(device.device_id))
+        return entry
+
+    def update_device_config(self, config: models.DeviceConfig, device_id: str | None = None) -> models.DeviceConfig:
+        device = self._pool.get(device_id)
+
+        def set_device_config():
+            rsid_config = rsid_py.DeviceConfig()
+            rsid_config.algo_flow = config.algo_flow.to_rsid_py()
+            rsid_config.camera_rotation = config.camera_rotation.to_rsid_py()
+            rsid_config.security_level = config.security_level.to_rsid_py()
+            #rsid_config.face_selection_policy = config.face_selection_policy.to_rsid_py()
+            rsid_config.matcher_confidence_level = config.matcher_confidence_level.to_rsid_py()
+            with device.session.acquire() as f:
+                f.set_device_config(rsid_config)
+
+        try:
+            device.call(DevicePriority.query, set_device_config)
+        except Exception as e:
+            logger.error(e)
+            raise e
+        finally:
+            self._device_config_cache.invalidate(device.device_id)
+        return self.query_device_config_cached(device_id=device.device_id).value
+
+    def preview_device_type(self, device_id: str | None = None) -> rsid_py.DeviceType:
+        # `com_port` may list several ports, ask for the type of the camera the preview runs on.
+        return rsid_py.discover_device_type(self._pool.get(device_id).port)
+
+    async def stream(self, ticket: uuid.UUID, device_id: str | None = None) -> AsyncContentStream:
         self._preview_tickets.append(ticket)
         logger.info(
             f"Starting stream for user with ticket {ticket.hex}. " f"Audience count: {len(self._preview_tickets)}"
@@ -566,7 +876,7 @@ def on_preview_image(image: rsid_py.Image):
                 preview_cfg = rsid_py.PreviewConfig()
                 preview_cfg.camera_number = get_app_settings().preview_camera_number
                 preview_cfg.preview_mode = rsid_py.PreviewMode.MJPEG_1080P
-                preview_cfg.device_type = rsid_py.discover_device_type(get_app_settings().com_port)
+                preview_cfg.device_type = self.preview_device_type(device_id)
                 # preview_cfg.portrait_mode = True
                 # preview_cfg.rotate_raw = False
                 self._preview = rsid_py.Preview(preview_cfg)
@@ -616,38 +926,59 @@ def revoke_preview_ticket(self, ticket: uuid.UUID) -> None:
             self._preview.stop()
             self._preview = None
 
-    def query_update_status(self) -> models.UpdateCheckerResponse:
-        available, local, remote = rsid_py.UpdateChecker.is_update_available(self._port)
+    def query_update_status(self, device_id: str | None = None) -> models.UpdateCheckerResponse:
+        device = self._pool.get(device_id)
+
+        def is_update_available():
+            with device.session.released():
+                return rsid_py.UpdateChecker.is_update_available(device.port)
+
+        available, local, remote = device.call(DevicePriority.firmware, is_update_available)
         response = models.UpdateCheckerResponse(update_available=available,
                                                 local_release_info=models.LocalReleaseInfo.from_rsid_py(local),
                                                 remote_release_info=models.RemoteReleaseInfo.from_rsid_py(remote))
         return response
 
-    async def query_fw_update_status(self, file_path: Path) -> models.FWUpdateStatusReportResponse:
+    async def query_fw_update_status(
+        self, file_path: Path, device_id: str | None = None
+    ) -> models.FWUpdateStatusReportResponse:
+        device = self._pool.get(device_id)
         # def progress_callback(progress: float):
         #     logger.info(f"progress: {progress}")
         #     updater.update(progress_callback=progress_callback)
-        with self._lock:
-            with rsid_py.FWUpdater(str(file_path), self._port) as updater:
-                fw_file_info = await run_in_threadpool(updater.get_firmware_bin_info)
-                device_fw_info = await run_in_threadpool(updater.get_device_firmware_info)
-                sku_compat, sku_msg = updater.is_sku_compatible()
-                host_compat, host_mes = updater.is_host_compatible()
-                db_compat, db_msg = updater.is_db_compatible()
-                policy_compat, policy_msg = updater.is_policy_compatible()
-
-            return models.FWUpdateStatusReportResponse(
-                firmware_bin_info=models.FirmwareBinInfo.from_rsid_py(fw_file_info),
-                device_firmware_info=models.DeviceFirmwareInfo.from_rsid_py(device_fw_info),
-                sku_compat=sku_compat,
-                sku_compat_display_message=sku_msg,
-                host_compat=host_compat,
-                host_compat_display_message=host_mes,
-                db_compat=db_compat,
-                db_compat_display_message=db_msg,
-                update_policy_compat=policy_compat,
-                update_policy_compat_display_message=policy_msg
-            )
+
+        def query_fw_update_status():
+            with device.session.released(), rsid_py.FWUpdater(str(file_path), device.port) as updater:
+                return (
+                    updater.get_firmware_bin_info(),
+                    updater.get_device_firmware_info(),
+                    updater.is_sku_compatible(),
+                    updater.is_host_compatible(),
+                    updater.is_db_compatible(),
+                    updater.is_policy_compatible(),
+                )
+
+        (
+            fw_file_info,
+            device_fw_info,
+            (sku_compat, sku_msg),
+            (host_compat, host_mes),
+            (db_compat, db_msg),
+            (policy_compat, policy_msg),
+        ) = await device.run(DevicePriority.firmware, query_fw_update_status)
+
+        return models.FWUpdateStatusReportResponse(
+            firmware_bin_info=models.FirmwareBinInfo.from_rsid_py(fw_file_info),
+            device_firmware_info=models.DeviceFirmwareInfo.from_rsid_py(device_fw_info),
+            sku_compat=sku_compat,
+            sku_compat_display_message=sku_msg,
+            host_compat=host_compat,
+            host_compat_display_message=host_mes,
+            db_compat=db_compat,
+            db_compat_display_message=db_msg,
+            update_policy_compat=policy_compat,
+            update_policy_compat_display_message=policy_msg
+        )
 
 
 def lib_log(level: rsid_py.LogLevel, message: str):
@@ -667,22 +998,101 @@ def lib_log(level: rsid_py.LogLevel, message: str):
                          do_formatting=False)
 
 
+def prime_preview_encoder() -> None:
+    # The first encode pays for loading the codec, do it on a dummy 1080p frame instead of the first preview frame.
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    if get_app_settings().preview_stream_type == StreamEncodingStypes.webp:
+        cv2.imencode(".webp", frame, [cv2.IMWRITE_WEBP_QUALITY, get_app_settings().preview_webp_quality])
+    else:
+        encode_jpeg(frame, fastdct=True, quality=get_app_settings().preview_jpeg_quality)
+
+
+async def startup_rsid_api() -> None:
+    """
+    Warm-up run by the app lifespan. Readiness is reported at `/ready` once every step is done.
+
+    Failed steps are retried every `warm_up_retry_interval` seconds, so a camera plugged in or a host DB coming up
+    after boot still makes the app ready.
+    """
+    rsid_api = RSIDApiWrapper()
+    warm_up = rsid_api.warm_up
+    settings = get_app_settings()
+
+    async def discover_devices() -> None:
+        await run_in_threadpool(get_rsid_api)
+
+    async def open_host_db() -> None:
+        await rsid_api.db.open()
+        rsid_api.update_queue.start()
+
+    async def prime_encoder() -> None:
+        await run_in_threadpool(prime_preview_encoder)
+
+    steps = {
+        "device_discovery": discover_devices,
+        "host_db": open_host_db if settings.db_mode == ApplicationDBTypes.host else None,
+        "device_sessions": rsid_api.open_sessions,
+        "preview_encoder": prime_encoder,
+    }
+    while True:
+        for name, run in steps.items():
+            if run is not None and not warm_up.done(name):
+                async with warm_up.step(name):
+                    await run()
+        warm_up.finish()
+        if warm_up.status.ready or settings.warm_up_retry_interval <= 0:
+            return
+        await asyncio.sleep(settings.warm_up_retry_interval)
+
+
+def get_readiness() -> ReadinessResponse:
+    return RSIDApiWrapper().warm_up.status
+
+
+async def shutdown_rsid_api() -> None:
+    if RSIDApiWrapper._instance is not None:
+        rsid_api = RSIDApiWrapper()
+        await run_in_threadpool(rsid_api.close)
+        # Write the pending adaptive updates before closing the DB
+        await rsid_api.update_queue.stop()
+        await rsid_api.db.close()
+
+
+def discover_device_ports() -> list[str]:
+    ports_by_hwid: dict[str, str] = {}
+    iterator = sorted(comports(include_links=True))
+    for _, (port, desc, hwid) in enumerate(iterator, 1):
+        if "2AAD" in hwid and "6373" in hwid:
+            logger.info(f"Found cam on {port} -- desc: {desc} -- hwid: {hwid}")
+            # include_links lists the same camera under its symlinks too, keep the shortest name per device.
+            if hwid not in ports_by_hwid or len(port) < len(ports_by_hwid[hwid]):
+                ports_by_hwid[hwid] = port
+    return sorted(ports_by_hwid.values())
+
+
 def get_rsid_api() -> RSIDApiWrapper:
     settings = get_app_settings()
     if settings.auto_detect:
-        iterator = sorted(comports(include_links=True))
-        cam_port = ""
-        for _, (port, desc, hwid) in enumerate(iterator, 1):
-            if "2AAD" in hwid and "6373" in hwid:
-                logger.info(f"Found cam on {port} -- desc: {desc} -- hwid: {hwid}")
-                cam_port = port
         rsid_api = RSIDApiWrapper()
-        rsid_api.set_port(cam_port)
+        rsid_api.discover_devices()
         return rsid_api
     else:
         if settings.com_port is None:
             raise RuntimeError("Misconfigured: No com_port specified while auto-detect is disabled.")
-        cam_port = settings.com_port
+        cam_ports = [port.strip() for port in settings.com_port.split(",") if port.strip()]
         rsid_api = RSIDApiWrapper()
-        rsid_api.set_port(cam_port)
+        rsid_api.set_ports(cam_ports)
         return rsid_api
+
+
+def get_device_id(
+    api_wrapper: Annotated[RSIDApiWrapper, Depends(get_rsid_api)],
+    device_id: Annotated[
+        str | None,
+        Query(description="Device to run the operation on, as listed by `/v1/device/devices/`. "
+                          "Defaults to the first device, or the least busy one for host-mode operations."),
+    ] = None,
+) -> str | None:
+    if device_id is not None and not api_wrapper.has_device(device_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown device {device_id}")
+    return device_id
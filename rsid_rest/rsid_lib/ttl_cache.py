@@ -0,0 +1,96 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections.abc import Hashable
+from dataclasses import dataclass, replace
+from typing import Any, Generic, TypeVar
+
+from pydantic import BaseModel
+
+from .models import CacheStats
+
+T = TypeVar("T")
+
+
+def compute_etag(value: Any) -> str:
+    if isinstance(value, BaseModel):
+        payload = value.model_dump_json()
+    else:
+        payload = json.dumps(value, sort_keys=True, default=str)
+    return (
+        '"'
+        + hashlib.sha1(payload.encode(), usedforsecurity=False).hexdigest()[:20]
+        + '"'
+    )
+
+
+@dataclass(frozen=True)
+class CacheEntry(Generic[T]):
+    value: T
+    etag: str
+    last_modified: datetime.datetime
+    expires_at: float
+
+
+class TTLCache(Generic[T]):
+    """
+    Small thread-safe cache of device reads, keyed by device id.
+
+    Entries expire after `ttl` seconds (0 disables caching). `last_modified` only moves when a refreshed value
+    differs from the cached one, so clients can keep using conditional GETs across refreshes.
+    """
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._entries: dict[Hashable, CacheEntry[T]] = {}
+        self._lock = threading.Lock()
+        self.stats = CacheStats(ttl=ttl)
+
+    def get(self, key: Hashable) -> CacheEntry[T] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self.stats.hits += 1
+                return entry
+            self.stats.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: T) -> CacheEntry[T]:
+        etag = compute_etag(value)
+        with self._lock:
+            previous = self._entries.get(key)
+            last_modified = (
+                previous.last_modified
+                if previous is not None and previous.etag == etag
+                else datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+            )
+            entry = CacheEntry(
+                value=value,
+                etag=etag,
+                last_modified=last_modified,
+                expires_at=time.monotonic() + self._ttl,
+            )
+            if self._ttl > 0:
+                self._entries[key] = entry
+            return entry
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        # Expire instead of dropping, the next put() keeps `last_modified` if the value didn't actually change.
+        with self._lock:
+            keys = (
+                list(self._entries)
+                if key is None
+                else [key] if key in self._entries else []
+            )
+            for k in keys:
+                self._entries[k] = replace(self._entries[k], expires_at=0.0)
+            self.stats.invalidations += 1
+
+    def snapshot(self) -> CacheStats:
+        with self._lock:
+            return self.stats.model_copy(update={"entries": len(self._entries)})
@@ -0,0 +1,144 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import time
+from collections.abc import Callable
+from contextlib import suppress
+
+from loguru import logger
+
+from . import rsid_py
+from .host_db_base import HostDBBase
+from .models import UpdateQueueStats
+
+
+class FaceprintsUpdateQueue:
+    """
+    Write-behind queue for the adaptive faceprints updates of host mode authentication.
+
+    `put()` only records the update, a background task writes the pending updates with
+    `HostDBBase.update_many_faceprints` every `flush_interval` seconds, or as soon as `batch_size` updates are pending.
+    Updates of the same user are coalesced, only the latest is written. With `max_size` users pending, `put()`
+    returns False and the caller writes the update itself. `stop()` drains the queue.
+
+    When a batch fails (e.g. one of its users was deleted meanwhile), its updates are written one by one so that only
+    the failing ones are dropped.
+
+    Must be used from the event loop thread.
+    """
+
+    def __init__(
+        self,
+        db: HostDBBase,
+        max_size: int,
+        flush_interval: float,
+        batch_size: int,
+        on_flushed: Callable[[list[str]], None] | None = None,
+    ):
+        self._db = db
+        self._max_size = max_size
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._on_flushed = on_flushed
+        self._pending: dict[str, rsid_py.Faceprints] = {}
+        self._wake_up = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.stats = UpdateQueueStats(enabled=max_size > 0)
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+    def put(self, user_id: str, faceprints: rsid_py.Faceprints) -> bool:
+        if not self.enabled or (
+            user_id not in self._pending and len(self._pending) >= self._max_size
+        ):
+            self.stats.rejected += 1
+            return False
+        if user_id in self._pending:
+            self.stats.coalesced += 1
+            # Re-insert so the dict keeps users in the order of their latest update
+            del self._pending[user_id]
+        self._pending[user_id] = faceprints
+        self.stats.queued += 1
+        self.start()
+        if len(self._pending) >= self._batch_size:
+            self._wake_up.set()
+        return True
+
+    def discard(self, user_id: str) -> None:
+        # The user was deleted, don't write its pending update.
+        self._pending.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._pending.clear()
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._pending:
+                user_ids = list(self._pending)[: self._batch_size]
+                batch = {user_id: self._pending.pop(user_id) for user_id in user_ids}
+                start = time.perf_counter()
+                try:
+                    updated = await self._write(batch)
+                except asyncio.CancelledError:
+                    # Keep the batch for the final flush of stop(), unless a newer update arrived meanwhile
+                    for user_id, faceprints in batch.items():
+                        self._pending.setdefault(user_id, faceprints)
+                    raise
+                self.stats.flushes += 1
+                self.stats.written += len(updated)
+                self.stats.failed += len(batch) - len(updated)
+                self.stats.last_flush_ms = round(
+                    (time.perf_counter() - start) * 1000, 3
+                )
+                logger.debug(
+                    f"Wrote {len(updated)} faceprints update(s) in {self.stats.last_flush_ms:.1f}ms"
+                )
+                if self._on_flushed is not None:
+                    self._on_flushed(updated)
+
+    async def _write(self, batch: dict[str, rsid_py.Faceprints]) -> list[str]:
+        try:
+            return await self._db.update_many_faceprints(batch)
+        except Exception as e:
+            logger.warning(
+                f"Failed to write {len(batch)} faceprints update(s) at once, writing them one by one: {e}"
+            )
+        updated = []
+        for user_id, faceprints in batch.items():
+            try:
+                await self._db.update_faceprints(user_id, faceprints)
+            except Exception as e:
+                logger.error(
+                    f"Failed to write the faceprints update of user {user_id}: {e}"
+                )
+                continue
+            updated.append(user_id)
+        return updated
+
+    def snapshot(self) -> UpdateQueueStats:
+        return self.stats.model_copy(update={"pending": len(self._pending)})
+
+    async def _run(self) -> None:
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._wake_up.wait(), timeout=self._flush_interval
+                )
+            self._wake_up.clear()
+            await self.flush()
@@ -0,0 +1,66 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from loguru import logger
+
+from .models import ReadinessResponse, WarmUpStep
+
+
+class WarmUp:
+    """
+    Records the startup steps (their order, timing and errors) and whether the app is ready to serve.
+
+    A failing step is logged and recorded, the remaining steps still run. Running a step again replaces its record.
+    The app only reports ready once every step succeeded.
+    """
+
+    def __init__(self):
+        self._started_at = time.perf_counter()
+        self.status = ReadinessResponse()
+
+    @asynccontextmanager
+    async def step(self, name: str) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        error: str | None = None
+        try:
+            yield
+        except Exception as e:
+            logger.error(f"Warm-up step {name} failed: {e}")
+            error = str(e)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+        if error is None:
+            logger.info(f"Warm-up step {name} done in {elapsed_ms:.1f}ms")
+        previous = next((step for step in self.status.steps if step.name == name), None)
+        step = WarmUpStep(
+            name=name,
+            ok=error is None,
+            elapsed_ms=elapsed_ms,
+            error=error,
+            attempts=previous.attempts + 1 if previous is not None else 1,
+        )
+        if previous is None:
+            self.status.steps = [*self.status.steps, step]
+        else:
+            self.status.steps = [
+                step if s.name == name else s for s in self.status.steps
+            ]
+
+    def done(self, name: str) -> bool:
+        return any(step.name == name and step.ok for step in self.status.steps)
+
+    def finish(self) -> None:
+        self.status.startup_ms = round(
+            (time.perf_counter() - self._started_at) * 1000, 3
+        )
+        self.status.ready = all(step.ok for step in self.status.steps)
+        if self.status.ready:
+            logger.info(f"Warm-up done in {self.status.startup_ms:.1f}ms, ready")
+        else:
+            failed = [step.name for step in self.status.steps if not step.ok]
+            logger.warning(
+                f"Warm-up not ready after {self.status.startup_ms:.1f}ms. Failed steps: {failed}"
+            )
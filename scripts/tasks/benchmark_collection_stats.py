@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+from qdrant_client import models
+
+from scripts.tasks.benchmark_host_db import (
+    COLLECTION,
+    measure,
+    random_vectors,
+    report,
+    seeded_collection,
+)
+
+
+def benchmark_collection_stats(
+    users: int = 10000, iterations: int = 200, qdrant_url: str | None = None
+) -> None:
+    """
+    Host DB latency of the `auth_host` path with and without the `get_collection` call that used to log the point
+    count before every search, and of an adaptive update with and without the two calls around it.
+    """
+    asyncio.run(_benchmark_collection_stats(users, iterations, qdrant_url))
+
+
+async def _benchmark_collection_stats(
+    users: int, iterations: int, qdrant_url: str | None
+) -> None:
+    queries = random_vectors(iterations, seed=1)
+    async with seeded_collection(random_vectors(users), qdrant_url) as client:
+        records, _ = await client.scroll(
+            collection_name=COLLECTION, limit=iterations, with_payload=False
+        )
+        point_ids = [record.id for record in records]
+        print(
+            f'Seeded {users} users ({"server " + qdrant_url if qdrant_url else "embedded"})'
+        )
+
+        async def get_collection() -> None:
+            await client.get_collection(collection_name=COLLECTION)
+
+        async def search() -> None:
+            await client.search(
+                collection_name=COLLECTION,
+                search_params=models.SearchParams(hnsw_ef=128, exact=False),
+                query_vector=queries[np.random.randint(iterations)],
+                limit=10,
+                score_threshold=0.2,
+            )
+
+        async def update() -> None:
+            await client.set_payload(
+                collection_name=COLLECTION,
+                payload={"updated_at": "benchmark"},
+                points=[point_ids[np.random.randint(len(point_ids))]],
+                wait=True,
+            )
+
+        async def search_with_stats() -> None:
+            await get_collection()
+            await search()
+
+        async def update_with_stats() -> None:
+            await get_collection()
+            await update()
+            await get_collection()
+
+        report("get_collection", await measure(iterations, get_collection))
+        report(
+            "search + get_collection (before)",
+            await measure(iterations, search_with_stats),
+        )
+        report("search (after)", await measure(iterations, search))
+        report(
+            "update + 2 get_collection (before)",
+            await measure(iterations, update_with_stats),
+        )
+        report("update (after)", await measure(iterations, update))
+
+
+if __name__ == "__main__":
+    benchmark_collection_stats()
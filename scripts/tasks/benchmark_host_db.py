@@ -0,0 +1,184 @@
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, models
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+# Never the app's collection, the benchmarks drop it when done
+COLLECTION = f"rsid_benchmark_{uuid.uuid4().hex}"
+DIMENSIONS = 512
+
+
+def random_vectors(count: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(-1024, 1024, size=(count, DIMENSIONS)).astype(np.float32)
+
+
+async def seed_collection(
+    client: AsyncQdrantClient,
+    vectors: np.ndarray,
+    batch_size: int = 256,
+    quantization_config: models.QuantizationConfig | None = None,
+) -> None:
+    await client.create_collection(
+        collection_name=COLLECTION,
+        vectors_config=VectorParams(size=DIMENSIONS, distance=Distance.COSINE),
+        quantization_config=quantization_config,
+    )
+    for start in range(0, len(vectors), batch_size):
+        await client.upsert(
+            collection_name=COLLECTION,
+            wait=True,
+            points=[
+                PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=vector.tolist(),
+                    payload={"user_id": f"user_{start + i}"},
+                )
+                for i, vector in enumerate(vectors[start : start + batch_size])
+            ],
+        )
+
+
+@asynccontextmanager
+async def seeded_collection(
+    vectors: np.ndarray,
+    qdrant_url: str | None = None,
+    quantization_config: models.QuantizationConfig | None = None,
+) -> AsyncIterator[AsyncQdrantClient]:
+    """
+    Client of a new `COLLECTION` seeded with `vectors`, embedded in a temporary directory or on the `qdrant_url`
+    server. The collection is dropped and the directory removed on exit.
+    """
+    db_dir = Path(tempfile.mkdtemp(prefix="rsid_benchmark_"))
+    if qdrant_url:
+        client = AsyncQdrantClient(url=qdrant_url)
+    else:
+        client = AsyncQdrantClient(
+            path=str(db_dir), force_disable_check_same_thread=True
+        )
+    try:
+        await seed_collection(client, vectors, quantization_config=quantization_config)
+        yield client
+    finally:
+        if qdrant_url:
+            await client.delete_collection(collection_name=COLLECTION)
+        await client.close()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def report(name: str, samples: list[float]) -> None:
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[int(len(samples_ms) * 0.95) - 1]
+    print(
+        f"{name:<40} mean {statistics.fmean(samples_ms):8.2f}ms  p50 {statistics.median(samples_ms):8.2f}ms  "
+        f"p95 {p95:8.2f}ms"
+    )
+
+
+async def measure(iterations: int, fn: Callable[[], Awaitable[None]]) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def benchmark_host_db(
+    users: int = 1000, iterations: int = 100, qdrant_url: str | None = None
+) -> None:
+    """
+    Compare per-call latency of host DB operations when a Qdrant client is opened and closed on every call (the
+    previous `AsyncClosableDBSession` behaviour) against a single long-lived client.
+    """
+    asyncio.run(_benchmark_host_db(users, iterations, qdrant_url))
+
+
+async def _benchmark_host_db(
+    users: int, iterations: int, qdrant_url: str | None
+) -> None:
+    db_dir = Path(tempfile.mkdtemp(prefix="rsid_benchmark_"))
+
+    def new_client() -> AsyncQdrantClient:
+        if qdrant_url:
+            return AsyncQdrantClient(url=qdrant_url)
+        return AsyncQdrantClient(path=str(db_dir), force_disable_check_same_thread=True)
+
+    vectors = random_vectors(users)
+    queries = random_vectors(iterations, seed=1)
+    client = new_client()
+    await seed_collection(client, vectors)
+    await client.close()
+    print(
+        f'Seeded {users} users ({"server " + qdrant_url if qdrant_url else "local " + str(db_dir)})'
+    )
+
+    async def search(c: AsyncQdrantClient) -> None:
+        await c.search(
+            collection_name=COLLECTION,
+            search_params=models.SearchParams(hnsw_ef=128, exact=False),
+            query_vector=queries[np.random.randint(iterations)],
+            limit=10,
+            score_threshold=0.2,
+        )
+
+    async def find_user(c: AsyncQdrantClient) -> None:
+        await c.scroll(
+            collection_name=COLLECTION,
+            scroll_filter=models.Filter(
+                must=[
+                    models.FieldCondition(
+                        key="user_id",
+                        match=models.MatchValue(value=f"user_{users // 2}"),
+                    )
+                ]
+            ),
+            limit=2,
+        )
+
+    async def count(c: AsyncQdrantClient) -> None:
+        await c.get_collection(collection_name=COLLECTION)
+
+    try:
+        for name, op in (
+            ("search", search),
+            ("find user", find_user),
+            ("get_collection", count),
+        ):
+
+            async def per_call(op=op) -> None:
+                c = new_client()
+                try:
+                    await op(c)
+                finally:
+                    await c.close()
+
+            report(f"{name} (client per call)", await measure(iterations, per_call))
+
+            client = new_client()
+            try:
+                samples = await measure(
+                    iterations, lambda op=op, client=client: op(client)
+                )
+                report(f"{name} (persistent client)", samples)
+            finally:
+                await client.close()
+    finally:
+        if qdrant_url:
+            client = new_client()
+            await client.delete_collection(collection_name=COLLECTION)
+            await client.close()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    benchmark_host_db()
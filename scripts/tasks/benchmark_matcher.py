@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+
+from scripts.tasks.benchmark_host_db import DIMENSIONS, random_vectors, report
+
+
+def benchmark_matcher(
+    sizes: tuple[int, ...] = (1000, 10000, 50000, 100000), iterations: int = 50
+) -> None:
+    """
+    Host-side latency of one authentication against gallery size for the `device` path (one match call per record)
+    and the `vectorized` path (one matrix-vector product, then one match call for the best candidate).
+
+    The per-record loop stands in for `match_faceprints`: it only builds each candidate's descriptor and scores it,
+    so the real `device` path is slower by N times the SDK call overhead.
+    """
+    for size in sizes:
+        gallery = random_vectors(size)
+        queries = random_vectors(iterations, seed=1)
+        payloads = [
+            {"enroll_descriptor": row.astype(np.int16).tolist()} for row in gallery
+        ]
+        matrix = gallery / np.linalg.norm(gallery, axis=1, keepdims=True)
+        print(f"Gallery of {size} users")
+
+        loop_samples = []
+        loop_best = []
+        for query in queries[: max(1, iterations // 10)]:
+            start = time.perf_counter()
+            query_list = query.tolist()
+            best, best_score = None, -2.0
+            for payload in payloads:
+                candidate = np.asarray(
+                    payload["enroll_descriptor"][:DIMENSIONS], dtype=np.float32
+                )
+                score = float(
+                    np.dot(candidate, query_list)
+                    / (np.linalg.norm(candidate) * np.linalg.norm(query))
+                )
+                if score > best_score:
+                    best, best_score = payload, score
+            loop_samples.append(time.perf_counter() - start)
+            loop_best.append(best)
+        report("  device (per-record loop)", loop_samples)
+
+        vectorized_samples = []
+        vectorized_best = []
+        for query in queries:
+            start = time.perf_counter()
+            q = query / np.linalg.norm(query)
+            best_row = int(np.argmax(matrix @ q))
+            best = payloads[best_row]
+            vectorized_samples.append(time.perf_counter() - start)
+            vectorized_best.append(best)
+        report("  vectorized (matrix-vector product)", vectorized_samples)
+
+        # The loop only runs the first tenth of the queries
+        mismatches = sum(
+            a is not b for a, b in zip(loop_best, vectorized_best, strict=False)
+        )
+        if mismatches:
+            print(
+                f"  WARNING: the paths picked different candidates for {mismatches} of {len(loop_best)} queries"
+            )
+
+
+if __name__ == "__main__":
+    benchmark_matcher()
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import numpy as np
+from qdrant_client import models
+
+from scripts.tasks.benchmark_host_db import (
+    COLLECTION,
+    random_vectors,
+    report,
+    seeded_collection,
+)
+
+QUANTIZATION_CONFIGS: dict[str, models.QuantizationConfig | None] = {
+    "none": None,
+    "scalar": models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+        )
+    ),
+    "binary": models.BinaryQuantization(
+        binary=models.BinaryQuantizationConfig(always_ram=True)
+    ),
+}
+
+
+def benchmark_quantization(
+    users: int = 50000,
+    iterations: int = 200,
+    k: int = 10,
+    oversampling: float = 2.0,
+    noise: float = 0.3,
+    qdrant_url: str | None = None,
+) -> None:
+    """
+    Recall and latency of the hybrid-mode search (`k` candidates, HNSW) for each `qdrant_quantization` mode.
+
+    Queries are enrolled vectors with `noise` added, as a new capture of an enrolled user would be. Reported are the
+    recall@k against an exact search on the original vectors and how often the enrolled user is the first candidate.
+    Embedded Qdrant ignores quantization, pass `qdrant_url` to measure a server.
+    """
+    asyncio.run(
+        _benchmark_quantization(users, iterations, k, oversampling, noise, qdrant_url)
+    )
+
+
+async def _benchmark_quantization(
+    users: int,
+    iterations: int,
+    k: int,
+    oversampling: float,
+    noise: float,
+    qdrant_url: str | None,
+) -> None:
+    gallery = random_vectors(users)
+    rng = np.random.default_rng(1)
+    targets = rng.integers(0, users, size=iterations)
+    queries = gallery[targets] + rng.normal(
+        0, noise * gallery.std(), size=(iterations, gallery.shape[1])
+    )
+    normalized = gallery / np.linalg.norm(gallery, axis=1, keepdims=True)
+    ground_truth = [
+        set(np.argsort(normalized @ query)[::-1][:k].tolist()) for query in queries
+    ]
+    if not qdrant_url:
+        print(
+            "Embedded Qdrant ignores quantization, all modes search the original vectors"
+        )
+
+    for name, quantization_config in QUANTIZATION_CONFIGS.items():
+        async with seeded_collection(
+            gallery, qdrant_url, quantization_config=quantization_config
+        ) as client:
+            search_params = models.SearchParams(
+                hnsw_ef=128,
+                exact=False,
+                quantization=(
+                    models.QuantizationSearchParams(
+                        rescore=True, oversampling=oversampling
+                    )
+                    if quantization_config is not None
+                    else None
+                ),
+            )
+            samples = []
+            recall = 0.0
+            top1 = 0
+            for query, target, expected in zip(
+                queries, targets, ground_truth, strict=True
+            ):
+                start = time.perf_counter()
+                records = await client.search(
+                    collection_name=COLLECTION,
+                    search_params=search_params,
+                    query_vector=query.tolist(),
+                    limit=k,
+                    with_payload=["user_id"],
+                )
+                samples.append(time.perf_counter() - start)
+                # seed_collection names users after their row
+                rows = [
+                    int(record.payload["user_id"].removeprefix("user_"))
+                    for record in records
+                ]
+                recall += len(expected.intersection(rows)) / k
+                top1 += bool(rows) and rows[0] == target
+            report(
+                f"{name:<7} recall@{k} {recall / iterations:.3f}  top-1 {top1 / iterations:.3f}",
+                samples,
+            )
+
+
+if __name__ == "__main__":
+    benchmark_quantization()
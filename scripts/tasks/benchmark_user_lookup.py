@@ -0,0 +1,104 @@
+import asyncio
+import sys
+
+from qdrant_client import AsyncQdrantClient, models
+
+from scripts.tasks.benchmark_host_db import (
+    COLLECTION,
+    measure,
+    random_vectors,
+    report,
+    seeded_collection,
+)
+
+
+def benchmark_user_lookup(
+    sizes: tuple[int, ...] = (1000, 10000, 50000),
+    iterations: int = 100,
+    qdrant_url: str | None = None,
+) -> None:
+    """
+    Latency of finding the point of one user (the first step of `update_faceprints` and `delete_user`) against
+    gallery size: a filtered scroll on `user_id` without and with a keyword payload index (server only, embedded
+    Qdrant ignores payload indexes), and the in-memory point id followed by a point lookup.
+    """
+    asyncio.run(_benchmark_user_lookup(sizes, iterations, qdrant_url))
+
+
+async def _benchmark_user_lookup(
+    sizes: tuple[int, ...], iterations: int, qdrant_url: str | None
+) -> None:
+    for size in sizes:
+        async with seeded_collection(random_vectors(size), qdrant_url) as client:
+            records, _ = await client.scroll(
+                collection_name=COLLECTION,
+                limit=sys.maxsize,
+                with_payload=["user_id"],
+                with_vectors=False,
+            )
+            point_ids = {record.payload["user_id"]: record.id for record in records}
+            user_ids = [f"user_{i * size // iterations}" for i in range(iterations)]
+            print(f"Gallery of {size} users")
+
+            lookups = iter(user_ids * 3)
+            report(
+                "  filtered scroll",
+                await measure(
+                    iterations,
+                    lambda client=client, lookups=lookups: _scroll(
+                        client, next(lookups)
+                    ),
+                ),
+            )
+            if qdrant_url:
+                await client.create_payload_index(
+                    collection_name=COLLECTION,
+                    field_name="user_id",
+                    field_schema=models.PayloadSchemaType.KEYWORD,
+                    wait=True,
+                )
+                report(
+                    "  filtered scroll (payload index)",
+                    await measure(
+                        iterations,
+                        lambda client=client, lookups=lookups: _scroll(
+                            client, next(lookups)
+                        ),
+                    ),
+                )
+            report(
+                "  point id + retrieve",
+                await measure(
+                    iterations,
+                    lambda client=client, point_ids=point_ids, lookups=lookups: _retrieve(
+                        client, point_ids[next(lookups)]
+                    ),
+                ),
+            )
+
+
+async def _scroll(client: AsyncQdrantClient, user_id: str) -> None:
+    await client.scroll(
+        collection_name=COLLECTION,
+        scroll_filter=models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="user_id", match=models.MatchValue(value=user_id)
+                )
+            ]
+        ),
+        limit=2,
+    )
+
+
+async def _retrieve(client: AsyncQdrantClient, point_id) -> None:
+    await client.retrieve(
+        collection_name=COLLECTION,
+        ids=[point_id],
+        with_payload=["user_id"],
+        with_vectors=False,
+    )
+
+
+if __name__ == "__main__":
+    benchmark_user_lookup()
@@ -0,0 +1,24 @@
+import asyncio
+
+from rsid_rest.rsid_lib.host_db_memmap import HostDBMemmap
+
+
+def compact_gallery() -> None:
+    """
+    Drop the deleted and superseded records of the `memmap` gallery configured in `.env` (`db_gallery_dir`).
+    Run it while the server is stopped.
+    """
+    asyncio.run(_compact_gallery())
+
+
+async def _compact_gallery() -> None:
+    db = HostDBMemmap()
+    try:
+        live, dropped = await db.compact()
+    finally:
+        await db.close()
+    print(f"Kept {live} records, dropped {dropped} deleted records")
+
+
+if __name__ == "__main__":
+    compact_gallery()
@@ -0,0 +1,30 @@
+import asyncio
+
+from rsid_rest.rsid_lib.host_db_local_file import HostDBLocalFile
+
+
+def migrate_host_db() -> None:
+    """
+    Convert the Qdrant host DB configured in `.env` (`db_file` or `qdrant_url`) from descriptors stored as JSON integer
+    lists to packed int16 descriptors, in place, and report the payload size per identity before and after.
+    Run it while the server is stopped when using an embedded `db_file`.
+    """
+    asyncio.run(_migrate_host_db())
+
+
+async def _migrate_host_db() -> None:
+    db = HostDBLocalFile()
+    try:
+        points, migrated, bytes_before, bytes_after = await db.migrate_payloads()
+    finally:
+        await db.close()
+    print(f"Migrated {migrated} of {points} identities")
+    if points:
+        print(
+            f"Payload per identity: {bytes_before / points:.0f} bytes before, {bytes_after / points:.0f} bytes after "
+            f"({100 * (1 - bytes_after / bytes_before):.1f}% smaller)"
+        )
+
+
+if __name__ == "__main__":
+    migrate_host_db()
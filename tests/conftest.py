@@ -0,0 +1,45 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import importlib
+import os
+import sys
+import types
+from unittest.mock import MagicMock
+
+os.environ.setdefault("app_env", "test")
+
+
+class Faceprints:
+    """Plain stand-in for `rsid_py.Faceprints`, the tests only read and write its fields."""
+
+    def __init__(self):
+        self.flags = 0
+        self.version = 0
+        self.features_type = 0
+        self.adaptive_descriptor_nomask = []
+        self.adaptive_descriptor_withmask = []
+        self.enroll_descriptor = []
+
+
+class ExtractedFaceprintsElement:
+    def __init__(self):
+        self.flags = 0
+        self.version = 0
+        self.features_type = 0
+        self.features = []
+
+
+def _stub_rsid_py() -> types.ModuleType:
+    # The SDK bindings need the native library and a camera. Anything the tests don't define is a MagicMock.
+    module = types.ModuleType("rsid_py")
+    module.Faceprints = Faceprints
+    module.ExtractedFaceprintsElement = ExtractedFaceprintsElement
+    module.__getattr__ = lambda name: MagicMock(name=f"rsid_py.{name}")
+    return module
+
+
+try:
+    importlib.import_module("rsid_rest.rsid_lib.rsid_py")
+except ImportError:
+    sys.modules["rsid_rest.rsid_lib.rsid_py"] = _stub_rsid_py()
@@ -0,0 +1,117 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+
+import pytest
+
+from rsid_rest.rsid_lib.auth_coalescer import AuthCoalescer
+from rsid_rest.rsid_lib.gen.models import AuthenticateStatusEnum
+from rsid_rest.rsid_lib.models import AuthenticationResponse
+
+
+class Capture:
+    """A device capture that completes when the test says so."""
+
+    def __init__(self, user_id: str | None = "alice"):
+        self.user_id = user_id
+        self.calls = 0
+        self.done = asyncio.Event()
+
+    async def __call__(self) -> AuthenticationResponse:
+        self.calls += 1
+        await self.done.wait()
+        return AuthenticationResponse(
+            user_id=self.user_id, faces=[], status=AuthenticateStatusEnum.Success
+        )
+
+
+async def test_concurrent_requests_share_one_capture():
+    coalescer = AuthCoalescer(window=0)
+    capture = Capture()
+    requests = [asyncio.create_task(coalescer.run("device", capture)) for _ in range(5)]
+    await asyncio.sleep(0)
+
+    capture.done.set()
+    results = await asyncio.gather(*requests)
+    assert capture.calls == 1
+    assert [result.user_id for result in results] == ["alice"] * 5
+    assert coalescer.stats.captures == 1
+    assert coalescer.stats.joined == 4
+
+
+async def test_each_caller_gets_its_own_copy():
+    coalescer = AuthCoalescer(window=0)
+    capture = Capture()
+    first = asyncio.create_task(coalescer.run("device", capture))
+    second = asyncio.create_task(coalescer.run("device", capture))
+    capture.done.set()
+
+    first_result, second_result = await asyncio.gather(first, second)
+    first_result.user_id = None
+    assert second_result.user_id == "alice"
+
+
+async def test_keys_are_captured_separately():
+    coalescer = AuthCoalescer(window=0)
+    capture_a = Capture("alice")
+    capture_b = Capture("bob")
+    request_a = asyncio.create_task(coalescer.run("a", capture_a))
+    request_b = asyncio.create_task(coalescer.run("b", capture_b))
+    capture_a.done.set()
+    capture_b.done.set()
+
+    assert (await request_a).user_id == "alice"
+    assert (await request_b).user_id == "bob"
+    assert coalescer.stats.captures == 2
+
+
+async def test_result_is_reused_within_the_window():
+    coalescer = AuthCoalescer(window=60)
+    capture = Capture()
+    capture.done.set()
+
+    await coalescer.run("device", capture)
+    await coalescer.run("device", capture)
+    assert capture.calls == 1
+    assert coalescer.stats.window_hits == 1
+
+
+async def test_new_capture_after_the_window():
+    coalescer = AuthCoalescer(window=0)
+    capture = Capture()
+    capture.done.set()
+
+    await coalescer.run("device", capture)
+    await asyncio.sleep(0.001)
+    await coalescer.run("device", capture)
+    assert capture.calls == 2
+
+
+async def test_failed_capture_is_not_reused():
+    coalescer = AuthCoalescer(window=60)
+    calls = 0
+
+    async def failing_capture() -> AuthenticationResponse:
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("device error")
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await coalescer.run("device", failing_capture)
+    assert calls == 2
+
+
+async def test_cancelled_caller_does_not_cancel_the_capture():
+    coalescer = AuthCoalescer(window=0)
+    capture = Capture()
+    leaving = asyncio.create_task(coalescer.run("device", capture))
+    staying = asyncio.create_task(coalescer.run("device", capture))
+    await asyncio.sleep(0)
+    leaving.cancel()
+    await asyncio.sleep(0)
+
+    capture.done.set()
+    assert (await staying).user_id == "alice"
+    assert leaving.cancelled()
@@ -0,0 +1,62 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+
+from rsid_rest.rsid_lib import rsid_py
+from rsid_rest.rsid_lib.descriptor_codec import (
+    decode_payload,
+    encode_descriptors,
+    pack_descriptor,
+    pack_payload,
+    payload_size,
+    unpack_descriptor,
+)
+
+DESCRIPTOR_SIZE = 515
+
+
+def make_descriptor(seed: int) -> list[int]:
+    return (
+        np.random.default_rng(seed)
+        .integers(-32768, 32768, size=DESCRIPTOR_SIZE)
+        .tolist()
+    )
+
+
+def test_pack_round_trip_keeps_the_int16_range():
+    descriptor = make_descriptor(0) + [-32768, 32767, 0]
+    assert unpack_descriptor(pack_descriptor(descriptor)) == descriptor
+
+
+def test_unpack_passes_legacy_lists_through():
+    descriptor = make_descriptor(1)
+    assert unpack_descriptor(descriptor) is descriptor
+
+
+def test_encode_skips_the_empty_deprecated_descriptor():
+    faceprints = rsid_py.Faceprints()
+    faceprints.adaptive_descriptor_nomask = make_descriptor(2)
+    faceprints.adaptive_descriptor_withmask = [0] * DESCRIPTOR_SIZE
+    faceprints.enroll_descriptor = make_descriptor(3)
+    encoded = encode_descriptors(faceprints)
+    assert set(encoded) == {"adaptive_descriptor_nomask", "enroll_descriptor"}
+    assert decode_payload(encoded)["enroll_descriptor"] == faceprints.enroll_descriptor
+
+
+def test_pack_payload_migrates_legacy_payloads():
+    legacy = {
+        "user_id": "alice",
+        "version": 7,
+        "adaptive_descriptor_nomask": make_descriptor(4),
+        "adaptive_descriptor_withmask": [0] * DESCRIPTOR_SIZE,
+        "enroll_descriptor": make_descriptor(5),
+    }
+    packed = pack_payload(legacy)
+    assert "adaptive_descriptor_withmask" not in packed
+    assert payload_size(packed) < payload_size(legacy) / 2
+    decoded = decode_payload(packed)
+    assert decoded["user_id"] == "alice"
+    assert decoded["enroll_descriptor"] == legacy["enroll_descriptor"]
+    # Already packed payloads are left as they are
+    assert pack_payload(packed) == packed
@@ -0,0 +1,282 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import threading
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from rsid_rest.core.exception import device_busy_error_handler
+from rsid_rest.routers.v1.device import router as device_router
+from rsid_rest.routers.v1.users import router as users_router
+from rsid_rest.rsid_lib import device_session, rsid_py
+from rsid_rest.rsid_lib.device_arbiter import (
+    DeviceArbiter,
+    DeviceBusyError,
+    DevicePriority,
+)
+from rsid_rest.rsid_lib.device_pool import Device, DevicePool
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+
+
+class SimulatedAuthenticator:
+    """A camera whose enroll blocks until the test releases the user's face."""
+
+    def __init__(self, port: str):
+        self.port = port
+        self.enrolling = threading.Event()
+        self.release = threading.Event()
+        self.threads: set[str] = set()
+
+    def enroll(self, user_id: str, **callbacks) -> None:
+        self.threads.add(threading.current_thread().name)
+        self.enrolling.set()
+        assert self.release.wait(timeout=5), "enroll was never released"
+        callbacks["on_result"](rsid_py.EnrollStatus.Success, user_id)
+
+    def query_number_of_users(self) -> int:
+        return 0
+
+    def disconnect(self) -> None:
+        pass
+
+
+@pytest.fixture
+def authenticator(mocker) -> SimulatedAuthenticator:
+    authenticator = SimulatedAuthenticator("/dev/ttyACM0")
+    mocker.patch.object(
+        device_session.rsid_py, "FaceAuthenticator", lambda port: authenticator
+    )
+    return authenticator
+
+
+@pytest.fixture
+def device(authenticator):
+    device = Device("/dev/ttyACM0")
+    yield device
+    authenticator.release.set()
+    device.close()
+
+
+def enroll(device: Device, user_id: str) -> None:
+    # Device context
+    with device.session.acquire() as authenticator:
+        authenticator.enroll(user_id=user_id, on_result=lambda status, uid: None)
+
+
+async def wait_for(event: threading.Event) -> None:
+    assert await asyncio.to_thread(event.wait, 5)
+
+
+async def test_run_returns_result_from_owner_thread():
+    arbiter = DeviceArbiter(name="rsid-device-test")
+    try:
+        assert (
+            await arbiter.run(
+                DevicePriority.query, lambda: threading.current_thread().name
+            )
+            == "rsid-device-test"
+        )
+    finally:
+        arbiter.shutdown()
+
+
+async def test_run_propagates_exceptions():
+    def fail():
+        raise ValueError("device error")
+
+    arbiter = DeviceArbiter()
+    try:
+        with pytest.raises(ValueError, match="device error"):
+            await arbiter.run(DevicePriority.query, fail)
+        # The owner thread survives a failing operation
+        assert await arbiter.run(DevicePriority.query, lambda: 42) == 42
+    finally:
+        arbiter.shutdown()
+
+
+async def test_base_exception_fails_only_its_own_operation(monkeypatch):
+    class Abort(BaseException):
+        pass
+
+    def abort():
+        raise Abort("device call aborted")
+
+    uncaught: list[BaseException] = []
+    monkeypatch.setattr(
+        threading, "excepthook", lambda args: uncaught.append(args.exc_value)
+    )
+    arbiter = DeviceArbiter()
+    with pytest.raises(Abort):
+        await arbiter.run(DevicePriority.query, abort)
+    # The owner thread is still serving
+    assert await arbiter.run(DevicePriority.query, lambda: 42) == 42
+    arbiter.shutdown()
+    # And re-raises once the queue was drained
+    assert [type(e) for e in uncaught] == [Abort]
+
+
+async def test_event_loop_keeps_running_during_enroll(device, authenticator):
+    enroll_task = asyncio.create_task(
+        device.run(DevicePriority.enroll, enroll, device, "alice")
+    )
+    await wait_for(authenticator.enrolling)
+
+    ticks = 0
+    for _ in range(10):
+        await asyncio.sleep(0.001)
+        ticks += 1
+    assert ticks == 10
+    assert not enroll_task.done()
+    assert device.in_flight == 1
+
+    authenticator.release.set()
+    await enroll_task
+    assert authenticator.threads == {"rsid-device-ttyACM0"}
+    assert device.in_flight == 0
+
+
+async def test_unrelated_endpoints_keep_serving_during_enroll(
+    authenticator, monkeypatch
+):
+    monkeypatch.setattr(rsid_py, "EnrollStatus", MagicMock(), raising=False)
+    wrapper = object.__new__(RSIDApiWrapper)
+    wrapper._pool = DevicePool()
+    wrapper._pool.sync(["/dev/ttyACM0"])
+    app = FastAPI()
+    app.add_exception_handler(DeviceBusyError, device_busy_error_handler)
+    app.include_router(router=users_router, prefix="/v1")
+    app.include_router(router=device_router, prefix="/v1")
+    app.dependency_overrides[get_rsid_api] = lambda: wrapper
+
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            enroll_request = asyncio.create_task(
+                client.post("/v1/users/enroll/", params={"user_id": "alice"})
+            )
+            await wait_for(authenticator.enrolling)
+
+            for _ in range(5):
+                response = await asyncio.wait_for(
+                    client.get("/v1/device/devices/"), timeout=1
+                )
+                assert response.status_code == 200
+                assert response.json()["devices"][0]["in_flight"] == 1
+            assert not enroll_request.done()
+
+            authenticator.release.set()
+            response = await asyncio.wait_for(enroll_request, timeout=5)
+            assert response.status_code == 201
+            assert response.json()["user_id"] == "alice"
+    finally:
+        authenticator.release.set()
+        wrapper._pool.close()
+
+
+async def test_operations_on_the_same_device_wait_for_the_enroll(device, authenticator):
+    enroll_task = asyncio.create_task(
+        device.run(DevicePriority.enroll, enroll, device, "alice")
+    )
+    await wait_for(authenticator.enrolling)
+    query_task = asyncio.create_task(
+        device.run(DevicePriority.query, lambda: "queried")
+    )
+    await asyncio.sleep(0.05)
+    assert not query_task.done()
+
+    authenticator.release.set()
+    assert await query_task == "queried"
+    await enroll_task
+
+
+async def test_cancelled_waiter_is_skipped(device, authenticator):
+    enroll_task = asyncio.create_task(
+        device.run(DevicePriority.enroll, enroll, device, "alice")
+    )
+    await wait_for(authenticator.enrolling)
+    ran = threading.Event()
+    waiter = asyncio.create_task(device.run(DevicePriority.query, ran.set))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    # Let the cancellation reach the arbiter's queue before the device frees up
+    await asyncio.sleep(0.01)
+
+    authenticator.release.set()
+    await enroll_task
+    assert await device.run(DevicePriority.query, lambda: "next") == "next"
+    assert not ran.is_set()
+
+
+async def test_waiting_operations_are_served_by_priority(device, authenticator):
+    enroll_task = asyncio.create_task(
+        device.run(DevicePriority.enroll, enroll, device, "alice")
+    )
+    await wait_for(authenticator.enrolling)
+    served: list[str] = []
+    waiting = [
+        asyncio.create_task(device.run(priority, served.append, name))
+        for priority, name in [
+            (DevicePriority.firmware, "firmware"),
+            (DevicePriority.query, "query 1"),
+            (DevicePriority.enroll, "enroll"),
+            (DevicePriority.query, "query 2"),
+            (DevicePriority.auth, "auth"),
+        ]
+    ]
+    await asyncio.sleep(0.01)
+
+    authenticator.release.set()
+    await asyncio.gather(enroll_task, *waiting)
+    assert served == ["auth", "enroll", "query 1", "query 2", "firmware"]
+
+
+async def test_full_priority_class_is_rejected():
+    release = threading.Event()
+    arbiter = DeviceArbiter(max_depth={DevicePriority.query: 1})
+    try:
+        running = arbiter.submit(DevicePriority.query, release.wait, 5)
+        while arbiter.depth():
+            await asyncio.sleep(0.001)
+        queued = arbiter.submit(DevicePriority.query, lambda: "queued")
+        with pytest.raises(DeviceBusyError) as busy:
+            arbiter.submit(DevicePriority.query, lambda: "rejected")
+        assert busy.value.priority == DevicePriority.query
+        assert busy.value.retry_after >= 1
+        # Other classes have their own queue
+        auth = arbiter.submit(DevicePriority.auth, lambda: "auth")
+
+        release.set()
+        assert running.result(timeout=5)
+        assert queued.result(timeout=5) == "queued"
+        assert auth.result(timeout=5) == "auth"
+        stats = arbiter.snapshot()
+        assert stats["query"].rejected == 1
+        assert stats["query"].served == 2
+        assert stats["query"].depth == 0
+    finally:
+        release.set()
+        arbiter.shutdown()
+
+
+async def test_device_busy_error_is_answered_with_503():
+    app = FastAPI()
+    app.add_exception_handler(DeviceBusyError, device_busy_error_handler)
+
+    @app.get("/busy")
+    async def busy() -> dict:
+        raise DeviceBusyError(DevicePriority.enroll, retry_after=7)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.get("/busy")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert "enroll" in response.json()["errors"][0]
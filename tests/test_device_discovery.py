@@ -0,0 +1,52 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+
+from rsid_rest.rsid_lib.device_discovery import DeviceDiscovery
+
+
+def test_scan_results_are_cached_until_invalidated():
+    scans: list[list[str]] = [["COM5"], ["COM5", "COM6"]]
+    changes: list[list[str]] = []
+    discovery = DeviceDiscovery(
+        scan=lambda: scans.pop(0), interval=0, on_change=changes.append
+    )
+    assert discovery.ports() == ["COM5"]
+    assert discovery.ports() == ["COM5"]
+    discovery.invalidate()
+    assert discovery.ports() == ["COM5", "COM6"]
+    assert changes == [["COM5"], ["COM5", "COM6"]]
+    assert discovery.stats.scans == 2
+
+
+def test_an_overtaken_scan_is_not_applied():
+    scans = iter([["COM5"], ["COM6"], ["COM7"]])
+    applying = threading.Event()
+    release = threading.Event()
+    applied: list[list[str]] = []
+
+    def on_change(ports: list[str]) -> None:
+        if ports == ["COM5"]:
+            applying.set()
+            assert release.wait(timeout=5)
+        applied.append(ports)
+
+    discovery = DeviceDiscovery(
+        scan=lambda: next(scans), interval=0, on_change=on_change
+    )
+    first = threading.Thread(target=discovery.refresh)
+    first.start()
+    assert applying.wait(timeout=5)
+    # Newer scans while the first one is still being applied
+    later = [threading.Thread(target=discovery.refresh) for _ in range(2)]
+    for thread in later:
+        thread.start()
+        thread.join(timeout=0.05)
+    release.set()
+    for thread in [first, *later]:
+        thread.join(timeout=5)
+
+    assert applied[0] == ["COM5"]
+    assert applied[-1] == ["COM7"]
+    assert discovery.ports() == ["COM7"]
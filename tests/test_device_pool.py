@@ -0,0 +1,204 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import threading
+
+import pytest
+
+from rsid_rest.core.config import get_app_settings
+from rsid_rest.rsid_lib import rsid_api_wrapper
+from rsid_rest.rsid_lib.auth_coalescer import AuthCoalescer
+from rsid_rest.rsid_lib.device_arbiter import DevicePriority
+from rsid_rest.rsid_lib.device_pool import (
+    Device,
+    DevicePool,
+    close_devices,
+    device_id_from_port,
+)
+from rsid_rest.rsid_lib.gen.models import AuthenticateStatusEnum
+from rsid_rest.rsid_lib.models import AuthenticationResponse
+from rsid_rest.rsid_lib.rsid_api_wrapper import RSIDApiWrapper, get_rsid_api
+
+
+@pytest.fixture
+def pool():
+    pool = DevicePool()
+    yield pool
+    pool.close()
+
+
+def test_device_id_from_port():
+    assert device_id_from_port("/dev/ttyACM0") == "ttyACM0"
+    assert device_id_from_port("COM5") == "COM5"
+
+
+def test_sync_registers_and_removes_devices(pool):
+    pool.sync(["/dev/ttyACM0", "/dev/ttyACM1"])
+    assert [device.device_id for device in pool.devices()] == ["ttyACM0", "ttyACM1"]
+    first = pool.get("ttyACM0")
+
+    removed = pool.sync(["/dev/ttyACM0"])
+    assert [device.device_id for device in removed] == ["ttyACM1"]
+    removed[0].close()
+    assert "ttyACM1" not in pool
+    # Devices that are still present keep their session and queue
+    assert pool.get("ttyACM0") is first
+    assert pool.get() is first
+
+
+def test_get_unknown_device(pool):
+    with pytest.raises(RuntimeError):
+        pool.get()
+    pool.sync(["/dev/ttyACM0"])
+    with pytest.raises(KeyError):
+        pool.get("ttyACM1")
+
+
+def test_least_busy_prefers_fewer_operations_in_flight(pool):
+    pool.sync(["/dev/ttyACM0", "/dev/ttyACM1"])
+    busy = pool.get("ttyACM0")
+    busy._begin()
+    try:
+        assert pool.least_busy().device_id == "ttyACM1"
+    finally:
+        busy._end()
+
+
+@pytest.fixture
+def api_wrapper(pool, monkeypatch):
+    # Only the parts of the wrapper that route host mode authentication
+    api_wrapper = object.__new__(RSIDApiWrapper)
+    api_wrapper._pool = pool
+    api_wrapper._ports = []
+    api_wrapper._auth_coalescer = AuthCoalescer(window=0)
+    monkeypatch.setattr(get_app_settings(), "auth_coalescing", True)
+    api_wrapper.set_ports(["/dev/ttyACM0", "/dev/ttyACM1"])
+    return api_wrapper
+
+
+async def test_host_auth_joins_capture_in_flight_on_another_device(
+    api_wrapper, pool, monkeypatch
+):
+    done = asyncio.Event()
+    captured_on: list[str] = []
+
+    async def auth_host(device) -> AuthenticationResponse:
+        captured_on.append(device.device_id)
+        device._begin()
+        try:
+            await done.wait()
+        finally:
+            device._end()
+        return AuthenticationResponse(
+            user_id="alice", faces=[], status=AuthenticateStatusEnum.Success
+        )
+
+    monkeypatch.setattr(api_wrapper, "_auth_host", auth_host)
+    first = asyncio.create_task(api_wrapper.auth_host())
+    while not captured_on:
+        await asyncio.sleep(0)
+    # The first capture keeps its camera busy, the least busy one is now the other camera
+    assert pool.least_busy().device_id != captured_on[0]
+    second = asyncio.create_task(api_wrapper.auth_host())
+    await asyncio.sleep(0)
+
+    done.set()
+    assert [(await first).user_id, (await second).user_id] == ["alice", "alice"]
+    assert len(captured_on) == 1
+    assert api_wrapper._auth_coalescer.stats.joined == 1
+
+
+async def test_host_auth_on_a_given_device_is_not_rerouted(api_wrapper, monkeypatch):
+    captured_on: list[str] = []
+
+    async def auth_host(device) -> AuthenticationResponse:
+        captured_on.append(device.device_id)
+        return AuthenticationResponse(
+            user_id="alice", faces=[], status=AuthenticateStatusEnum.Success
+        )
+
+    monkeypatch.setattr(api_wrapper, "_auth_host", auth_host)
+    await api_wrapper.auth_host(device_id="ttyACM1")
+    assert captured_on == ["ttyACM1"]
+
+
+async def test_unplugged_device_is_closed_outside_the_wrapper_lock(api_wrapper, pool):
+    release = threading.Event()
+    enrolling = asyncio.create_task(
+        pool.get("ttyACM1").run(DevicePriority.enroll, release.wait, 5)
+    )
+    unplug = asyncio.create_task(
+        asyncio.to_thread(api_wrapper.set_ports, ["/dev/ttyACM0"])
+    )
+    while "ttyACM1" in pool:
+        await asyncio.sleep(0.001)
+
+    # Closing waits for the enroll, the lock taken by stream() on the event loop stays free meanwhile
+    assert RSIDApiWrapper._lock.acquire(timeout=1)
+    RSIDApiWrapper._lock.release()
+    assert not unplug.done()
+
+    release.set()
+    await unplug
+    assert await enrolling
+
+
+def test_preview_uses_the_port_of_one_device_of_a_multi_port_setting(pool, monkeypatch):
+    settings = get_app_settings()
+    monkeypatch.setattr(settings, "auto_detect", False)
+    monkeypatch.setattr(settings, "com_port", "COM5,COM6")
+    api_wrapper = object.__new__(RSIDApiWrapper)
+    api_wrapper._initialized = True
+    api_wrapper._pool = pool
+    api_wrapper._ports = []
+    monkeypatch.setattr(RSIDApiWrapper, "_instance", api_wrapper)
+    assert get_rsid_api() is api_wrapper
+
+    discovered: list[str] = []
+    monkeypatch.setattr(
+        rsid_api_wrapper.rsid_py,
+        "discover_device_type",
+        lambda port: discovered.append(port) or "F45x",
+        raising=False,
+    )
+    assert api_wrapper.preview_device_type() == "F45x"
+    api_wrapper.preview_device_type("COM6")
+    assert discovered == ["COM5", "COM6"]
+
+
+async def test_close_is_not_rejected_by_a_full_query_queue(monkeypatch):
+    monkeypatch.setattr(get_app_settings(), "device_queue_max_depth_query", 1)
+    device = Device("/dev/ttyACM0")
+    closed = threading.Event()
+    monkeypatch.setattr(device.session, "close", closed.set)
+    release = threading.Event()
+    enrolling = asyncio.create_task(device.run(DevicePriority.enroll, release.wait, 5))
+    while device.arbiter.depth():
+        await asyncio.sleep(0.001)
+    queued = asyncio.create_task(device.run(DevicePriority.query, lambda: "queued"))
+    await asyncio.sleep(0.01)
+
+    closing = asyncio.create_task(asyncio.to_thread(device.close))
+    await asyncio.sleep(0.01)
+    assert not closed.is_set()
+    release.set()
+    await closing
+    assert closed.is_set()
+    assert await enrolling
+    assert await queued == "queued"
+
+
+def test_every_removed_device_is_closed(pool, monkeypatch):
+    pool.sync(["/dev/ttyACM0", "/dev/ttyACM1"])
+    closed: list[str] = []
+
+    def fail() -> None:
+        raise RuntimeError("disconnect failed")
+
+    monkeypatch.setattr(pool.get("ttyACM0").session, "close", fail)
+    monkeypatch.setattr(
+        pool.get("ttyACM1").session, "close", lambda: closed.append("ttyACM1")
+    )
+    close_devices(pool.sync([]))
+    assert closed == ["ttyACM1"]
@@ -0,0 +1,73 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+
+from rsid_rest.rsid_lib.device_user_index import DeviceUserIndex
+
+
+def test_stale_until_loaded():
+    index = DeviceUserIndex(reconcile_interval=0)
+    assert index.stale
+    assert "alice" not in index
+    index.load(["alice", "bob"])
+    assert not index.stale
+    assert "alice" in index
+    assert index.entry().value == ["alice", "bob"]
+
+
+def test_add_and_discard_keep_enrollment_order():
+    index = DeviceUserIndex(reconcile_interval=0)
+    index.load(["alice", "bob"])
+    index.add("carol")
+    index.add("alice")
+    index.discard("bob")
+    assert index.entry().value == ["alice", "carol"]
+
+
+def test_changes_before_load_are_ignored():
+    index = DeviceUserIndex(reconcile_interval=0)
+    index.add("alice")
+    index.discard("bob")
+    assert index.stale
+    assert index.entry().value == []
+
+
+def test_invalidate_reports_drift_on_next_load():
+    index = DeviceUserIndex(reconcile_interval=0)
+    index.load(["alice", "bob"])
+    index.invalidate()
+    assert index.stale
+    assert "alice" in index
+
+    index.load(["alice", "carol"])
+    assert not index.stale
+    assert index.stats.drift == 2
+    assert index.stats.reconciliations == 1
+
+
+def test_reconcile_interval():
+    index = DeviceUserIndex(reconcile_interval=0.01)
+    index.load(["alice"])
+    assert not index.stale
+    time.sleep(0.02)
+    assert index.stale
+
+
+def test_etag_follows_the_user_list():
+    index = DeviceUserIndex(reconcile_interval=0)
+    index.load(["alice"])
+    before = index.entry()
+    index.load(["alice"])
+    assert index.entry().etag == before.etag
+    index.add("bob")
+    assert index.entry().etag != before.etag
+
+
+def test_clear():
+    index = DeviceUserIndex(reconcile_interval=0)
+    index.load(["alice"])
+    index.clear()
+    assert not index.stale
+    assert index.entry().value == []
+    assert index.snapshot().users == 0
@@ -0,0 +1,82 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+import pytest
+
+from rsid_rest.core.config import get_app_settings
+from rsid_rest.rsid_lib import rsid_py
+from rsid_rest.rsid_lib.faceprints_cache import FaceprintsCache
+from rsid_rest.rsid_lib.host_db_gallery_index import HostDBGalleryIndex
+from rsid_rest.rsid_lib.host_db_local_file import HostDBLocalFile
+from rsid_rest.rsid_lib.host_db_memmap import HostDBMemmap
+
+DESCRIPTOR_SIZE = 515
+
+
+def make_faceprints(seed: int) -> rsid_py.Faceprints:
+    descriptor = (
+        np.random.default_rng(seed).integers(-1024, 1024, size=DESCRIPTOR_SIZE).tolist()
+    )
+    faceprints = rsid_py.Faceprints()
+    faceprints.version = 7
+    faceprints.flags = 1
+    faceprints.features_type = 2
+    faceprints.adaptive_descriptor_nomask = descriptor
+    faceprints.adaptive_descriptor_withmask = [0] * DESCRIPTOR_SIZE
+    faceprints.enroll_descriptor = descriptor
+    return faceprints
+
+
+def make_query(faceprints: rsid_py.Faceprints) -> rsid_py.ExtractedFaceprintsElement:
+    extracted = rsid_py.ExtractedFaceprintsElement()
+    extracted.features = faceprints.enroll_descriptor
+    return extracted
+
+
+@pytest.fixture(params=["qdrant", "memmap", "gallery_index"])
+async def db(request, tmp_path, monkeypatch):
+    settings = get_app_settings()
+    monkeypatch.setattr(settings, "db_file", tmp_path / "vectors.db")
+    monkeypatch.setattr(settings, "qdrant_url", None)
+    monkeypatch.setattr(settings, "db_gallery_dir", tmp_path / "gallery")
+    if request.param == "qdrant":
+        db = HostDBLocalFile()
+    elif request.param == "memmap":
+        db = HostDBMemmap()
+    else:
+        db = HostDBGalleryIndex(HostDBMemmap())
+    await db.open()
+    await db.add_faceprints("user_0", make_faceprints(0))
+    yield db
+    await db.close()
+
+
+async def lookup(db, faceprints: rsid_py.Faceprints) -> dict:
+    (db_record,) = await db.get_nearest_faceprints(make_query(faceprints), limit=1)
+    return db_record
+
+
+async def test_in_flight_lookup_does_not_cache_replaced_faceprints(db):
+    cache = FaceprintsCache(capacity=16)
+    old_record = await lookup(db, make_faceprints(0))
+
+    # The update is written and flushed while the authentication still holds the old record
+    await db.update_faceprints("user_0", make_faceprints(1))
+    cache.invalidate("user_0")
+    assert (
+        cache.get(old_record).enroll_descriptor == make_faceprints(0).enroll_descriptor
+    )
+
+    new_record = await lookup(db, make_faceprints(1))
+    assert (
+        cache.get(new_record).enroll_descriptor == make_faceprints(1).enroll_descriptor
+    )
+    assert cache.snapshot().entries == 1
+
+
+async def test_unchanged_record_is_a_hit(db):
+    cache = FaceprintsCache(capacity=16)
+    first = cache.get(await lookup(db, make_faceprints(0)))
+    assert cache.get(await lookup(db, make_faceprints(0))) is first
+    assert cache.snapshot().hits == 1
@@ -0,0 +1,236 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from rsid_rest.rsid_lib import rsid_py
+from rsid_rest.rsid_lib.host_db_base import HostDBBase
+from rsid_rest.rsid_lib.host_db_gallery_index import (
+    HostDBGalleryIndex,
+    faceprints_payload,
+)
+
+DESCRIPTOR_SIZE = 515
+
+
+def make_faceprints(seed: int) -> rsid_py.Faceprints:
+    descriptor = (
+        np.random.default_rng(seed).integers(-1024, 1024, size=DESCRIPTOR_SIZE).tolist()
+    )
+    faceprints = rsid_py.Faceprints()
+    faceprints.version = 7
+    faceprints.flags = 1
+    faceprints.features_type = 2
+    faceprints.adaptive_descriptor_nomask = descriptor
+    faceprints.adaptive_descriptor_withmask = [0] * DESCRIPTOR_SIZE
+    faceprints.enroll_descriptor = descriptor
+    return faceprints
+
+
+def make_query(faceprints: rsid_py.Faceprints) -> rsid_py.ExtractedFaceprintsElement:
+    extracted = rsid_py.ExtractedFaceprintsElement()
+    extracted.features = faceprints.enroll_descriptor
+    return extracted
+
+
+class InMemoryHostDB(HostDBBase):
+    """The wrapped DB. `pause` holds updates after they were written, until the test lets them return."""
+
+    def __init__(self):
+        super().__init__()
+        self.payloads: dict[str, dict] = {}
+        self.pause: asyncio.Event | None = None
+
+    async def _wait(self) -> None:
+        if self.pause is not None:
+            await self.pause.wait()
+
+    async def add_faceprints(
+        self, user_id: str, faceprints: rsid_py.Faceprints
+    ) -> None:
+        self.payloads[user_id] = faceprints_payload(user_id, faceprints)
+
+    async def update_faceprints(
+        self, user_id: str, faceprints: rsid_py.Faceprints
+    ) -> None:
+        if user_id not in self.payloads:
+            raise RuntimeError(f"No records were found with this user_id {user_id}!")
+        self.payloads[user_id] = faceprints_payload(user_id, faceprints)
+        await self._wait()
+
+    async def update_many_faceprints(
+        self, updates: dict[str, rsid_py.Faceprints]
+    ) -> list[str]:
+        updated = [user_id for user_id in updates if user_id in self.payloads]
+        for user_id in updated:
+            self.payloads[user_id] = faceprints_payload(user_id, updates[user_id])
+        await self._wait()
+        return updated
+
+    async def get_user_ids(self) -> list[str]:
+        return list(self.payloads)
+
+    async def get_user_ids_page(self, limit, cursor=None, prefix=None):
+        raise NotImplementedError
+
+    async def get_all_faceprints(self) -> list:
+        return list(self.payloads.values())
+
+    async def get_faceprints(self, extracted_faceprints, limit=None) -> list:
+        raise NotImplementedError
+
+    async def get_nearest_faceprints(self, extracted_faceprints, limit) -> list:
+        raise NotImplementedError
+
+    async def delete_user(self, user_id: str) -> None:
+        del self.payloads[user_id]
+
+    async def delete_users(self, user_ids: list[str]) -> list[str]:
+        return [
+            user_id
+            for user_id in user_ids
+            if self.payloads.pop(user_id, None) is not None
+        ]
+
+    async def delete_all_users(self) -> None:
+        self.payloads.clear()
+
+
+@pytest.fixture
+async def index() -> HostDBGalleryIndex:
+    index = HostDBGalleryIndex(InMemoryHostDB())
+    await index.open()
+    for i in range(20):
+        await index.add_faceprints(f"user_{i}", make_faceprints(i))
+    return index
+
+
+async def test_nearest_is_the_enrolled_user(index):
+    for i in (0, 7, 19):
+        candidates = await index.get_nearest_faceprints(
+            make_query(make_faceprints(i)), limit=3
+        )
+        assert candidates[0]["user_id"] == f"user_{i}"
+        assert len(candidates) == 3
+
+
+async def test_delete_keeps_rows_contiguous(index):
+    await index.delete_user("user_3")
+    await index.delete_users(["user_0", "user_19", "missing"])
+    assert sorted(await index.get_user_ids()) == sorted(
+        f"user_{i}" for i in range(1, 19) if i != 3
+    )
+    for i in (1, 18):
+        candidates = await index.get_nearest_faceprints(
+            make_query(make_faceprints(i)), limit=1
+        )
+        assert candidates[0]["user_id"] == f"user_{i}"
+    candidates = await index.get_nearest_faceprints(
+        make_query(make_faceprints(3)), limit=20
+    )
+    assert "user_3" not in [candidate["user_id"] for candidate in candidates]
+
+
+async def test_update_replaces_the_row(index):
+    await index.update_faceprints("user_1", make_faceprints(100))
+    candidates = await index.get_nearest_faceprints(
+        make_query(make_faceprints(100)), limit=1
+    )
+    assert candidates[0]["user_id"] == "user_1"
+    assert len(await index.get_user_ids()) == 20
+
+
+async def test_update_of_a_user_deleted_meanwhile_does_not_bring_it_back(index):
+    index._db.pause = asyncio.Event()
+    update = asyncio.create_task(
+        index.update_faceprints("user_1", make_faceprints(100))
+    )
+    await asyncio.sleep(0)
+    # Written to the wrapped DB, deleted before the index applies the update
+    await index.delete_user("user_1")
+    index._db.pause.set()
+    await update
+    assert "user_1" not in await index.get_user_ids()
+
+
+async def test_batch_update_of_a_user_deleted_meanwhile_does_not_bring_it_back(index):
+    index._db.pause = asyncio.Event()
+    update = asyncio.create_task(
+        index.update_many_faceprints(
+            {"user_1": make_faceprints(100), "user_2": make_faceprints(200)}
+        )
+    )
+    await asyncio.sleep(0)
+    await index.delete_user("user_1")
+    index._db.pause.set()
+    assert await update == ["user_1", "user_2"]
+    assert "user_1" not in await index.get_user_ids()
+    assert len(await index.get_user_ids()) == 19
+    candidates = await index.get_nearest_faceprints(
+        make_query(make_faceprints(200)), limit=1
+    )
+    assert candidates[0]["user_id"] == "user_2"
+
+
+async def test_load_from_the_wrapped_db():
+    db = InMemoryHostDB()
+    for i in range(5):
+        await db.add_faceprints(f"user_{i}", make_faceprints(i))
+    index = HostDBGalleryIndex(db)
+    candidates = await index.get_nearest_faceprints(
+        make_query(make_faceprints(4)), limit=1
+    )
+    assert candidates[0]["user_id"] == "user_4"
+    assert index.snapshot().users == 5
+
+
+async def test_duplicate_user_is_deleted_with_all_its_rows(index, monkeypatch):
+    # Enrolled twice by an older version of the wrapped DB
+    duplicate = faceprints_payload("user_5", make_faceprints(100))
+    payloads = [*await index._db.get_all_faceprints(), duplicate]
+    monkeypatch.setattr(
+        index._db, "get_all_faceprints", lambda: asyncio.sleep(0, payloads)
+    )
+    await index.load()
+    assert index.snapshot().users == 20
+
+    await index.delete_user("user_5")
+    assert index.snapshot().users == 19
+    candidates = await index.get_nearest_faceprints(
+        make_query(make_faceprints(100)), limit=20
+    )
+    assert "user_5" not in [candidate["user_id"] for candidate in candidates]
+
+
+async def test_payloads_round_trip(index):
+    faceprints = make_faceprints(3)
+    candidate = (await index.get_nearest_faceprints(make_query(faceprints), limit=1))[0]
+    assert candidate["version"] == 7
+    assert candidate["flags"] == 1
+    assert candidate["features_type"] == 2
+    assert candidate["enroll_descriptor"] == faceprints.enroll_descriptor
+    assert (
+        candidate["adaptive_descriptor_nomask"] == faceprints.adaptive_descriptor_nomask
+    )
+    # All zeros, deprecated
+    assert "adaptive_descriptor_withmask" not in candidate
+
+
+async def test_grows_past_the_initial_capacity():
+    db = InMemoryHostDB()
+    index = HostDBGalleryIndex(db)
+    await index.open()
+    for i in range(1030):
+        await index.add_faceprints(f"user_{i}", make_faceprints(i))
+    assert index.snapshot().capacity == 2048
+    for i in (0, 1029):
+        candidates = await index.get_nearest_faceprints(
+            make_query(make_faceprints(i)), limit=1
+        )
+        assert candidates[0]["user_id"] == f"user_{i}"
+        assert (
+            candidates[0]["enroll_descriptor"] == make_faceprints(i).enroll_descriptor
+        )
@@ -0,0 +1,131 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import uuid
+
+import numpy as np
+import pytest
+from qdrant_client.http.models import PointStruct
+
+from rsid_rest.core.config import get_app_settings
+from rsid_rest.rsid_lib import rsid_py
+from rsid_rest.rsid_lib.descriptor_codec import encode_descriptors
+from rsid_rest.rsid_lib.host_db_local_file import HostDBLocalFile
+
+DESCRIPTOR_SIZE = 515
+
+
+def make_faceprints(seed: int) -> rsid_py.Faceprints:
+    descriptor = (
+        np.random.default_rng(seed).integers(-1024, 1024, size=DESCRIPTOR_SIZE).tolist()
+    )
+    faceprints = rsid_py.Faceprints()
+    faceprints.version = 7
+    faceprints.flags = 1
+    faceprints.features_type = 2
+    faceprints.adaptive_descriptor_nomask = descriptor
+    faceprints.adaptive_descriptor_withmask = [0] * DESCRIPTOR_SIZE
+    faceprints.enroll_descriptor = descriptor
+    return faceprints
+
+
+class ScrollCounter:
+    def __init__(self, scroll):
+        self.calls = 0
+        self._scroll = scroll
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return await self._scroll(*args, **kwargs)
+
+
+@pytest.fixture
+async def db(tmp_path, monkeypatch):
+    # Embedded Qdrant
+    monkeypatch.setattr(get_app_settings(), "db_file", tmp_path / "vectors.db")
+    monkeypatch.setattr(get_app_settings(), "qdrant_url", None)
+    db = HostDBLocalFile()
+    await db.open()
+    for i in range(5):
+        await db.add_faceprints(f"user_{i}", make_faceprints(i))
+    yield db
+    await db.close()
+
+
+@pytest.fixture
+def scrolls(db, monkeypatch) -> ScrollCounter:
+    counter = ScrollCounter(db._client.scroll)
+    monkeypatch.setattr(db._client, "scroll", counter)
+    return counter
+
+
+async def test_unknown_users_are_not_looked_up_in_embedded_mode(db, scrolls):
+    updates = {user_id: make_faceprints(100) for user_id in ["user_1", "a", "b", "c"]}
+    assert await db.update_many_faceprints(updates) == ["user_1"]
+    assert await db.delete_users(["user_2", "d", "e"]) == ["user_2"]
+    assert scrolls.calls == 0
+
+
+async def test_users_of_other_workers_are_looked_up_in_one_scroll(
+    db, scrolls, monkeypatch
+):
+    monkeypatch.setattr(get_app_settings(), "qdrant_url", "http://qdrant:6333")
+    # Enrolled by other workers of the shared server
+    for user_id in ["user_1", "user_2", "user_3"]:
+        del db._point_ids[user_id]
+    deleted = await db.delete_users(["user_0", "user_1", "user_2", "user_3", "a"])
+    assert deleted == ["user_0", "user_1", "user_2", "user_3"]
+    assert scrolls.calls == 1
+    assert sorted(await db.get_user_ids()) == ["user_4"]
+
+
+async def add_duplicate(db, user_id: str, faceprints: rsid_py.Faceprints) -> None:
+    # Older versions enrolled a user again as another point
+    await db._client.upsert(
+        collection_name=db.collections_name,
+        points=[
+            PointStruct(
+                id=str(uuid.uuid4()),
+                vector=faceprints.enroll_descriptor[:512],
+                payload={
+                    "user_id": user_id,
+                    "flags": faceprints.flags,
+                    "version": faceprints.version,
+                    "features_type": faceprints.features_type,
+                    **encode_descriptors(faceprints),
+                },
+            )
+        ],
+    )
+
+
+async def test_adding_an_existing_user_is_rejected(db):
+    with pytest.raises(RuntimeError):
+        await db.add_faceprints("user_1", make_faceprints(100))
+    assert db.stats.points == 5
+
+
+@pytest.mark.parametrize("qdrant_url", [None, "http://qdrant:6333"])
+async def test_delete_removes_every_duplicate(db, monkeypatch, qdrant_url):
+    await add_duplicate(db, "user_1", make_faceprints(100))
+    await add_duplicate(db, "user_2", make_faceprints(200))
+    await db.close()
+    await db.open()
+    monkeypatch.setattr(get_app_settings(), "qdrant_url", qdrant_url)
+
+    await db.delete_user("user_1")
+    assert await db.delete_users(["user_2"]) == ["user_2"]
+    assert sorted(await db.get_user_ids()) == ["user_0", "user_3", "user_4"]
+    assert db.stats.points == 3
+
+
+async def test_update_replaces_every_duplicate(db):
+    await add_duplicate(db, "user_1", make_faceprints(100))
+    await db.close()
+    await db.open()
+
+    await db.update_faceprints("user_1", make_faceprints(300))
+    payloads = await db.get_all_faceprints()
+    assert [p["enroll_descriptor"] for p in payloads if p["user_id"] == "user_1"] == [
+        make_faceprints(300).enroll_descriptor
+    ] * 2
@@ -0,0 +1,156 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+import pytest
+
+from rsid_rest.core.config import get_app_settings
+from rsid_rest.rsid_lib import rsid_py
+from rsid_rest.rsid_lib.host_db_memmap import HostDBMemmap
+
+DESCRIPTOR_SIZE = 515
+
+
+def make_faceprints(seed: int) -> rsid_py.Faceprints:
+    descriptor = (
+        np.random.default_rng(seed).integers(-1024, 1024, size=DESCRIPTOR_SIZE).tolist()
+    )
+    faceprints = rsid_py.Faceprints()
+    faceprints.version = 7
+    faceprints.flags = 1
+    faceprints.features_type = 2
+    faceprints.adaptive_descriptor_nomask = descriptor
+    faceprints.adaptive_descriptor_withmask = [0] * DESCRIPTOR_SIZE
+    faceprints.enroll_descriptor = descriptor
+    return faceprints
+
+
+def make_query(faceprints: rsid_py.Faceprints) -> rsid_py.ExtractedFaceprintsElement:
+    extracted = rsid_py.ExtractedFaceprintsElement()
+    extracted.features = faceprints.enroll_descriptor
+    return extracted
+
+
+@pytest.fixture
+async def gallery(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_app_settings(), "db_gallery_dir", tmp_path / "gallery")
+    db = HostDBMemmap()
+    await db.open()
+    for i in range(10):
+        await db.add_faceprints(f"user_{i}", make_faceprints(i))
+    yield db
+    await db.close()
+
+
+async def test_nearest_is_the_enrolled_user(gallery):
+    candidates = await gallery.get_nearest_faceprints(
+        make_query(make_faceprints(4)), limit=2
+    )
+    assert candidates[0]["user_id"] == "user_4"
+    assert candidates[0]["enroll_descriptor"] == make_faceprints(4).enroll_descriptor
+    assert len(candidates) == 2
+
+
+async def test_update_and_delete_tombstone_records(gallery):
+    await gallery.update_faceprints("user_1", make_faceprints(100))
+    await gallery.delete_user("user_2")
+    assert await gallery.delete_users(["user_3", "missing"]) == ["user_3"]
+
+    users = await gallery.get_user_ids()
+    assert sorted(users) == sorted(f"user_{i}" for i in range(10) if i not in (2, 3))
+    candidates = await gallery.get_nearest_faceprints(
+        make_query(make_faceprints(100)), limit=1
+    )
+    assert candidates[0]["user_id"] == "user_1"
+    with pytest.raises(RuntimeError):
+        await gallery.update_faceprints("user_2", make_faceprints(2))
+
+
+async def test_reopening_keeps_tombstones_until_compacted(gallery):
+    await gallery.delete_users([f"user_{i}" for i in range(8)])
+    await gallery.close()
+
+    reopened = HostDBMemmap()
+    await reopened.open()
+    # open() maps the files without compacting them
+    assert len(reopened._records) == 10
+    assert await reopened.get_user_ids() == ["user_8", "user_9"]
+
+    assert await reopened.compact() == (2, 8)
+    assert len(reopened._records) == 2
+    assert await reopened.get_user_ids() == ["user_8", "user_9"]
+    candidates = await reopened.get_nearest_faceprints(
+        make_query(make_faceprints(9)), limit=1
+    )
+    assert candidates[0]["user_id"] == "user_9"
+    assert await reopened.compact() == (2, 0)
+    await reopened.close()
+
+
+async def test_partial_record_is_repaired_on_open(gallery):
+    await gallery.close()
+    with open(gallery._descriptors_path, "ab") as f:
+        f.write(b"\x00" * 100)
+
+    reopened = HostDBMemmap()
+    await reopened.open()
+    assert len(await reopened.get_user_ids()) == 10
+    await reopened.add_faceprints("user_10", make_faceprints(10))
+    candidates = await reopened.get_nearest_faceprints(
+        make_query(make_faceprints(10)), limit=1
+    )
+    assert candidates[0]["user_id"] == "user_10"
+    await reopened.close()
+
+
+async def test_pages_in_row_order(gallery):
+    users, cursor = await gallery.get_user_ids_page(4)
+    assert users == ["user_0", "user_1", "user_2", "user_3"]
+    users, cursor = await gallery.get_user_ids_page(4, cursor=cursor)
+    assert users == ["user_4", "user_5", "user_6", "user_7"]
+    users, cursor = await gallery.get_user_ids_page(4, cursor=cursor)
+    assert users == ["user_8", "user_9"]
+    assert cursor is None
+
+
+async def test_delete_all_users(gallery):
+    await gallery.delete_all_users()
+    assert await gallery.get_user_ids() == []
+    await gallery.add_faceprints("user_0", make_faceprints(0))
+    assert await gallery.get_user_ids() == ["user_0"]
+
+
+async def test_delete_all_users_keeps_the_files_other_processes_map(gallery):
+    other = HostDBMemmap()
+    await other.open()
+    mapped = other._records
+    await gallery.delete_all_users()
+    # The other mapping still reads the old file instead of faulting on a truncated one.
+    assert mapped["user_id"][9] == b"user_9"
+
+    for i in range(10):
+        await gallery.add_faceprints(f"new_{i}", make_faceprints(i))
+    # Same sizes as before the delete, the other process remaps on the new file.
+    assert await other.get_user_ids() == [f"new_{i}" for i in range(10)]
+    await other.close()
+
+
+async def test_adding_an_existing_user_is_rejected(gallery):
+    with pytest.raises(RuntimeError):
+        await gallery.add_faceprints("user_1", make_faceprints(100))
+    assert len(gallery._records) == 10
+
+
+async def test_duplicate_user_is_deleted_with_all_its_records(gallery):
+    # An update interrupted before its tombstone leaves two records
+    gallery._append("user_1", make_faceprints(100))
+    gallery._append("user_2", make_faceprints(200))
+    await gallery.update_faceprints("user_2", make_faceprints(300))
+    await gallery.delete_user("user_1")
+
+    assert "user_1" not in await gallery.get_user_ids()
+    assert (await gallery.get_user_ids()).count("user_2") == 1
+    candidates = await gallery.get_nearest_faceprints(
+        make_query(make_faceprints(100)), limit=20
+    )
+    assert "user_1" not in [candidate["user_id"] for candidate in candidates]
@@ -0,0 +1,53 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import time
+
+from rsid_rest.rsid_lib.ttl_cache import TTLCache, compute_etag
+
+
+def test_get_returns_fresh_entries():
+    cache: TTLCache[dict] = TTLCache(ttl=60)
+    assert cache.get("dev") is None
+    entry = cache.put("dev", {"serial": "1"})
+    assert cache.get("dev") is entry
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_entries_expire():
+    cache: TTLCache[dict] = TTLCache(ttl=0.01)
+    cache.put("dev", {"serial": "1"})
+    time.sleep(0.02)
+    assert cache.get("dev") is None
+
+
+def test_zero_ttl_disables_caching():
+    cache: TTLCache[dict] = TTLCache(ttl=0)
+    entry = cache.put("dev", {"serial": "1"})
+    assert entry.etag == compute_etag({"serial": "1"})
+    assert cache.get("dev") is None
+    assert cache.snapshot().entries == 0
+
+
+def test_last_modified_only_moves_when_the_value_changes():
+    cache: TTLCache[dict] = TTLCache(ttl=60)
+    first = cache.put("dev", {"serial": "1"})
+    cache.invalidate("dev")
+    assert cache.get("dev") is None
+
+    unchanged = cache.put("dev", {"serial": "1"})
+    assert unchanged.etag == first.etag
+    assert unchanged.last_modified == first.last_modified
+
+    changed = cache.put("dev", {"serial": "2"})
+    assert changed.etag != first.etag
+
+
+def test_invalidate_all():
+    cache: TTLCache[dict] = TTLCache(ttl=60)
+    cache.put("a", {})
+    cache.put("b", {})
+    cache.invalidate()
+    assert cache.get("a") is None
+    assert cache.get("b") is None
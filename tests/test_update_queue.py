@@ -0,0 +1,128 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+
+from rsid_rest.rsid_lib.host_db_base import HostDBBase
+from rsid_rest.rsid_lib.update_queue import FaceprintsUpdateQueue
+
+
+class RecordingHostDB(HostDBBase):
+    """Records the written updates. Like Qdrant, a batch containing a missing user fails as a whole."""
+
+    def __init__(self, user_ids: list[str]):
+        super().__init__()
+        self.user_ids = set(user_ids)
+        self.batches: list[list[str]] = []
+        self.written: dict[str, object] = {}
+
+    async def update_faceprints(self, user_id, faceprints) -> None:
+        if user_id not in self.user_ids:
+            raise RuntimeError(f"No records were found with this user_id {user_id}!")
+        self.written[user_id] = faceprints
+
+    async def update_many_faceprints(self, updates) -> list[str]:
+        self.batches.append(list(updates))
+        missing = [user_id for user_id in updates if user_id not in self.user_ids]
+        if missing:
+            raise RuntimeError(f"No point with id {missing[0]} found")
+        self.written.update(updates)
+        return list(updates)
+
+    async def add_faceprints(self, user_id, faceprints) -> None:
+        raise NotImplementedError
+
+    async def get_user_ids(self) -> list[str]:
+        raise NotImplementedError
+
+    async def get_user_ids_page(self, limit, cursor=None, prefix=None):
+        raise NotImplementedError
+
+    async def get_all_faceprints(self) -> list:
+        raise NotImplementedError
+
+    async def get_faceprints(self, extracted_faceprints, limit=None) -> list:
+        raise NotImplementedError
+
+    async def get_nearest_faceprints(self, extracted_faceprints, limit) -> list:
+        raise NotImplementedError
+
+    async def delete_user(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    async def delete_users(self, user_ids: list[str]) -> list[str]:
+        raise NotImplementedError
+
+    async def delete_all_users(self) -> None:
+        raise NotImplementedError
+
+
+def make_queue(db: HostDBBase, **kwargs) -> FaceprintsUpdateQueue:
+    options = {"max_size": 16, "flush_interval": 60, "batch_size": 4, **kwargs}
+    return FaceprintsUpdateQueue(db, **options)
+
+
+async def test_updates_of_a_user_are_coalesced():
+    db = RecordingHostDB(["alice", "bob"])
+    queue = make_queue(db)
+    assert queue.put("alice", 1)
+    assert queue.put("bob", 2)
+    assert queue.put("alice", 3)
+    await queue.stop()
+    assert db.batches == [["bob", "alice"]]
+    assert db.written == {"alice": 3, "bob": 2}
+    assert queue.stats.coalesced == 1
+    assert queue.stats.written == 2
+
+
+async def test_full_queue_rejects_new_users():
+    queue = make_queue(RecordingHostDB(["alice", "bob"]), max_size=1)
+    assert queue.put("alice", 1)
+    assert not queue.put("bob", 2)
+    # A pending user can still be updated
+    assert queue.put("alice", 3)
+    assert queue.stats.rejected == 1
+    await queue.stop()
+
+
+async def test_disabled_queue_rejects_everything():
+    queue = make_queue(RecordingHostDB(["alice"]), max_size=0)
+    assert not queue.enabled
+    assert not queue.put("alice", 1)
+
+
+async def test_full_batch_is_written_right_away():
+    db = RecordingHostDB([f"user_{i}" for i in range(4)])
+    flushed: list[str] = []
+    queue = make_queue(db, on_flushed=flushed.extend)
+    for i in range(4):
+        queue.put(f"user_{i}", i)
+    while not flushed:
+        await asyncio.sleep(0.01)
+    assert flushed == [f"user_{i}" for i in range(4)]
+    await queue.stop()
+
+
+async def test_user_deleted_meanwhile_only_drops_its_own_update():
+    db = RecordingHostDB(["alice", "carol"])
+    flushed: list[str] = []
+    queue = make_queue(db, on_flushed=flushed.extend)
+    queue.put("alice", 1)
+    queue.put("bob", 2)
+    queue.put("carol", 3)
+    await queue.flush()
+    assert db.written == {"alice": 1, "carol": 3}
+    assert flushed == ["alice", "carol"]
+    assert queue.stats.written == 2
+    assert queue.stats.failed == 1
+
+
+async def test_discarded_updates_are_not_written():
+    db = RecordingHostDB(["alice", "bob"])
+    queue = make_queue(db)
+    queue.put("alice", 1)
+    queue.put("bob", 2)
+    queue.discard("bob")
+    await queue.flush()
+    assert db.written == {"alice": 1}
+    assert queue.snapshot().pending == 0
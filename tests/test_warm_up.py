@@ -0,0 +1,37 @@
+# Copyright (C) 2018-2024 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+from rsid_rest.rsid_lib.warm_up import WarmUp
+
+
+async def test_ready_once_every_step_succeeded():
+    warm_up = WarmUp()
+    async with warm_up.step("device_discovery"):
+        pass
+    async with warm_up.step("device_sessions"):
+        raise RuntimeError("No RealSenseID device found")
+    warm_up.finish()
+    assert not warm_up.status.ready
+    assert warm_up.done("device_discovery")
+    assert not warm_up.done("device_sessions")
+    assert warm_up.status.steps[1].error == "No RealSenseID device found"
+
+
+async def test_retried_step_replaces_its_record():
+    warm_up = WarmUp()
+    async with warm_up.step("device_discovery"):
+        pass
+    async with warm_up.step("device_sessions"):
+        raise RuntimeError("No RealSenseID device found")
+    warm_up.finish()
+
+    async with warm_up.step("device_sessions"):
+        pass
+    warm_up.finish()
+    assert warm_up.status.ready
+    assert [step.name for step in warm_up.status.steps] == [
+        "device_discovery",
+        "device_sessions",
+    ]
+    assert warm_up.status.steps[1].attempts == 2
+    assert warm_up.status.steps[1].error is None